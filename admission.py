@@ -0,0 +1,123 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when the waiting queue is full.
+
+    :param retry_after: Seconds after which the client should retry.
+    :type retry_after: int
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many puzzles, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits how many puzzles a node coordinates at once.
+
+    Requests over the limit wait in a bounded queue, ordered by client priority (highest first),
+    then by estimated difficulty (fewest empty cells first), then by arrival.
+    Requests that don't fit in the queue are rejected right away, with a retry estimate
+    based on the average time puzzles take.
+
+    :param max_in_flight: Maximum number of puzzles being solved at once.
+    :type max_in_flight: int
+    :param max_queue: Maximum number of puzzles waiting to be solved.
+    :type max_queue: int
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 32):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        # Heap of waiting requests: [(-priority, difficulty, arrival)]
+        self.waiting: list[tuple[int, int, int]] = []
+        self.arrivals = itertools.count()
+        self.condition = threading.Condition()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.service_time: Optional[float] = None  # Moving average, in seconds
+        self.queue_time: Optional[float] = None
+
+    @contextmanager
+    def admit(self, priority: int = 0, difficulty: int = 0):
+        """Hold a slot while solving a puzzle, waiting for one if needed."""
+        self.acquire(priority, difficulty)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def acquire(self, priority: int = 0, difficulty: int = 0):
+        with self.condition:
+            if self.in_flight < self.max_in_flight and not self.waiting:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+
+            if len(self.waiting) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(self.retry_after())
+
+            entry = (-priority, difficulty, next(self.arrivals))
+            heapq.heappush(self.waiting, entry)
+            start = time.perf_counter()
+            while self.in_flight >= self.max_in_flight or self.waiting[0] != entry:
+                self.condition.wait()
+
+            heapq.heappop(self.waiting)
+            self.in_flight += 1
+            self.admitted += 1
+            self.queue_time = self._average(
+                self.queue_time, time.perf_counter() - start
+            )
+            # The next request in the queue may fit as well
+            self.condition.notify_all()
+
+    def release(self, elapsed: float):
+        with self.condition:
+            self.in_flight -= 1
+            self.service_time = self._average(self.service_time, elapsed)
+            self.condition.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every admitted and waiting puzzle to finish, returning False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.in_flight == 0 and not self.waiting, timeout
+            )
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained enough to take another request."""
+        per_puzzle = self.service_time or 1.0
+        return max(
+            1, math.ceil(per_puzzle * (len(self.waiting) + 1) / self.max_in_flight)
+        )
+
+    @staticmethod
+    def _average(current: Optional[float], sample: float) -> float:
+        return sample if current is None else 0.8 * current + 0.2 * sample
+
+    def stats(self) -> dict[str, Any]:
+        with self.condition:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self.waiting),
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "service_time": self.service_time and round(self.service_time, 6),
+                "queue_time": self.queue_time and round(self.queue_time, 6),
+            }
@@ -0,0 +1,35 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class Clock:
+    """
+    Time, sleeps, threads and condition waits, as used by the nodes' logic.
+
+    Nodes use the real ones; the simulator swaps in a virtual clock,
+    so the same logic runs against simulated time.
+    """
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def spawn(self, target: Callable, *args):
+        """Run a function on a new thread."""
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    def wait_for(
+        self,
+        condition: threading.Condition,
+        predicate: Callable[[], bool],
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """Wait on a condition until the predicate holds, returning False on timeout."""
+        with condition:
+            return condition.wait_for(predicate, timeout)
@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import Iterator, Optional
+
+from consts import Engine
+from node import Node
+
+
+class ClusterNotReady(Exception):
+    """Raised when nodes don't join the network in time."""
+
+
+class Cluster:
+    """
+    Runs several nodes in this process, on free ports picked by the OS, for tests and benchmarks.
+
+    Nodes are started in order, each one once its parent is ready,
+    so every node knows about all the ones started before it.
+
+    :param size: Number of nodes.
+    :type size: int
+    :param parents: Parent index of each node (None for the first one),
+        or "star" (all join node 0) or "chain" (each joins the previous one).
+    :type parents: list[Optional[int]] | str
+    :param handicaps: Handicap of each node, in milliseconds.
+    :type handicaps: Optional[list[int]]
+    :param engine: Default solver engine of the nodes.
+    :type engine: Engine
+    :param options: Other Node arguments (e.g. fanout, memo_size, max_in_flight).
+    """
+
+    def __init__(
+        self,
+        size: int = 3,
+        parents: list[Optional[int]] | str = "star",
+        handicaps: Optional[list[int]] = None,
+        engine: Engine = Engine.RANDOM,
+        **options,
+    ):
+        if parents == "star":
+            parents = [None] + [0] * (size - 1)
+        elif parents == "chain":
+            parents = [None] + list(range(size - 1))
+        if len(parents) != size or parents[0] is not None:
+            raise ValueError("parents must have one entry per node, None first")
+
+        self.parents = parents
+        self.handicaps = handicaps or [0] * size
+        self.engine = engine
+        self.options = options
+        self.nodes: list[Node] = []
+        self.threads: list[threading.Thread] = []
+
+    def start(self, timeout: float = 10) -> "Cluster":
+        deadline = time.monotonic() + timeout
+        for i, parent in enumerate(self.parents):
+            address = (
+                f"127.0.0.1:{self.nodes[parent].p2p_port}"
+                if parent is not None
+                else None
+            )
+            node = Node(0, 0, address, self.handicaps[i], self.engine, **self.options)
+            thread = threading.Thread(target=node.run, daemon=True)
+            thread.start()
+            self.nodes.append(node)
+            self.threads.append(thread)
+
+            if not node.p2p.ready.wait(max(0.0, deadline - time.monotonic())):
+                self.kill()
+                raise ClusterNotReady(f"Node {i} wasn't ready in {timeout}s")
+
+        # A node is ready once it connected to the others, but they may not have handled its join yet
+        for i, node in enumerate(self.nodes):
+            remaining = max(0.0, deadline - time.monotonic())
+            if not node.p2p.wait_for_neighbors(len(self.nodes) - 1, remaining):
+                self.kill()
+                raise ClusterNotReady(f"Node {i} didn't see every node in {timeout}s")
+        return self
+
+    def url(self, i: int, path: str = "") -> str:
+        return f"http://127.0.0.1:{self.nodes[i].http_port}{path}"
+
+    def stop(self, i: Optional[int] = None, timeout: float = 10) -> bool:
+        """Stop a node, or all of them, cleanly."""
+        nodes = self.nodes if i is None else [self.nodes[i]]
+        drained = all([node.stop(timeout) for node in nodes])
+        self._join(nodes, timeout)
+        return drained
+
+    def kill(self, i: Optional[int] = None):
+        """Kill a node, or all of them, without waiting for their work."""
+        nodes = self.nodes if i is None else [self.nodes[i]]
+        for node in nodes:
+            node.kill()
+        self._join(nodes, 5)
+
+    def _join(self, nodes: list[Node], timeout: float):
+        for node in nodes:
+            self.threads[self.nodes.index(node)].join(timeout)
+
+    def __getitem__(self, i: int) -> Node:
+        return self.nodes[i]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __iter__(self) -> Iterator[Node]:
+        return iter(self.nodes)
+
+    def __enter__(self) -> "Cluster":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.kill()
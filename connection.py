@@ -0,0 +1,198 @@
+import socket
+import threading
+from collections import deque
+
+from protocol import HEADER_SIZE
+
+# Most systems accept at least this many buffers in a single sendmsg call
+MAX_BUFFERS = 64
+
+
+class SendQueueFull(Exception):
+    """Raised when a neighbor's outbound queue can't take another frame."""
+
+
+class SendQueue:
+    """
+    Bounded outbound queue of encoded frames for a single neighbor.
+
+    Any thread may put frames in it, but only the selector thread drains it,
+    when the socket is writable, so a frame is never interleaved with another
+    and a slow neighbor never blocks the thread that is sending.
+    Queued frames are coalesced into a single ``sendmsg`` call.
+
+    :param max_bytes: Hard limit of queued bytes, after which ``put`` raises SendQueueFull.
+    :type max_bytes: int
+    :param high_water: Queued bytes above which the neighbor is considered congested.
+    :type high_water: int
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, high_water: int = 256 * 1024):
+        self.max_bytes = max_bytes
+        self.high_water = high_water
+        self.frames: deque[memoryview] = deque()
+        self.droppable: dict[str, int] = {}  # Pending droppable frames, by kind
+        self.kinds: deque[str | None] = deque()
+        self.size = 0
+        self.partial = False  # Whether the first frame was partially sent
+        self.started_on = None  # Transport the partially sent frame must be finished on
+        self.lock = threading.Lock()
+
+    def put(self, frame: bytes, kind: str | None = None) -> bool:
+        """
+        Queue a frame, returning False if it was coalesced away.
+
+        Frames with a ``kind`` (e.g. keep-alives) are droppable: if one of the
+        same kind is still waiting, the new one is redundant and isn't queued.
+        """
+        with self.lock:
+            if kind is not None and self.droppable.get(kind, 0) > 0:
+                return False
+            if self.size + len(frame) > self.max_bytes:
+                raise SendQueueFull(f"{self.size} bytes already queued")
+            self.frames.append(memoryview(frame))
+            self.kinds.append(kind)
+            if kind is not None:
+                self.droppable[kind] = self.droppable.get(kind, 0) + 1
+            self.size += len(frame)
+            return True
+
+    def flush(self, sock: socket.socket) -> bool:
+        """
+        Send queued frames with a single ``sendmsg`` call, returning True if the queue is now empty.
+
+        It must only be called when the socket is writable: one call then never blocks,
+        and a partially sent frame is resumed on the next call, which must be through the same socket
+        (``started_on``). Anything with the socket's ``sendmsg`` (e.g. a shared-memory link) can take its place,
+        but only on a frame boundary.
+        """
+        with self.lock:
+            if not self.frames:
+                return True
+
+            buffers = [
+                self.frames[i] for i in range(min(len(self.frames), MAX_BUFFERS))
+            ]
+            try:
+                sent = sock.sendmsg(buffers)
+            except (BlockingIOError, socket.timeout):
+                return False
+            self.size -= sent
+
+            while sent > 0:
+                frame = self.frames[0]
+                if sent < len(frame):
+                    self.frames[0] = frame[sent:]
+                    self.partial = True
+                    self.started_on = sock
+                    break
+                sent -= len(frame)
+                self.frames.popleft()
+                self.partial = False
+                self.started_on = None
+                kind = self.kinds.popleft()
+                if kind is not None:
+                    self.droppable[kind] -= 1
+
+            return not self.frames
+
+    @property
+    def pending(self) -> bool:
+        return self.size > 0
+
+    @property
+    def congested(self) -> bool:
+        return self.size > self.high_water
+
+
+class BufferPool:
+    """
+    Receive buffers of a fixed size, given back when a connection closes and reused by the next one.
+
+    :param size: Bytes of each buffer. Frames larger than it get a buffer of their own.
+    :type size: int
+    :param max_free: Buffers kept for reuse, beyond which given back ones are dropped.
+    :type max_free: int
+    """
+
+    def __init__(self, size: int = 64 * 1024, max_free: int = 64):
+        self.size = size
+        self.max_free = max_free
+        self.free: list[bytearray] = []
+        self.created = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def get(self) -> bytearray:
+        with self.lock:
+            if self.free:
+                self.reused += 1
+                return self.free.pop()
+            self.created += 1
+        return bytearray(self.size)
+
+    def put(self, buffer: bytearray):
+        if len(buffer) != self.size:
+            return  # Grown for a large frame
+        with self.lock:
+            if len(self.free) < self.max_free:
+                self.free.append(buffer)
+
+
+class RecvBuffer:
+    """
+    Inbound bytes of a single neighbor, received with ``recv_into`` straight into a pooled buffer.
+
+    Only the selector thread uses it. Each readable event receives what the socket has,
+    and every frame completed by it is decoded from a memoryview of the buffer,
+    so no bytes object is allocated per frame. Bytes of a partial frame stay in the buffer
+    until the rest arrives, and are moved to its front only once the buffer's end is reached.
+
+    :param pool: Pool to take the buffer from, and give it back to when closed.
+    :type pool: BufferPool
+    """
+
+    def __init__(self, pool: BufferPool):
+        self.pool = pool
+        self.buffer = pool.get()
+        self.start = 0  # First byte not decoded yet
+        self.end = 0  # Byte after the last one received
+
+    def fill(self, sock: socket.socket) -> int:
+        """Receive what the socket has, returning how many bytes, 0 once the neighbor closed it."""
+        if self.end == len(self.buffer):
+            self._compact()
+        with memoryview(self.buffer)[self.end :] as view:
+            received = sock.recv_into(view)
+        self.end += received
+        return received
+
+    def pending(self) -> memoryview:
+        """Bytes received but not decoded yet. The view must be released before the next ``fill``."""
+        return memoryview(self.buffer)[self.start : self.end]
+
+    def consume(self, size: int):
+        """Mark bytes at the start of ``pending`` as decoded."""
+        self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+            if len(self.buffer) != self.pool.size:
+                self.buffer = self.pool.get()  # Done with a large frame's own buffer
+
+    def _compact(self):
+        """Move the partial frame to the front of the buffer, or to a larger one if it doesn't fit."""
+        pending = self.end - self.start
+        size = len(self.buffer)
+        if pending >= HEADER_SIZE:
+            header = self.buffer[self.start : self.start + HEADER_SIZE]
+            size = max(size, HEADER_SIZE + int.from_bytes(header, "big"))
+        target = self.buffer if size <= len(self.buffer) else bytearray(size)
+        target[:pending] = self.buffer[self.start : self.end]
+        if target is not self.buffer:
+            self.pool.put(self.buffer)
+        self.buffer, self.start, self.end = target, 0, pending
+
+    def close(self):
+        self.pool.put(self.buffer)
+        self.buffer = bytearray()
+        self.start = self.end = 0
@@ -1,4 +1,4 @@
-from enum import IntEnum
+from enum import IntEnum, StrEnum
 
 
 class Command(IntEnum):
@@ -12,9 +12,40 @@ class Command(IntEnum):
     WORK_ACK = 8  # Ok, I'll do that
     WORK_COMPLETE = 9  # When a node finishes its job
     SUDOKU_SOLVED = 10  # When a node solves a sudoku
+    SOLVE_REQUEST = 11  # Race a strategy on a whole sudoku (portfolio mode)
+    SOLVE_RESULT = 12  # Here's what my strategy found
+    SOLVE_CANCEL = 13  # Someone else won the race, stop
+    RELAY = 14  # Broadcast relayed along the spanning tree
+    DOORBELL = 15  # New frames are waiting in the shared-memory ring
+    WORK_OFFER = 16  # I have spare capacity, and this many jobs waiting
+    WORK_STEAL = 17  # I'm idle, give me some of your waiting jobs
+    WORK_BATCH = 18  # Give several jobs to a node at once
+    WORK_BATCH_ACK = 19  # Ok, I'll do all of them
+    WORK_BATCH_COMPLETE = 20  # When a node finishes a batch
+    WORK_RETURN = 21  # I couldn't finish these jobs, give them to someone
 
 
 class JobStatus(IntEnum):
     PENDING = 1
     IN_PROGRESS = 2
     COMPLETED = 3
+
+
+class Engine(StrEnum):
+    RANDOM = "random"  # Fill squares cell by cell with random valid digits
+    DLX = "dlx"  # Solve the grid by exact cover (Dancing Links), then take the square
+    PORTFOLIO = "portfolio"  # Race several strategies on the whole grid, keep the first
+
+
+class Route(StrEnum):
+    LOCAL = "local"  # Solve the whole grid on the coordinator, in-process
+    SQUARES = "squares"  # One job per square, spread over the nodes
+    SUBTREES = (
+        "subtrees"  # Split the search on a cell's candidates, one branch per node
+    )
+
+
+class Strategy(StrEnum):
+    MRV = "mrv"  # Bitmask backtracking, most constrained cell first
+    RESTARTS = "restarts"  # Randomized backtracking with growing restart budgets
+    DLX = "dlx"  # Exact cover with Dancing Links
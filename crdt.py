@@ -0,0 +1,48 @@
+import threading
+
+from custom_types import Address, counter_type
+
+
+class GCounter:
+    """
+    Grow-only counter, replicated across the nodes (a state-based CRDT).
+
+    Each node only increments its own entry, and replicas are merged by taking
+    the maximum of each entry, so merging is idempotent and order-independent:
+    every node converges to the same totals, however often and in whatever order
+    states are exchanged. The total is kept up to date on every change, so reading it is O(1).
+    """
+
+    def __init__(self):
+        self.counts: counter_type = {}
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def increment(self, node: Address, amount: int = 1):
+        with self.lock:
+            self.counts[node] = self.counts.get(node, 0) + amount
+            self.total += amount
+
+    def merge(self, counts: counter_type) -> bool:
+        """Merge the state of another replica, returning True if anything changed."""
+        changed = False
+        with self.lock:
+            for node, count in counts.items():
+                current = self.counts.get(node, 0)
+                if count > current:
+                    self.counts[node] = count
+                    self.total += count - current
+                    changed = True
+        return changed
+
+    def get(self, node: Address) -> int:
+        return self.counts.get(node, 0)
+
+    @property
+    def value(self) -> int:
+        return self.total
+
+    def state(self) -> counter_type:
+        """Copy of the entries, to be sent to other nodes."""
+        with self.lock:
+            return dict(self.counts)
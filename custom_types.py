@@ -8,3 +8,5 @@ row_type = list[int]
 sudoku_type = list[row_type]
 
 jobs_structure = list[tuple[JobStatus, Optional[Address]]]
+
+counter_type = dict[Address, int]
@@ -0,0 +1,107 @@
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from typing import Any
+
+MAX_PROFILE_SECONDS = 60
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+    )
+
+
+def profile(seconds: float, interval: float = 0.005) -> str:
+    """
+    Sample the stacks of every other thread (selector, HTTP, job threads...) for some seconds.
+
+    Returns collapsed stacks, one "thread;outer;...;inner count" line per distinct stack,
+    which flamegraph tools read as is.
+    Sampling doesn't slow the node down the way a deterministic profiler would.
+    """
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+    me = threading.get_ident()
+    stacks = Counter()
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+            name = names.get(ident, str(ident)).replace(" ", "_")
+            stacks[";".join([name, *reversed(frames)])] += 1
+        time.sleep(interval)
+
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def thread_dumps() -> dict[str, list[str]]:
+    """Current stack of every thread, by thread name."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    return {
+        f"{names.get(ident, 'unknown')} ({ident})": traceback.format_stack(frame)
+        for ident, frame in sys._current_frames().items()
+    }
+
+
+def deep_size(obj: Any, seen: set[int] = None) -> int:
+    """Approximate size of an object and everything it holds, in bytes."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    elif hasattr(type(obj), "__slots__"):
+        size += sum(
+            deep_size(getattr(obj, name), seen)
+            for name in type(obj).__slots__
+            if hasattr(obj, name)
+        )
+    return size
+
+
+def memory(p2p_server, top: int = 20) -> dict[str, Any]:
+    """
+    Top allocation sites, as traced since the node started,
+    and the size of the node's largest structures.
+    """
+    structures = p2p_server.memory_usage()
+
+    if not tracemalloc.is_tracing():
+        return {"tracing": False, "structures": structures}
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "current": current,
+        "peak": peak,
+        "top": [
+            {
+                "where": str(stat.traceback[0]),
+                "bytes": stat.size,
+                "blocks": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:top]
+        ],
+        "structures": structures,
+    }
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from custom_types import Address
+
+
+class SpanningTree:
+    """
+    Relays cluster-wide broadcasts along a spanning tree with bounded fan-out.
+
+    The members, sorted, are rotated so that the broadcast's origin comes first,
+    and the node at position ``p`` relays to positions ``p * fanout + 1`` to ``p * fanout + fanout``.
+    Every node computes the same tree from the member list carried by the message,
+    so each node sends at most ``fanout`` copies, and the origin's cost stays flat as the cluster grows.
+    Message ids that were already seen are dropped, in case views of the cluster disagree.
+
+    :param fanout: Maximum number of children per node, or None to send to everyone directly.
+    :type fanout: Optional[int]
+    :param max_seen: Number of message ids remembered for duplicate suppression.
+    :type max_seen: int
+    """
+
+    def __init__(self, fanout: Optional[int] = 3, max_seen: int = 10000):
+        self.fanout = fanout
+        self.max_seen = max_seen
+        self.seen: OrderedDict[str, None] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def first_time(self, msg_id: str) -> bool:
+        """Record a message id, returning False if it was already seen."""
+        with self.lock:
+            if msg_id in self.seen:
+                return False
+            self.seen[msg_id] = None
+            if len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+            return True
+
+    def targets(
+        self,
+        members: list[Address],
+        origin: Address,
+        me: Address,
+        reachable: Callable[[Address], bool],
+    ) -> list[Address]:
+        """
+        Nodes this node must relay a broadcast to.
+        If a child is unreachable (e.g. it has just died), its own children are adopted instead.
+        """
+        start = members.index(origin)
+        order = members[start:] + members[:start]
+        if me not in order:
+            return []
+
+        if self.fanout is None or self.fanout < 1:
+            return (
+                [m for m in order if m != me and reachable(m)] if me == origin else []
+            )
+
+        def children(position: int) -> list[Address]:
+            found = []
+            first = position * self.fanout + 1
+            for child in range(first, min(first + self.fanout, len(order))):
+                if reachable(order[child]):
+                    found.append(order[child])
+                else:
+                    found.extend(children(child))
+            return found
+
+        return children(order.index(me))
@@ -0,0 +1,193 @@
+from math import isqrt
+from typing import Optional
+
+from custom_types import sudoku_type
+
+
+class DLXSolver:
+    """
+    Exact cover solver for Sudoku, using Knuth's Dancing Links (Algorithm X).
+
+    Each candidate (row, column, digit) of an empty cell is a row of the cover matrix,
+    and each constraint (cell filled, digit in row, digit in column, digit in square)
+    not yet satisfied by the clues is a column.
+    The links are kept in flat lists, indexed by node, instead of node objects.
+
+    :param grid: Sudoku grid, with 0 for empty cells. It is not modified.
+    :type grid: sudoku_type
+    """
+
+    def __init__(self, grid: sudoku_type):
+        self.size = size = len(grid)
+        self.box = box = isqrt(size)
+        self.grid = [row[:] for row in grid]
+        self.solution: Optional[sudoku_type] = None
+        self.valid = True
+
+        rows, cols, boxes = [0] * size, [0] * size, [0] * size
+        for i in range(size):
+            for j in range(size):
+                if (value := grid[i][j]) != 0:
+                    bit = 1 << (value - 1)
+                    b = (i // box) * box + j // box
+                    if (rows[i] | cols[j] | boxes[b]) & bit:
+                        self.valid = False
+                    rows[i] |= bit
+                    cols[j] |= bit
+                    boxes[b] |= bit
+
+        # Node 0 is the root, nodes 1..4*size^2 are column headers
+        columns = 4 * size * size
+        self.L = list(range(-1, columns))
+        self.R = list(range(1, columns + 2))
+        self.U = list(range(columns + 1))
+        self.D = list(range(columns + 1))
+        self.C = list(range(columns + 1))
+        self.S = [0] * (columns + 1)
+        self.candidate: list[Optional[tuple[int, int, int]]] = [None] * (columns + 1)
+        self.L[0], self.R[columns] = columns, 0
+
+        # Unlink the columns already satisfied by the clues
+        def unlink(c: int):
+            self.R[self.L[c]] = self.R[c]
+            self.L[self.R[c]] = self.L[c]
+
+        area = size * size
+        for i in range(size):
+            for j in range(size):
+                if grid[i][j] != 0:
+                    unlink(1 + i * size + j)
+            for v in range(size):
+                if rows[i] >> v & 1:
+                    unlink(1 + area + i * size + v)
+                if cols[i] >> v & 1:
+                    unlink(1 + 2 * area + i * size + v)
+                if boxes[i] >> v & 1:
+                    unlink(1 + 3 * area + i * size + v)
+
+        for i in range(size):
+            for j in range(size):
+                if grid[i][j] != 0:
+                    continue
+                b = (i // box) * box + j // box
+                used = rows[i] | cols[j] | boxes[b]
+                for v in range(size):
+                    if not used >> v & 1:
+                        self._add_row(
+                            (i, j, v + 1),
+                            (
+                                1 + i * size + j,
+                                1 + area + i * size + v,
+                                1 + 2 * area + j * size + v,
+                                1 + 3 * area + b * size + v,
+                            ),
+                        )
+
+    def _add_row(self, candidate: tuple[int, int, int], columns: tuple[int, ...]):
+        first = len(self.C)
+        for k, c in enumerate(columns):
+            node = first + k
+            self.L.append(first + (k - 1) % len(columns))
+            self.R.append(first + (k + 1) % len(columns))
+            self.U.append(self.U[c])
+            self.D.append(c)
+            self.C.append(c)
+            self.candidate.append(candidate)
+            self.D[self.U[c]] = node
+            self.U[c] = node
+            self.S[c] += 1
+
+    def _cover(self, c: int):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def _uncover(self, c: int):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def _search(self, chosen: list[int], limit: int) -> int:
+        R, D, C, S = self.R, self.D, self.C, self.S
+
+        if R[0] == 0:
+            if self.solution is None:
+                self.solution = [row[:] for row in self.grid]
+                for node in chosen:
+                    i, j, v = self.candidate[node]
+                    self.solution[i][j] = v
+            return 1
+
+        # Pick the column with fewest remaining rows
+        c, best = 0, None
+        k = R[0]
+        while k != 0:
+            if best is None or S[k] < best:
+                c, best = k, S[k]
+                if best <= 1:
+                    break
+            k = R[k]
+        if best == 0:
+            return 0
+
+        self._cover(c)
+        found = 0
+        r = D[c]
+        while r != c and found < limit:
+            chosen.append(r)
+            j = R[r]
+            while j != r:
+                self._cover(C[j])
+                j = R[j]
+
+            found += self._search(chosen, limit - found)
+
+            j = self.L[r]
+            while j != r:
+                self._uncover(C[j])
+                j = self.L[j]
+            chosen.pop()
+            r = D[r]
+        self._uncover(c)
+
+        return found
+
+    def solve(self) -> Optional[sudoku_type]:
+        """Return a solved copy of the grid, or None if it has no solution."""
+        if self.solution is None and self.valid:
+            self._search([], 1)
+        return self.solution
+
+    def count_solutions(self, limit: int = 2) -> int:
+        """Count solutions, stopping as soon as ``limit`` of them are found."""
+        if not self.valid:
+            return 0
+        return self._search([], limit)
+
+
+def solve(grid: sudoku_type) -> Optional[sudoku_type]:
+    """Solve the grid without modifying it."""
+    return DLXSolver(grid).solve()
+
+
+def count_solutions(grid: sudoku_type, limit: int = 2) -> int:
+    """Count the grid's solutions, up to ``limit``."""
+    return DLXSolver(grid).count_solutions(limit)
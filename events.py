@@ -0,0 +1,178 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Any, Optional
+
+# Level of each event type, events not listed here are logged at INFO
+EVENT_LEVELS: dict[str, int] = {
+    "message.received": logging.DEBUG,
+    "message.sent": logging.DEBUG,
+    "work.dispatched": logging.DEBUG,
+    "work.started": logging.DEBUG,
+    "work.finished": logging.DEBUG,
+    "work.completed": logging.DEBUG,
+    "work.cancelled": logging.DEBUG,
+    "square.updated": logging.DEBUG,
+    "cell.updated": logging.DEBUG,
+    "cell.stuck": logging.DEBUG,
+    "http.request": logging.DEBUG,
+    "http.access": logging.DEBUG,
+    "node.connect_retry": logging.WARNING,
+    "node.connect_failed": logging.ERROR,
+    "node.disconnected": logging.WARNING,
+    "node.dead": logging.WARNING,
+    "node.slow": logging.ERROR,
+    "node.send_failed": logging.ERROR,
+    "message.bad_format": logging.ERROR,
+    "message.unsupported": logging.WARNING,
+    "work.fallback": logging.WARNING,
+    "work.stuck": logging.WARNING,
+    "race.invalid_solution": logging.WARNING,
+    "race.entry_died": logging.WARNING,
+    "race.timed_out": logging.WARNING,
+    "http.rejected": logging.WARNING,
+}
+
+# Fraction of each event type that is logged, events not listed here are all logged
+EVENT_SAMPLING: dict[str, float] = {
+    "message.received": 0.1,
+    "cell.updated": 0.01,
+    "cell.stuck": 0.01,
+}
+
+_counters: dict[str, itertools.count] = {}
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class EventLogger:
+    """
+    Logs structured events: a name (e.g. "work.finished") and some fields.
+
+    The level of an event and its sampling rate are checked before anything is built,
+    and fields whose value is callable are only evaluated if the event is logged,
+    so expensive values (e.g. a whole grid) cost nothing otherwise.
+    Records are formatted by the logging listener thread, not by the caller.
+
+    :param name: Logger name.
+    :type name: str
+    """
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(name)
+
+    def event(self, event: str, **fields: Any):
+        level = EVENT_LEVELS.get(event, logging.INFO)
+        if not self.logger.isEnabledFor(level):
+            return
+
+        rate = EVENT_SAMPLING.get(event)
+        if rate is not None:
+            if rate <= 0:
+                return
+            # Keep one of every 1/rate events, which is cheaper than drawing random numbers
+            counter = _counters.setdefault(event, itertools.count())
+            if next(counter) % round(1 / rate) != 0:
+                return
+
+        for key, value in fields.items():
+            if callable(value):
+                fields[key] = value()
+        self.logger.log(level, event, extra={"event": event, "fields": fields})
+
+
+class EventFormatter(logging.Formatter):
+    """
+    Formats records as compact JSON lines, or as "event key=value" text.
+    Records not logged through an EventLogger keep their message.
+    """
+
+    def __init__(self, json_lines: bool = True):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        event = getattr(record, "event", None)
+
+        if not self.json_lines:
+            if event is not None:
+                record.msg = " ".join(
+                    [event, *(f"{key}={value}" for key, value in fields.items())]
+                )
+                record.args = ()
+            return super().format(record)
+
+        line = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+        }
+        if event is not None:
+            line["event"] = event
+            line.update(fields)
+        else:
+            line["msg"] = record.getMessage()
+        if record.exc_info:
+            line["exc"] = self.formatException(record.exc_info)
+        return json.dumps(line, separators=(",", ":"), default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Puts records in the queue as they are, leaving all formatting to the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_overrides(values: list[str], convert) -> dict[str, Any]:
+    """Parse "event=value" command line arguments."""
+    overrides = {}
+    for value in values:
+        event, _, setting = value.partition("=")
+        overrides[event] = convert(setting)
+    return overrides
+
+
+def setup_logging(
+    level: int | str = logging.INFO,
+    json_lines: bool = True,
+    levels: Optional[dict[str, int | str]] = None,
+    sampling: Optional[dict[str, float]] = None,
+    stream=None,
+):
+    """
+    Send all log records through a queue to a listener thread, which formats and writes them.
+    Only the first call installs the handlers. It replaces the root logger's, so only entry points
+    (e.g. node.py) call it: processes that embed nodes, like tests, keep their own logging config.
+    """
+    global _listener
+
+    for event, event_level in (levels or {}).items():
+        EVENT_LEVELS[event] = (
+            logging.getLevelName(event_level.upper())
+            if isinstance(event_level, str)
+            else event_level
+        )
+    EVENT_SAMPLING.update(sampling or {})
+
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(EventFormatter(json_lines))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_DeferredQueueHandler(records))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,15 +1,26 @@
+import argparse
+import json
+import multiprocessing
 import random
 import sys
+from typing import IO, Iterator, Optional
+
+from custom_types import sudoku_type
+from solver import BitmaskSolver, solve
 from sudoku import Sudoku
 
+# Target fraction of filled cells for each difficulty level (40, 32, 27 and 24 clues on a 9x9 grid)
+DIFFICULTY_FILL = {"easy": 0.5, "medium": 0.4, "hard": 0.33, "expert": 0.3}
+
 
 def solve_sudoku(board):
     """Solve the Sudoku puzzle using backtracking - this is NOT a distributed solution."""
 
     row, col = None, None
+    size = len(board)
 
-    for i in range(9):
-        for j in range(9):
+    for i in range(size):
+        for j in range(size):
             if board[i][j] == 0:
                 row, col = (i, j)
                 break
@@ -17,7 +28,7 @@ def solve_sudoku(board):
     if row is None or col is None:
         return True  # No empty spaces left, puzzle is solved
 
-    for num in range(1, 10):
+    for num in range(1, size + 1):
         sudoku = Sudoku(board, base_delay=0.01, interval=20, threshold=10)
         if sudoku.check_is_valid(row, col, num):
             board[row][col] = num
@@ -28,39 +39,167 @@ def solve_sudoku(board):
     return False
 
 
-def generate_sudoku(empty_boxes=0):
+def generate_sudoku(empty_boxes=0, box=3):
     """Generate a Sudoku puzzle."""
-    board = [[0] * 9 for _ in range(9)]
-
-    # Fill the diagonal 3x3 squares randomly (these don't interfere with each other)
-    for n in range(0, 9, 3):
-        nums = random.sample(range(1, 10), 9)
-        for i in range(3):
-            for j in range(3):
+    size = box * box
+    board = [[0] * size for _ in range(size)]
+
+    # Fill the diagonal squares randomly (these don't interfere with each other)
+    for n in range(0, size, box):
+        nums = random.sample(range(1, size + 1), size)
+        for i in range(box):
+            for j in range(box):
                 board[n + i][n + j] = nums.pop()
 
     # Solve the puzzle (fill the rest of the board)
-    solve_sudoku(board)
+    board = solve(board)
 
     # Remove some numbers to create empty boxes
     for _ in range(empty_boxes):
-        row, col = random.randint(0, 8), random.randint(0, 8)
+        row, col = random.randint(0, size - 1), random.randint(0, size - 1)
         while board[row][col] == 0:
-            row, col = random.randint(0, 8), random.randint(0, 8)
+            row, col = random.randint(0, size - 1), random.randint(0, size - 1)
         board[row][col] = 0
 
     return Sudoku(board)
 
 
-if __name__ == "__main__":
-    # Generate and print a solved Sudoku puzzle
-    empty_boxes = int(sys.argv[1])
-
-    new_puzzle = generate_sudoku(empty_boxes)
+def generate_unique_sudoku(
+    clues: int, rng: random.Random, attempts: int = 50, box: int = 3
+) -> Optional[sudoku_type]:
+    """
+    Generate a puzzle with exactly ``clues`` filled cells and a unique solution.
+
+    Cells are removed from a random solved grid in random order, and a removal is
+    only kept if the puzzle still has a single solution.
+    Low clue counts may need several solved grids before one can be reduced far enough.
+    """
+    size = box * box
+    for _ in range(attempts):
+        board = BitmaskSolver([[0] * size for _ in range(size)], rng).solve()
+        filled = size * size
+        cells = [(i, j) for i in range(size) for j in range(size)]
+        rng.shuffle(cells)
+
+        for i, j in cells:
+            if filled == clues:
+                return board
+            value = board[i][j]
+            board[i][j] = 0
+            if BitmaskSolver(board).count_solutions(2) == 1:
+                filled -= 1
+            else:
+                board[i][j] = value
+
+        if filled == clues:
+            return board
+
+    return None
+
+
+def _generate_worker(args: tuple[int, int, int]) -> Optional[sudoku_type]:
+    clues, box, seed = args
+    return generate_unique_sudoku(clues, random.Random(seed), box=box)
+
+
+def generate_corpus(
+    count: int,
+    clues: int,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    box: int = 3,
+) -> Iterator[sudoku_type]:
+    """Generate ``count`` unique-solution puzzles across a process pool, yielding them as they finish."""
+    seeds = random.Random(seed)
+    tasks = ((clues, box, seeds.getrandbits(64)) for _ in range(count))
+
+    with multiprocessing.Pool(workers) as pool:
+        for puzzle in pool.imap_unordered(_generate_worker, tasks, chunksize=16):
+            if puzzle is None:
+                raise RuntimeError(f"Could not generate a puzzle with {clues} clues")
+            yield puzzle
+
+
+def write_puzzle(out: IO, puzzle: sudoku_type, binary: bool):
+    """Write a puzzle as an NDJSON line, or as raw bytes: the grid side, then one byte per cell."""
+    if binary:
+        out.write(bytes([len(puzzle)]))
+        out.write(bytes(value for row in puzzle for value in row))
+    else:
+        out.write(json.dumps({"sudoku": puzzle}, separators=(",", ":")) + "\n")
+
+
+def read_corpus(path: str) -> Iterator[sudoku_type]:
+    """Read back a corpus written by ``write_puzzle``, in either format."""
+    if path.endswith(".bin"):
+        with open(path, "rb") as f:
+            while size := f.read(1):
+                size = size[0]
+                chunk = f.read(size * size)
+                yield [list(chunk[i : i + size]) for i in range(0, size * size, size)]
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)["sudoku"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "empty_boxes",
+        help="Print a single puzzle with this many empty cells (no uniqueness check)",
+        type=int,
+        nargs="?",
+    )
+    parser.add_argument("-n", "--count", help="Number of puzzles to generate", type=int)
+    parser.add_argument("-c", "--clues", help="Number of filled cells", type=int)
+    parser.add_argument(
+        "-d", "--difficulty", help="Difficulty level", choices=DIFFICULTY_FILL.keys()
+    )
+    parser.add_argument(
+        "-b", "--box", help="Side of each square (3 for 9x9)", type=int, default=3
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Output file, NDJSON, or raw bytes if it ends in .bin (default: stdout)",
+        type=str,
+    )
+    parser.add_argument("-w", "--workers", help="Number of processes", type=int)
+    parser.add_argument("-s", "--seed", help="Random seed", type=int)
+    args = parser.parse_args()
+
+    if args.count is None:
+        # Generate and print a solved Sudoku puzzle
+        new_puzzle = generate_sudoku(args.empty_boxes or 0, args.box)
+
+        print(new_puzzle)
+
+        print(
+            "curl http://localhost:8001/solve -X POST -H 'Content-Type: application/json' -d '{\"sudoku\": %s}'"
+            % (new_puzzle.grid)
+        )
+        return
+
+    cells = args.box**4
+    clues = args.clues
+    if clues is None:
+        clues = round(DIFFICULTY_FILL[args.difficulty or "medium"] * cells)
+    if not 0 < clues <= cells:
+        parser.error(f"--clues must be between 1 and {cells}")
+
+    binary = args.out is not None and args.out.endswith(".bin")
+    out = open(args.out, "wb" if binary else "w") if args.out else sys.stdout
+    try:
+        for puzzle in generate_corpus(
+            args.count, clues, args.workers, args.seed, args.box
+        ):
+            write_puzzle(out, puzzle, binary)
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
-    print(new_puzzle)
 
-    print(
-        "curl http://localhost:8001/solve -X POST -H 'Content-Type: application/json' -d '{\"sudoku\": %s}'"
-        % (new_puzzle.grid)
-    )
+if __name__ == "__main__":
+    main()
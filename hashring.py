@@ -0,0 +1,39 @@
+import bisect
+import hashlib
+
+from custom_types import Address
+from utils import AddressUtils
+
+
+def _hash(key: str) -> int:
+    # Python's hash() is salted per process, and every node must place keys the same way
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of node addresses, used to pick a puzzle's next coordinator.
+
+    Each node sits at ``replicas`` points of the ring, and a key belongs to the first point
+    at or after its own hash. Nodes that see the same members agree on every key's owner,
+    without exchanging a message, and a node leaving only moves the keys it owned.
+
+    :param nodes: Members of the ring.
+    :type nodes: list[Address]
+    :param replicas: Points of the ring per node, to spread keys evenly.
+    :type replicas: int
+    """
+
+    def __init__(self, nodes: list[Address], replicas: int = 64):
+        self.points = sorted(
+            (_hash(f"{AddressUtils.address_to_str(node)}#{i}"), node)
+            for node in set(nodes)
+            for i in range(replicas)
+        )
+        self.hashes = [point for point, _ in self.points]
+
+    def owner(self, key: str) -> Address:
+        if not self.points:
+            raise ValueError("the ring has no nodes")
+        index = bisect.bisect_left(self.hashes, _hash(key)) % len(self.points)
+        return self.points[index][1]
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Iterator, Optional
+
+from custom_types import Address, sudoku_type
+from gen import read_corpus
+from utils import AddressUtils
+
+
+def percentile(sorted_values: list[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def http_request(
+    target: Address, method: str, path: str, body: Optional[dict], timeout: float
+) -> tuple[int, dict]:
+    """Send a single HTTP/1.0 request on a new connection, returning the status and the JSON body."""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    head = (
+        f"{method} {path} HTTP/1.0\r\n"
+        f"Host: {target[0]}:{target[1]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n\r\n"
+    )
+
+    async def exchange() -> tuple[int, dict]:
+        reader, writer = await asyncio.open_connection(*target)
+        try:
+            writer.write(head.encode("ascii") + payload)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        headers, _, content = response.partition(b"\r\n\r\n")
+        status = int(headers.split(b" ", 2)[1])
+        return status, json.loads(content) if content else {}
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+class LoadGenerator:
+    """
+    Drives the nodes' HTTP API with puzzles from a corpus, spreading requests across targets.
+
+    In closed-loop mode, ``concurrency`` clients each send a request as soon as their last one finished.
+    In open-loop mode, requests are started at ``rate`` per second, whether earlier ones finished or not,
+    so the cluster's queueing shows up in the latencies instead of slowing the generator down.
+
+    :param targets: Node HTTP addresses.
+    :type targets: list[Address]
+    :param puzzles: Puzzles to send, reused in order if there are fewer than requests.
+    :type puzzles: list[sudoku_type]
+    :param path: Endpoint, "/solve" or "/validate/batch".
+    :type path: str
+    :param batch: Puzzles per request, for "/validate/batch".
+    :type batch: int
+    :param extra: Other fields of the request body (e.g. engine, priority).
+    :type extra: dict[str, Any]
+    :param timeout: Seconds before a request is counted as timed out.
+    :type timeout: float
+    """
+
+    def __init__(
+        self,
+        targets: list[Address],
+        puzzles: list[sudoku_type],
+        path: str = "/solve",
+        batch: int = 1,
+        extra: Optional[dict[str, Any]] = None,
+        timeout: float = 60.0,
+    ):
+        self.targets = itertools.cycle(targets)
+        self.all_targets = targets
+        self.puzzles = itertools.cycle(puzzles)
+        self.path = path
+        self.batch = batch
+        self.extra = extra or {}
+        self.timeout = timeout
+
+        self.latencies: list[float] = []
+        self.statuses: Counter[str] = Counter()
+
+    def next_body(self) -> dict:
+        if self.path == "/validate/batch":
+            return {"sudokus": [next(self.puzzles) for _ in range(self.batch)]}
+        return {"sudoku": next(self.puzzles), **self.extra}
+
+    async def send(self):
+        target = next(self.targets)
+        body = self.next_body()
+        start = time.perf_counter()
+        try:
+            status, _ = await http_request(
+                target, "POST", self.path, body, self.timeout
+            )
+            self.statuses[str(status)] += 1
+        except asyncio.TimeoutError:
+            self.statuses["timeout"] += 1
+            return
+        except (OSError, ValueError, IndexError):
+            self.statuses["connection"] += 1
+            return
+        if status == 200:
+            self.latencies.append(time.perf_counter() - start)
+
+    async def closed_loop(self, concurrency: int, requests: int, duration: float):
+        sent = itertools.count()
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def client():
+            while next(sent) < requests or (requests == 0 and deadline):
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                await self.send()
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    async def open_loop(
+        self, rate: float, requests: int, duration: float, poisson: bool
+    ):
+        total = requests or int(rate * duration)
+        start = time.perf_counter()
+        next_at = 0.0
+        tasks = []
+        for _ in range(total):
+            delay = start + next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.send()))
+            next_at += random.expovariate(rate) if poisson else 1 / rate
+        await asyncio.gather(*tasks)
+
+    async def memo_stats(self) -> Counter:
+        """Memo hits and misses summed over the targets."""
+        totals = Counter()
+        for target in self.all_targets:
+            try:
+                _, stats = await http_request(target, "GET", "/stats", None, 5)
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+                continue
+            memo = stats.get("memo", {})
+            totals["hits"] += memo.get("hits", 0)
+            totals["misses"] += memo.get("misses", 0)
+        return totals
+
+    async def run(
+        self,
+        mode: str,
+        concurrency: int = 1,
+        rate: float = 1.0,
+        requests: int = 0,
+        duration: float = 0.0,
+        poisson: bool = False,
+    ) -> dict[str, Any]:
+        before = await self.memo_stats()
+        start = time.perf_counter()
+        if mode == "open":
+            await self.open_loop(rate, requests, duration, poisson)
+        else:
+            await self.closed_loop(concurrency, requests, duration)
+        elapsed = time.perf_counter() - start
+        after = await self.memo_stats()
+
+        return self.report(mode, elapsed, after - before, concurrency, rate)
+
+    def report(
+        self,
+        mode: str,
+        elapsed: float,
+        memo: Counter,
+        concurrency: int,
+        rate: float,
+    ) -> dict[str, Any]:
+        latencies = sorted(self.latencies)
+        total = sum(self.statuses.values())
+        ok = self.statuses.get("200", 0)
+        lookups = memo["hits"] + memo["misses"]
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "name": "loadgen",
+            "config": {
+                "mode": mode,
+                "path": self.path,
+                "targets": [AddressUtils.address_to_str(t) for t in self.all_targets],
+                "concurrency": concurrency if mode == "closed" else None,
+                "rate": rate if mode == "open" else None,
+                "batch": self.batch if self.path == "/validate/batch" else None,
+                **self.extra,
+            },
+            "results": {
+                "requests": total,
+                "ok": ok,
+                "elapsed": round(elapsed, 6),
+                "throughput": round(ok / elapsed, 3) if elapsed else 0.0,
+                "error_rate": round((total - ok) / total, 4) if total else 0.0,
+                "statuses": dict(self.statuses),
+                "latency_ms": {
+                    "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+                    "p50": ms(percentile(latencies, 0.5)),
+                    "p90": ms(percentile(latencies, 0.9)),
+                    "p99": ms(percentile(latencies, 0.99)),
+                    "p999": ms(percentile(latencies, 0.999)),
+                    "max": ms(latencies[-1] if latencies else None),
+                },
+                "memo_hit_rate": round(memo["hits"] / lookups, 4) if lookups else None,
+            },
+        }
+
+
+def parse_targets(values: list[str]) -> Iterator[Address]:
+    for value in values:
+        if value.isdigit():
+            yield "127.0.0.1", int(value)
+        else:
+            yield AddressUtils.str_to_address(value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "corpus", help="Puzzle corpus written by gen.py (NDJSON or .bin)"
+    )
+    parser.add_argument(
+        "-t",
+        "--targets",
+        help="Node HTTP ports or host:port addresses",
+        nargs="+",
+        default=["8000"],
+    )
+    parser.add_argument(
+        "-m", "--mode", help="Load model", choices=["closed", "open"], default="closed"
+    )
+    parser.add_argument(
+        "-c", "--concurrency", help="Clients (closed loop)", type=int, default=8
+    )
+    parser.add_argument(
+        "-r", "--rate", help="Requests per second (open loop)", type=float, default=10
+    )
+    parser.add_argument(
+        "--poisson",
+        help="Exponential inter-arrival times (open loop)",
+        action="store_true",
+    )
+    parser.add_argument("-n", "--requests", help="Total requests", type=int, default=0)
+    parser.add_argument(
+        "-d", "--duration", help="Seconds to run for", type=float, default=0
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        help="Endpoint",
+        choices=["/solve", "/validate/batch"],
+        default="/solve",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        help="Puzzles per /validate/batch request",
+        type=int,
+        default=32,
+    )
+    parser.add_argument("-e", "--engine", help="Solver engine", type=str)
+    parser.add_argument("--priority", help="Request priority", type=int)
+    parser.add_argument(
+        "--timeout", help="Request timeout, in seconds", type=float, default=60
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output JSON file (default: stdout)", type=str
+    )
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        parser.error("either --requests or --duration is needed")
+
+    puzzles = list(read_corpus(args.corpus))
+    if not puzzles:
+        parser.error(f"{args.corpus} has no puzzles")
+
+    extra = {}
+    if args.engine:
+        extra["engine"] = args.engine
+    if args.priority is not None:
+        extra["priority"] = args.priority
+
+    generator = LoadGenerator(
+        list(parse_targets(args.targets)),
+        puzzles,
+        args.path,
+        args.batch,
+        extra,
+        args.timeout,
+    )
+    result = asyncio.run(
+        generator.run(
+            args.mode,
+            args.concurrency,
+            args.rate,
+            args.requests,
+            args.duration,
+            args.poisson,
+        )
+    )
+
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
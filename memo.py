@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from custom_types import sudoku_type
+from sudoku import Sudoku
+
+square_key = tuple[int, tuple[int, ...], tuple[int, ...], tuple[int, ...]]
+
+
+class SquareMemo:
+    """
+    Bounded LRU cache of filled squares, keyed by the square and its constraint context.
+
+    A fill is only valid for the digits already used in the rows and columns
+    crossing the square, so those are part of the key, along with the square itself:
+    the same key always means the same constraints, even in another puzzle or another square position.
+
+    :param capacity: Maximum number of cached squares, 0 disables the cache.
+    :type capacity: int
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.entries: OrderedDict[square_key, tuple[int, ...]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def key(cls, square: int, grid: sudoku_type) -> square_key:
+        """The square's cells, and the digits used by each crossing row and column outside of it, as bitmasks."""
+        box = Sudoku.box_size(grid)
+        start_row, start_col = Sudoku.square_origin(square, grid)
+        rows = range(start_row, start_row + box)
+        cols = range(start_col, start_col + box)
+
+        cells = tuple(grid[i][j] for i in rows for j in cols)
+        row_masks = tuple(
+            cls._mask(grid[i][j] for j in range(len(grid)) if j not in cols)
+            for i in rows
+        )
+        col_masks = tuple(
+            cls._mask(grid[i][j] for i in range(len(grid)) if i not in rows)
+            for j in cols
+        )
+        return len(grid), cells, row_masks, col_masks
+
+    @staticmethod
+    def _mask(values) -> int:
+        mask = 0
+        for value in values:
+            if value != 0:
+                mask |= 1 << value
+        return mask
+
+    def get(self, key: square_key) -> Optional[sudoku_type]:
+        with self.lock:
+            cells = self.entries.get(key)
+            if cells is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        box = len(key[2])
+        return [list(cells[i : i + box]) for i in range(0, len(cells), box)]
+
+    def put(self, key: square_key, square: sudoku_type):
+        """Cache the filled square, unless it had nothing to fill or is still incomplete."""
+        if self.capacity <= 0 or 0 not in key[1] or any(0 in row for row in square):
+            return
+        with self.lock:
+            self.entries[key] = tuple(value for row in square for value in row)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
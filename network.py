@@ -1,81 +1,191 @@
 import asyncio
 import json
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-import logging
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
 
+from admission import AdmissionRejected
+from consts import Engine
 from custom_types import Address
+from debug import memory, profile, thread_dumps
+from events import EventLogger
 from p2p import P2PServer
+from sudoku import Sudoku
+from validate import validate_batch
+
+log = EventLogger("http")
 
 
 class SudokuHTTPHandler(SimpleHTTPRequestHandler):
     def __init__(self, p2p_server: P2PServer, *args):
         self.p2p_server: P2PServer = p2p_server
+        self.status: Optional[int] = None
         super().__init__(*args)
 
+    def send_response(self, code: int, message: Optional[str] = None):
+        self.status = code
+        super().send_response(code, message)
+
+    def recorded(self, method: str, handle: Callable[[], None], body: Any = None):
+        """Handle a request, recording it and its response if the node records traffic."""
+        recorder = self.p2p_server.recorder
+        if recorder is None:
+            handle()
+            return
+        request = recorder.request(method, self.path, body)
+        start = time.monotonic()
+        try:
+            handle()
+        finally:
+            recorder.response(request, self.status, time.monotonic() - start)
+
+    def log_message(self, format: str, *args):
+        log.event("http.access", line=lambda: format % args)
+
     def set_json_header(self):
         self.send_header("Content-type", "application/json")
         self.end_headers()
 
-    def send_success(self, body: dict = None):
+    def send_text(self, text: str):
         self.send_response(200)
+        self.send_header("Content-type", "text/plain; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(text.encode("utf-8"))
+
+    def send_success(self, body: dict = None, code: int = 200):
+        self.send_response(code)
         self.set_json_header()
         self.wfile.write(json.dumps(body).encode("utf-8"))
 
-    def set_error(self, message: str):
-        self.send_response(404)
+    def set_error(self, message: str, code: int = 404, headers: dict = None):
+        self.send_response(code)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
         self.set_json_header()
         self.wfile.write(json.dumps({"message": message}).encode("utf-8"))
 
     def do_GET(self):
-        logging.info("GET %s, from %s", self.path, self.headers.get("Host"))
+        log.event("http.request", method="GET", path=self.path)
+        self.recorded("GET", self.get)
 
+    def get(self):
         if self.path == "/stats":
             self.send_success(self.p2p_server.get_stats())
         elif self.path == "/network":
             self.send_success(self.p2p_server.get_network())
-        elif self.path == "/solve":
-            self.set_error("GET method not allowed for /solve")
+        elif self.path == "/health":
+            health = self.p2p_server.get_health()
+            self.send_success(health, 200 if health["ready"] else 503)
+        elif self.path.startswith("/debug/") and self.server.debug:
+            self.do_debug()
+        elif self.path == "/solve" or self.path == "/validate/batch":
+            self.set_error(f"GET method not allowed for {self.path}")
         else:
             self.set_error(f"Path {self.path} not available")
 
+    def do_debug(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/debug/profile":
+                self.send_text(profile(float(query.get("seconds", 5))))
+            elif url.path == "/debug/threads":
+                self.send_success(thread_dumps())
+            elif url.path == "/debug/memory":
+                self.send_success(memory(self.p2p_server, int(query.get("top", 20))))
+            else:
+                self.set_error(f"Path {self.path} not available")
+        except ValueError as e:
+            self.set_error(f"Invalid query: {e}", 400)
+
     def do_POST(self):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         content_length = int(self.headers["Content-Length"])
         post_data = self.rfile.read(content_length)
         body = json.loads(post_data.decode("utf-8"))
 
-        logging.info(
-            "POST %s, from %s, with body:\n%s",
-            self.path,
-            self.headers.get("Host"),
-            body,
-        )
+        log.event("http.request", method="POST", path=self.path, length=content_length)
+        self.recorded("POST", lambda: self.post(body), body)
 
+    def post(self, body: dict):
         if self.path == "/solve":
-            done = loop.run_until_complete(
-                asyncio.gather(self.p2p_server.solve_sudoku(body["sudoku"]))
-            )
-            loop.close()
+            if not Sudoku.is_valid_shape(body.get("sudoku")):
+                self.set_error("sudoku must be an n^2 x n^2 grid of integers", 400)
+                return
+            try:
+                engine = Engine(body["engine"]) if "engine" in body else None
+            except ValueError:
+                self.set_error(f"Unknown engine {body['engine']}", 400)
+                return
+            priority = body.get("priority", 0)
+            # JSON booleans are ints to Python
+            if isinstance(priority, bool) or not isinstance(priority, int):
+                self.set_error("priority must be an integer", 400)
+                return
+
+            empty = sum(row.count(0) for row in body["sudoku"])
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                with self.p2p_server.admission.admit(priority, empty):
+                    done = loop.run_until_complete(
+                        asyncio.gather(
+                            self.p2p_server.solve_sudoku(body["sudoku"], engine)
+                        )
+                    )
+            except AdmissionRejected as e:
+                log.event("http.rejected", path=self.path, retry_after=e.retry_after)
+                self.set_error(str(e), 429, {"Retry-After": str(e.retry_after)})
+                return
+            finally:
+                loop.close()
             self.send_success({"sudoku": done[0]})
-        elif self.path == "/stats" or self.path == "/network":
+        elif self.path == "/validate/batch":
+            sudokus = body.get("sudokus") if isinstance(body, dict) else None
+            if not isinstance(sudokus, list):
+                self.set_error("sudokus must be a list of grids", 400)
+                return
+            try:
+                valid = validate_batch(sudokus)
+            except ValueError as e:
+                # Grids of different sizes, or not square grids of integers
+                self.set_error(f"Invalid batch: {e}", 400)
+                return
+            self.send_success({"valid": valid.tolist(), "invalid": int((~valid).sum())})
+        elif self.path in ("/stats", "/network", "/health"):
             self.set_error(f"GET method not allowed for {self.path}")
         else:
             self.set_error(f"Path {self.path} not available")
 
 
-def run_http_server(port: int, p2p_server: P2PServer):
-    logging.basicConfig(level=logging.INFO)
+def make_http_server(
+    port: int, p2p_server: P2PServer, debug: bool = False
+) -> ThreadingHTTPServer:
+    """
+    Bind the HTTP server, so its port is known (e.g. for port 0) before serving.
+    The /debug endpoints are only served if `debug` is set.
+    """
     server_address: Address = ("", port)
 
     def handler(*args) -> SudokuHTTPHandler:
         return SudokuHTTPHandler(p2p_server, *args)
 
-    httpd = HTTPServer(server_address, handler)
-    logging.info(f"Starting HTTP on port {port}\n")
+    httpd = ThreadingHTTPServer(server_address, handler)
+    httpd.debug = debug
+    return httpd
+
+
+def run_http_server(port: int, p2p_server: P2PServer):
+    httpd = make_http_server(port, p2p_server)
+    serve_http(httpd)
+
+
+def serve_http(httpd: ThreadingHTTPServer):
+    port = httpd.server_address[1]
+    log.event("http.started", port=port)
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         pass
     httpd.server_close()
-    logging.info("Stopping httpd...\n")
+    log.event("http.stopped", port=port)
@@ -1,20 +1,60 @@
 import argparse
 import threading
+import tracemalloc
 from typing import Optional
 
-from network import run_http_server
+from consts import Engine
+from events import parse_overrides, setup_logging
+from network import make_http_server, serve_http
 from p2p import P2PServer
+from recorder import Recorder
 
 
 class Node:
     def __init__(
-        self, http_port: int, p2p_port: int, address: Optional[str], handicap: int
+        self,
+        http_port: int,
+        p2p_port: int,
+        address: Optional[str],
+        handicap: int,
+        engine: Engine = Engine.RANDOM,
+        fanout: int = 3,
+        memo_size: int = 4096,
+        max_in_flight: int = 4,
+        max_queue: int = 32,
+        retention: float = 600,
+        max_puzzles: int = 1024,
+        debug: bool = False,
+        shared_memory: bool = True,
+        record: Optional[str] = None,
     ):
-        self.http_port = http_port
-        self.p2p = P2PServer(p2p_port, address, handicap / 1000)
+        self.p2p = P2PServer(
+            p2p_port,
+            address,
+            handicap / 1000,
+            engine,
+            fanout,
+            memo_size,
+            max_in_flight,
+            max_queue,
+            retention,
+            max_puzzles,
+            shared_memory,
+        )
+        if record:
+            # HTTP requests and handled frames, to be replayed by replay.py
+            self.p2p.recorder = Recorder(record, self.p2p.address)
+
+        if debug and not tracemalloc.is_tracing():
+            tracemalloc.start()  # For /debug/memory, it slows allocations down
+        self.httpd = make_http_server(http_port, self.p2p, debug)
+
+        # Ports as bound, when 0 was given to pick any free one
+        self.http_port = self.httpd.server_address[1]
+        self.p2p_port = self.p2p.address[1]
 
         self.http_thread = threading.Thread(
-            target=run_http_server, args=(http_port, self.p2p), daemon=True
+            target=serve_http, args=(self.httpd,), daemon=True
         )
 
     def run(self):
@@ -24,6 +64,27 @@ class Node:
         except KeyboardInterrupt:
             self.p2p.socket.close()
 
+    def stop(self, timeout: float = 10) -> bool:
+        """
+        Stop taking requests, let the puzzles being solved finish, then leave the network.
+        Returns False if they didn't finish in time.
+        """
+        if self.http_thread.is_alive():
+            self.httpd.shutdown()
+        else:
+            self.httpd.server_close()
+        drained = self.p2p.admission.drain(timeout)
+        self.p2p.stop()
+        return drained
+
+    def kill(self):
+        """Leave the network right away, as if the node crashed."""
+        self.p2p.stop()
+        if self.http_thread.is_alive():
+            self.httpd.shutdown()
+        else:
+            self.httpd.server_close()
+
 
 def main():
     parser = argparse.ArgumentParser(conflict_handler="resolve")
@@ -38,9 +99,113 @@ def main():
         type=str,
     )
     parser.add_argument("-h", "--handicap", help="Handicap", type=int, default=0)
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="Default solver engine",
+        type=Engine,
+        choices=list(Engine),
+        default=Engine.RANDOM,
+    )
+    parser.add_argument(
+        "-f",
+        "--fanout",
+        help="Nodes each node relays broadcasts to (0 sends to all nodes directly)",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "-m",
+        "--memo-size",
+        help="Filled squares cached for reuse (0 disables the cache)",
+        type=int,
+        default=4096,
+    )
+    parser.add_argument(
+        "-i",
+        "--max-in-flight",
+        help="Puzzles solved at once by this node",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "-q",
+        "--max-queue",
+        help="Puzzles waiting to be solved, beyond which requests get a 429",
+        type=int,
+        default=32,
+    )
+    parser.add_argument(
+        "-r",
+        "--retention",
+        help="Seconds solved puzzles are kept to answer repeated requests",
+        type=float,
+        default=600,
+    )
+    parser.add_argument(
+        "--max-puzzles",
+        help="Solved puzzles kept at once, least recently used ones are dropped first",
+        type=int,
+        default=1024,
+    )
+    parser.add_argument(
+        "--debug",
+        help="Serve /debug/profile, /debug/threads and /debug/memory, and trace allocations",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-shm",
+        help="Talk to nodes on the same host through TCP instead of shared memory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--record",
+        help="File to record HTTP requests and P2P frames to, for replay.py",
+        type=str,
+    )
+    parser.add_argument(
+        "-l", "--log-level", help="Minimum log level", type=str, default="INFO"
+    )
+    parser.add_argument(
+        "--log-format", help="Log format", choices=["json", "text"], default="json"
+    )
+    parser.add_argument(
+        "--log-event",
+        help="Level of an event type, as EVENT=LEVEL (e.g. work.started=INFO)",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--log-sample",
+        help="Fraction of an event type to log, as EVENT=RATE (e.g. message.received=0.01)",
+        action="append",
+        default=[],
+    )
     args = parser.parse_args()
 
-    node = Node(args.port, args.service, args.address, args.handicap)
+    setup_logging(
+        args.log_level,
+        args.log_format == "json",
+        parse_overrides(args.log_event, str),
+        parse_overrides(args.log_sample, float),
+    )
+
+    node = Node(
+        args.port,
+        args.service,
+        args.address,
+        args.handicap,
+        args.engine,
+        args.fanout,
+        args.memo_size,
+        args.max_in_flight,
+        args.max_queue,
+        args.retention,
+        args.max_puzzles,
+        args.debug,
+        not args.no_shm,
+        args.record,
+    )
     node.run()
 
 
@@ -1,18 +1,34 @@
+import asyncio
 import copy
-import json
-import logging
+import errno
+import heapq
+import itertools
+import os
+import random
 import selectors
 import socket
 import threading
 import time
 import uuid
-from datetime import datetime
+from collections import OrderedDict
 from typing import Optional, Any
 
-from consts import JobStatus
-from custom_types import Address, sudoku_type, jobs_structure
+import dlx
+import solver
+from admission import AdmissionController
+from connection import BufferPool, RecvBuffer, SendQueue, SendQueueFull
+from clock import Clock
+from crdt import GCounter
+from debug import deep_size
+from events import EventLogger
+from hashring import HashRing
+from memo import SquareMemo
+from dissemination import SpanningTree
+from consts import JobStatus, Engine, Route, Strategy
+from custom_types import Address, counter_type, jobs_structure, sudoku_type
 from utils import AddressUtils
 from protocol import (
+    Message,
     P2PProtocol,
     JoinParent,
     JoinParentResponse,
@@ -24,82 +40,424 @@ from protocol import (
     WorkComplete,
     SudokuSolved,
     StoreSudoku,
+    SolveRequest,
+    SolveResult,
+    SolveCancel,
+    Relay,
+    Doorbell,
+    WorkOffer,
+    WorkSteal,
+    WorkBatch,
+    WorkBatchAck,
+    WorkBatchComplete,
+    WorkReturn,
     P2PProtocolBadFormat,
 )
+from portfolio import Race
+from puzzle import PuzzleState
+from recorder import Recorder
+from router import Probe, Router, branches, propagate
+from shm import Ring, ShmLink, host_id
 from sudoku import Sudoku
 
+log = EventLogger("p2p")
+
+# Seconds between checks of the waiting jobs to advertise, and steal attempts
+BALANCE_INTERVAL = 0.02
+
+# Neighbors picked at random to hear of a node's waiting jobs, on top of those that already did
+OFFER_FANOUT = 4
+
+# Times a square with a cell left without candidates is filled again from scratch, before its job gives up
+STUCK_RETRIES = 3
+
 
 class P2PServer:
-    def __init__(self, port: int, parent: Optional[str], handicap: float):
-        self.address = (socket.gethostbyname_ex(socket.gethostname())[2][-1], port)
+    def __init__(
+        self,
+        port: int,
+        parent: Optional[str],
+        handicap: float,
+        engine: Engine = Engine.RANDOM,
+        fanout: Optional[int] = 3,
+        memo_size: int = 4096,
+        max_in_flight: int = 4,
+        max_queue: int = 32,
+        retention: float = 600,
+        max_puzzles: int = 1024,
+        shared_memory: bool = True,
+        clock: Optional[Clock] = None,
+    ):
+        self.address = (
+            AddressUtils.local_ip(
+                AddressUtils.str_to_address(parent)[0] if parent else None
+            ),
+            port,
+        )
         self.handicap = handicap
-        self.solved: int = 0  # Global state across the network
-        self.validations: int = 0  # Node-only state
+        self.clock = clock or Clock()  # Real time and threads, unless simulated
+        self.engine = engine  # Default engine for sudokus coordinated by this node
+        # Stats, as G-counters merged from the ones piggybacked on other messages
+        self.solved_counter = GCounter()  # Puzzles solved by each coordinator
+        self.validations_counter = GCounter()  # Validations done by each node
         self.parent = parent
-        logging.basicConfig(encoding="utf-8", level=logging.INFO)
 
-        # sudokus        -> {id: (grid: Sudoku, jobs: jobs_structure, address: Address)}
-        # jobs_structure -> [(complete: JobStatus, assigned_node: Address)]
-        self.sudokus: dict[str, tuple[Sudoku, jobs_structure, Address, sudoku_type]] = (
-            {}
-        )
+        # Puzzles known by this node, coordinated by it or by others, least recently used first.
+        # Completed ones are kept for `retention` seconds to answer repeated requests,
+        # and at most `max_puzzles` of them are kept at once.
+        self.sudokus: OrderedDict[str, PuzzleState] = OrderedDict()
+        self.retention = retention
+        self.max_puzzles = max_puzzles
+        self.expired = 0
+
+        # {node_addr: Address: (socket: socket.socket, timeout: float)}
+        self.neighbors: dict[Address, tuple[socket.socket, float]] = {}
+
+        # Filled squares, by square and constraint context, reused across puzzles
+        self.memo = SquareMemo(memo_size)
+
+        # Puzzles coordinated by this node at once, and waiting to be
+        self.admission = AdmissionController(max_in_flight, max_queue)
+
+        # Portfolio races, coordinated by this node or entered on behalf of others
+        self.races: dict[str, Race] = {}
+        # Seconds a race waits for its entries, e.g. when a racing neighbor hangs
+        self.race_timeout = 60.0
+
+        # Cluster-wide broadcasts are relayed along a spanning tree of at most `fanout` children per node
+        self.tree = SpanningTree(fanout)
+
+        # Decides whether puzzles coordinated by this node are solved locally or distributed, and how
+        self.router = Router(self.address, handicap)
+
+        # Work stealing: idle nodes pull waiting jobs from the most loaded coordinators
+        # Puzzles split in squares by this node
+        self.dispatching: dict[str, Engine] = {}
+        self.job_slots = 2  # Jobs run at once, before the node stops offering capacity
+        self.batch_size = 4  # Jobs of a puzzle given to a node in a single WorkBatch
+        self.jobs_running = 0
+        self.jobs_lock = threading.Lock()
+        # Waiting jobs, as advertised by each neighbor
+        self.loads: dict[Address, int] = {}
+        self.offer_level = 0  # Waiting jobs last advertised, as a power of two
+        self.offered_at = 0.0
+        self.offered_to: set[Address] = set()  # Neighbors that may think jobs wait here
+        self.stealing_from: Optional[tuple[Address, float]] = None  # And until when
+        self.lease_time = 5.0
+        self.leases: dict[tuple[str, int], tuple[Address, float]] = {}
+        self.stolen = 0  # Jobs other nodes pulled from this one
+        self.taken = 0  # Jobs this node pulled from others
+        self.leases_expired = 0
+
+        # Puzzles this node took over from coordinators that died, resuming them from its replica
+        self.taken_over = 0
+
+        # Records HTTP requests and handled frames, if set (see replay.py)
+        self.recorder: Optional[Recorder] = None
+
+        # Neighbors on the same host exchange frames through shared memory, by socket
+        self.shared_memory = shared_memory
+        self.host = host_id()
+        self.shm: dict[socket.socket, ShmLink] = {}
+
+        self.bind()
+
+        # Timers run by the selector thread: [(deadline, sequence, callback, args)]
+        self.timers: list[tuple[float, int, Any, tuple]] = []
+        self.timers_sequence = itertools.count()
+        self.timers_lock = threading.Lock()
 
-        # {node_addr: Address: (socket: socket.socket, validations: int, timeout: float)}
-        self.neighbors: dict[Address, tuple[socket.socket, int, float]] = {}
+        # Outbound connections in progress: {socket: (address, parent, attempt)}
+        self.connecting: dict[socket.socket, tuple[Address, bool, int]] = {}
+        self.pending_connects: set[Address] = set()
+        self.connect_attempts = 6
+        self.connect_base_delay = 0.05
+        self.connect_max_delay = 2.0
 
-        # {old_squares: new_squares}
-        self.squares_history: dict[json, sudoku_type | None] = {}
+        # Set once the node has joined the network and connected to every node it knows of
+        self.started = time.time()
+        self.ready_at: Optional[float] = None
+        self.joined = parent is None
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.membership = threading.Condition()  # Notified when neighbors join or leave
 
+    def bind(self):
+        """Listen for other nodes, and set the selector up."""
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind(("", self.address[1]))
         self.socket.setblocking(False)
         self.socket.listen(1000)
+        self.address = (self.address[0], self.socket.getsockname()[1])  # For port 0
 
         self.sel = selectors.DefaultSelector()
         self.sel.register(self.socket, selectors.EVENT_READ, self.accept)
 
-    def connect_to_node(self, addr: Address, parent: bool = False):
-        wait = 1
-        while True:
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.connect(addr)
-                self.sel.register(sock, selectors.EVENT_READ, self.read)
-                self.neighbors[addr] = (sock, 0, time.time())
-                message = (
-                    JoinParent(self.address) if parent else JoinOther(self.address)
-                )
-                P2PProtocol.send_msg(sock, message)
-                break
-            except ConnectionRefusedError:
-                logging.error(
-                    f"Failed to connect to {AddressUtils.address_to_str(addr)}. Retrying in {wait * 2}s"
-                )
-                time.sleep(wait := wait * 2)
+        # Outbound frames per neighbor socket, drained by the selector thread.
+        # Other threads only queue frames, then wake the selector up through a socket pair.
+        self.outboxes: dict[socket.socket, SendQueue] = {}
+        self.writing: set[socket.socket] = set()
+        # Inbound bytes per neighbor socket, received into buffers reused across connections
+        self.inboxes: dict[socket.socket, RecvBuffer] = {}
+        self.buffers = BufferPool()
+        self.waker, self.waker_writer = socket.socketpair()
+        self.waker.setblocking(False)
+        self.waker_writer.setblocking(False)
+        self.sel.register(self.waker, selectors.EVENT_READ, self.wake)
 
-    def get_stats(self) -> dict[str, Any]:
-        validations = (
-            sum([v for (_, v, __) in self.neighbors.values()]) + self.validations
+    def call_later(self, delay: float, callback, *args):
+        """Run a callback on the selector thread after the delay, in seconds."""
+        with self.timers_lock:
+            heapq.heappush(
+                self.timers,
+                (time.monotonic() + delay, next(self.timers_sequence), callback, args),
+            )
+        self.wake_up()
+
+    def run_timers(self) -> Optional[float]:
+        """Run due timers, returning the time until the next one, if any."""
+        due = []
+        with self.timers_lock:
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                due.append(heapq.heappop(self.timers))
+        for _, _, callback, args in due:
+            callback(*args)
+        with self.timers_lock:
+            return (
+                max(0.0, self.timers[0][0] - time.monotonic()) if self.timers else None
+            )
+
+    def connect_to_node(self, addr: Address, parent: bool = False, attempt: int = 0):
+        """Start a non-blocking connection, finished by `finish_connect` once the socket is writable."""
+        if addr in self.neighbors or addr == self.address:
+            return
+        self.pending_connects.add(addr)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        error = sock.connect_ex(addr)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            self.retry_connect(addr, parent, attempt, os.strerror(error))
+            return
+
+        self.connecting[sock] = (addr, parent, attempt)
+        self.sel.register(sock, selectors.EVENT_WRITE, self.finish_connect)
+
+    def finish_connect(self, sock: socket.socket):
+        addr, parent, attempt = self.connecting.pop(sock)
+        self.sel.unregister(sock)
+
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error != 0:
+            sock.close()
+            self.retry_connect(addr, parent, attempt, os.strerror(error))
+            return
+
+        sock.settimeout(3)
+        self.outboxes[sock] = SendQueue()
+        self.inboxes[sock] = RecvBuffer(self.buffers)
+        self.sel.register(sock, selectors.EVENT_READ, self.read)
+        self.neighbors[addr] = (sock, time.time())
+        self.membership_changed()
+        ring = self.offer_ring(sock)
+        message = (
+            JoinParent(self.address, self.host, ring)
+            if parent
+            else JoinOther(self.address, self.host, ring)
+        )
+        self.send(sock, message)
+
+        self.pending_connects.discard(addr)
+        self.update_readiness()
+
+    def offer_ring(self, sock: socket.socket) -> Optional[str]:
+        """Create the ring a neighbor will write to, if it turns out to be on the same host."""
+        if not self.shared_memory:
+            return None
+        try:
+            inbound = Ring()
+        except OSError as e:
+            log.event("shm.unavailable", error=str(e))
+            return None
+        self.shm[sock] = ShmLink(sock, inbound)
+        return inbound.name
+
+    def accept_ring(
+        self, conn: socket.socket, data: JoinParent | JoinOther
+    ) -> Optional[str]:
+        """
+        Take the ring offered by a joining node on the same host, and offer one back.
+        Frames sent from now on, starting with the response, go through shared memory.
+        """
+        if not self.shared_memory or data.ring is None or data.host != self.host:
+            return None
+        try:
+            link = ShmLink(conn, Ring())
+        except OSError as e:
+            log.event("shm.unavailable", error=str(e))
+            return None
+        if not link.attach(data.ring):
+            link.close()
+            return None
+        self.shm[conn] = link
+        return link.inbound.name
+
+    def attach_ring(self, conn: socket.socket, name: Optional[str]):
+        """Switch to the ring the neighbor offered back, or give ours up if it didn't take it."""
+        link = self.shm.get(conn)
+        if link is None:
+            return
+        if name is None:
+            self.shm.pop(conn).close()
+        elif not link.attach(name):
+            log.event("shm.attach_failed", ring=name)  # It still writes to ours
+
+    def retry_connect(self, addr: Address, parent: bool, attempt: int, reason: str):
+        """Retry a failed connection with jittered exponential backoff, up to `connect_attempts` times."""
+        if attempt + 1 >= self.connect_attempts:
+            log.event(
+                "node.connect_failed",
+                node=AddressUtils.address_to_str(addr),
+                attempts=attempt + 1,
+                reason=reason,
+            )
+            self.pending_connects.discard(addr)
+            self.update_readiness()
+            return
+
+        delay = min(self.connect_max_delay, self.connect_base_delay * 2**attempt)
+        delay *= random.uniform(0.5, 1.5)
+        log.event(
+            "node.connect_retry",
+            node=AddressUtils.address_to_str(addr),
+            reason=reason,
+            delay=round(delay, 3),
         )
+        self.call_later(delay, self.connect_to_node, addr, parent, attempt + 1)
+
+    def update_readiness(self):
+        if self.joined and not self.pending_connects and not self.ready.is_set():
+            self.ready_at = time.time()
+            self.ready.set()
+            log.event(
+                "node.ready",
+                seconds=round(self.ready_at - self.started, 3),
+                neighbors=len(self.neighbors),
+            )
+
+    def membership_changed(self):
+        with self.membership:
+            self.membership.notify_all()
+
+    def wait_for_neighbors(self, count: int, timeout: Optional[float] = None) -> bool:
+        """Wait until this node has exactly `count` neighbors, returning False on timeout."""
+        with self.membership:
+            return self.membership.wait_for(
+                lambda: len(self.neighbors) == count, timeout
+            )
+
+    def get_health(self) -> dict[str, Any]:
+        return {
+            "ready": self.ready.is_set(),
+            "address": AddressUtils.address_to_str(self.address),
+            "neighbors": len(self.neighbors),
+            "connecting": [
+                AddressUtils.address_to_str(addr) for addr in self.pending_connects
+            ],
+            "time_to_ready": (
+                round(self.ready_at - self.started, 6) if self.ready_at else None
+            ),
+        }
+
+    @property
+    def solved(self) -> int:
+        return self.solved_counter.value
+
+    @property
+    def validations(self) -> int:
+        return self.validations_counter.get(self.address)
+
+    def merge_stats(
+        self, solved: counter_type = None, validations: counter_type = None
+    ):
+        if solved:
+            self.solved_counter.merge(solved)
+        if validations:
+            self.validations_counter.merge(validations)
+
+    def get_stats(self) -> dict[str, Any]:
         nodes = [
-            {"address": ":".join(str(prop) for prop in k), "validations": v[1]}
-            for (k, v) in self.neighbors.items()
-        ]
-        nodes.insert(
-            0,
             {
-                "address": AddressUtils.address_to_str(self.address),
-                "validations": self.validations,
-            },
-        )
+                "address": AddressUtils.address_to_str(addr),
+                "validations": self.validations_counter.get(addr),
+                "transport": self.transport(addr),
+            }
+            for addr in [self.address, *self.neighbors.keys()]
+        ]
 
         return {
             "all": {
-                "solved": self.solved,
-                "validations": validations,
+                "solved": self.solved_counter.value,
+                "validations": self.validations_counter.value,
             },
             "nodes": nodes,
+            "memo": self.memo.stats(),
+            "admission": self.admission.stats(),
+            "router": self.router.stats(),
+            "stealing": self.stealing_stats(),
+            "failover": {"taken_over": self.taken_over},
+            "memory": self.memory_counts(),
+        }
+
+    def transport(self, addr: Address) -> Optional[str]:
+        """How frames are sent to a neighbor: through shared memory or TCP."""
+        if addr not in self.neighbors:
+            return None
+        link = self.shm.get(self.neighbors[addr][0])
+        return "shm" if link is not None and link.outbound is not None else "tcp"
+
+    def memory_counts(self) -> dict[str, dict[str, int]]:
+        """
+        Entries of the structures that grow with traffic, cheap enough for every /stats request.
+        Their size in bytes takes a walk over all of them, left to /debug/memory (see `memory_usage`).
+        """
+        return {
+            "sudokus": {"count": len(self.sudokus), "expired": self.expired},
+            "memo": {"count": len(self.memo.entries)},
+            "seen_broadcasts": {"count": len(self.tree.seen)},
+            "receive_buffers": {"count": len(self.inboxes) + len(self.buffers.free)},
+        }
+
+    def memory_usage(self) -> dict[str, dict[str, int]]:
+        """Approximate size of the structures that grow with traffic, in bytes."""
+        sudokus = list(self.sudokus.values())
+        return {
+            "sudokus": {
+                "count": len(sudokus),
+                "completed": sum(s.completed_at is not None for s in sudokus),
+                "expired": self.expired,
+                "bytes": deep_size(sudokus),
+            },
+            "memo": {
+                "count": len(self.memo.entries),
+                "bytes": deep_size(self.memo.entries),
+            },
+            "rate_limiter": {
+                "count": sum(len(s.sudoku.recent_requests) for s in sudokus),
+                "bytes": sum(deep_size(s.sudoku.recent_requests) for s in sudokus),
+            },
+            "seen_broadcasts": {
+                "count": len(self.tree.seen),
+                "bytes": deep_size(self.tree.seen),
+            },
+            "receive_buffers": {
+                "count": len(self.inboxes) + len(self.buffers.free),
+                "bytes": sum(len(inbox.buffer) for inbox in list(self.inboxes.values()))
+                + len(self.buffers.free) * self.buffers.size,
+            },
         }
 
     def get_network(self) -> dict[str, list]:
@@ -111,344 +469,1205 @@ class P2PServer:
             for node in all_network
         }
 
-    async def solve_sudoku(self, grid: sudoku_type):
-        if grid in [s[3] for s in self.sudokus.values()]:
-            logging.info(f"Grid already solved: {grid}")
-            solved_grid = [s[0].grid for s in self.sudokus.values() if s[3] == grid][0]
-            return solved_grid
+    async def solve_sudoku(self, grid: sudoku_type, engine: Optional[Engine] = None):
+        for state in list(self.sudokus.values()):
+            if state.original != grid:
+                continue
+            if state.coordinator == self.address and state.completed_at is None:
+                # Already being solved here, e.g. resumed after its coordinator died
+                log.event("sudoku.joined", id=state.id)
+                while state.id in self.sudokus and not state.is_completed():
+                    state.wait_for_change(state.version, 0.1, self.clock)
+            if state.completed_at is not None:
+                log.event("sudoku.cached")
+                self.touch(state.id)
+                return state.sudoku.grid
 
         _id = str(uuid.uuid4())
         sudoku = Sudoku(grid)
-        self.sudokus[_id] = (
-            sudoku,
-            [(JobStatus.PENDING, None) for _ in range(0, 9)],
-            self.address,
-            copy.deepcopy(sudoku.grid),
+        self.sudokus[_id] = PuzzleState(
+            _id, sudoku, self.address, copy.deepcopy(sudoku.grid)
+        )
+
+        engine = engine or self.engine
+        if engine == Engine.PORTFOLIO:
+            self.disseminate(StoreSudoku(_id, grid, self.address))
+            solution = await self.solve_portfolio(_id)
+        else:
+            solution = await self.route(_id, engine)
+
+        if solution is None:
+            # Don't answer later requests for the same grid with a half-filled one
+            self.sudokus.pop(_id, None)
+        return solution
+
+    async def route(self, sudoku_id: str, engine: Engine) -> Optional[sudoku_type]:
+        """Solve a puzzle the way the router predicts to be fastest, then record how long it really took."""
+        start = self.clock.monotonic()
+        grid = self.sudokus[sudoku_id].original
+        probe = Probe(grid)
+        decision = self.router.decide(
+            probe, [addr for addr in self.neighbors if not self.is_congested(addr)]
+        )
+        log.event(
+            "router.decision",
+            id=sudoku_id,
+            route=str(decision.route),
+            nodes=len(decision.nodes),
+            predicted=round(decision.predicted, 6),
+            costs={str(r): round(cost, 6) for r, cost in decision.costs.items()},
+            **probe.features(),
+        )
+
+        if decision.route == Route.LOCAL:
+            solution = self.solve_locally(sudoku_id, probe)
+        else:
+            self.disseminate(StoreSudoku(sudoku_id, grid, self.address))
+            if decision.route == Route.SUBTREES:
+                solution = await self.solve_subtrees(sudoku_id, decision.nodes)
+            else:
+                solution = await self.distribute_work(sudoku_id, engine, decision.nodes)
+
+        elapsed = self.clock.monotonic() - start
+        self.router.finished(sudoku_id, decision.predicted, elapsed)
+        log.event(
+            "router.outcome",
+            id=sudoku_id,
+            route=str(decision.route),
+            predicted=round(decision.predicted, 6),
+            actual=round(elapsed, 6),
+        )
+        return solution
+
+    def solve_locally(self, sudoku_id: str, probe: Probe) -> Optional[sudoku_type]:
+        """Solve a whole puzzle in-process, without sending any message."""
+        state = self.sudokus[sudoku_id]
+        solution = probe.solution if probe.finished else solver.solve(probe.propagated)
+        self.clock.sleep(self.handicap * probe.jobs)
+        if solution is None:
+            return None
+
+        self.validations_counter.increment(self.address, probe.blanks)
+        state.finish(solution, self.address)
+        # Other nodes never heard of it, they get the counters with the next KeepAlive
+        self.solved_counter.increment(self.address)
+        return solution
+
+    def touch(self, sudoku_id: str):
+        try:
+            self.sudokus.move_to_end(sudoku_id)
+        except KeyError:
+            pass  # Expired meanwhile
+
+    def expire_puzzles(self):
+        """
+        Drop completed puzzles older than the retention period, then the least recently used ones
+        over the cap. Puzzles coordinated by others that stopped progressing (e.g. their coordinator died)
+        are dropped after the retention period as well.
+        """
+        now = time.monotonic()
+        completed = []
+        for state in list(self.sudokus.values()):
+            if state.completed_at is not None:
+                if now - state.completed_at < self.retention:
+                    completed.append(state)
+                    continue
+            elif (
+                state.coordinator == self.address
+                or now - state.updated_at < self.retention
+            ):
+                continue
+            self.sudokus.pop(state.id, None)
+            self.expired += 1
+
+        for state in completed[: max(0, len(completed) - self.max_puzzles)]:
+            self.sudokus.pop(state.id, None)
+            self.expired += 1
+
+    def keep_expiring(self):
+        """Expire puzzles on the selector thread, every few seconds."""
+        self.expire_puzzles()
+        self.call_later(min(5.0, self.retention / 4), self.keep_expiring)
+
+    async def solve_portfolio(self, sudoku_id: str) -> Optional[sudoku_type]:
+        """
+        Race every strategy on local processes, plus randomized restarts on each idle neighbor,
+        and keep the first verified solution. The other entries are cancelled with SolveCancel.
+        """
+        grid = self.sudokus[sudoku_id].original
+        race = Race(sudoku_id, grid)
+        self.races[sudoku_id] = race
+
+        for strategy in Strategy:
+            race.add_local(strategy, random.getrandbits(32))
+        for addr in self.get_idle_neighbors():
+            self.enter_race(race, addr, grid, Strategy.RESTARTS)
+        race.start()
+
+        return await self.run_race(race)
+
+    async def solve_subtrees(
+        self, sudoku_id: str, nodes: list[Address]
+    ) -> Optional[sudoku_type]:
+        """
+        Split the search on the candidates of the most constrained cell, one branch per node.
+        If there are more branches than nodes, this node searches the whole grid instead of a branch,
+        so every solution is covered. The first verified solution wins, as in a portfolio race.
+        """
+        grid = self.sudokus[sudoku_id].original
+        race = Race(sudoku_id, grid)
+        self.races[sudoku_id] = race
+
+        remote = [addr for addr in nodes if addr in self.neighbors]
+        grids = branches(propagate(grid)[0])
+        for addr, branch in zip(remote, grids):
+            self.enter_race(race, addr, branch, Strategy.MRV)
+        rest = grids[len(remote) :]
+        race.add_local(
+            Strategy.MRV,
+            random.getrandbits(32),
+            grid=rest[0] if len(rest) == 1 else grid,
+        )
+        race.start()
+
+        return await self.run_race(race)
+
+    def enter_race(
+        self, race: Race, addr: Address, grid: sudoku_type, strategy: Strategy
+    ):
+        """Have a neighbor run a strategy on a grid, as an entry of the race."""
+        seed = random.getrandbits(32)
+        tag = race.add_entry(strategy, AddressUtils.address_to_str(addr), seed)
+        race.remote.add(addr)
+        self.send(
+            self.neighbors[addr][0],
+            SolveRequest(race.id, grid, strategy, seed, tag),
         )
 
-        for sock in [n[0] for n in self.neighbors.values()]:
-            P2PProtocol.send_msg(
-                sock,
-                StoreSudoku(_id, grid, self.address),
+    async def run_race(self, race: Race) -> Optional[sudoku_type]:
+        """Wait for a race's winner, cancel the other entries, then share the solution."""
+        sudoku_id = race.id
+        state = self.sudokus[sudoku_id]
+        solution = await asyncio.get_running_loop().run_in_executor(
+            None, race.wait, self.race_timeout
+        )
+        race.cancel()
+        del self.races[sudoku_id]
+        for addr in race.remote:
+            if addr in self.neighbors:
+                self.send(self.neighbors[addr][0], SolveCancel(sudoku_id))
+
+        log.event("portfolio.outcome", **race.outcome())
+
+        if solution is None:
+            return None
+
+        state.finish(solution, self.address)
+
+        self.solved_counter.increment(self.address)
+        self.disseminate(
+            SudokuSolved(
+                sudoku_id, state.sudoku, self.address, self.solved_counter.state()
             )
+        )
+        return solution
 
-        return await self.distribute_work(_id)
+    def handle_solve_request(self, conn: socket.socket, data: SolveRequest):
+        race = Race(data.id, data.grid)
+        self.races[data.id] = race
+        race.add_local(data.strategy, data.seed)
+        race.start()
+        race.wait(self.race_timeout)
+        self.clock.sleep(self.handicap)
+
+        if not race.cancelled:
+            finisher = race.finishers[0] if race.finishers else {}
+            self.send(
+                conn,
+                SolveResult(data.id, data.tag, race.winner, finisher.get("elapsed")),
+            )
+        race.cancel()
+        self.races.pop(data.id, None)
 
     def accept(self, sock: socket.socket):
         conn, _ = sock.accept()
         conn.setblocking(False)
         conn.settimeout(3)
+        self.outboxes[conn] = SendQueue()
+        self.inboxes[conn] = RecvBuffer(self.buffers)
         self.sel.register(conn, selectors.EVENT_READ, self.read)
 
+    def send(self, conn: socket.socket, message: Message, droppable: bool = False):
+        """
+        Queue a message to a neighbor, to be sent by the selector thread.
+        Droppable messages (e.g. KeepAlive) aren't queued again while one of the same type is pending.
+        """
+        self.send_frame(
+            conn,
+            P2PProtocol.encode(message),
+            type(message).__name__ if droppable else None,
+        )
+
+    def broadcast(self, message: Message, droppable: bool = False):
+        """Queue a message to every neighbor, encoding it only once."""
+        frame = P2PProtocol.encode(message)
+        kind = type(message).__name__ if droppable else None
+        for sock in [n[0] for n in list(self.neighbors.values())]:
+            self.send_frame(sock, frame, kind)
+
+    def disseminate(self, message: Message):
+        """Broadcast a message to the whole cluster, relayed along the spanning tree."""
+        members = sorted(list(self.neighbors.keys()) + [self.address])
+        relay = Relay(uuid.uuid4().hex, self.address, members, message)
+        self.tree.first_time(relay.id)
+        self.relay(relay)
+
+    def relay(self, relay: Relay):
+        frame = P2PProtocol.encode(relay)
+        for addr in self.tree.targets(
+            relay.members, relay.origin, self.address, lambda a: a in self.neighbors
+        ):
+            self.send_frame(self.neighbors[addr][0], frame)
+
+    def send_frame(self, conn: socket.socket, frame: bytes, kind: Optional[str] = None):
+        outbox = self.outboxes.get(conn)
+        if outbox is None:
+            return
+
+        try:
+            queued = outbox.put(frame, kind)
+        except SendQueueFull as e:
+            log.event("node.slow", error=str(e))
+            # Any thread may be sending, but only the selector thread tears connections down
+            self.call_later(0, self.disconnect_node, conn)
+            return
+
+        if queued:
+            self.wake_up()
+
+    def wake_up(self):
+        """Interrupt the selector, so it picks up new frames or timers."""
+        try:
+            self.waker_writer.send(b"\0")
+        except BlockingIOError:
+            pass  # The selector has wake-ups pending already
+        except OSError:
+            pass  # The node has stopped
+
+    def wake(self, waker: socket.socket):
+        """Watch for writability the sockets that got new frames to send."""
+        try:
+            while waker.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        for conn, outbox in list(self.outboxes.items()):
+            if outbox.pending and conn not in self.writing:
+                self.writing.add(conn)
+                self.sel.modify(
+                    conn, selectors.EVENT_READ | selectors.EVENT_WRITE, self.read
+                )
+
+    def write(self, conn: socket.socket):
+        outbox = self.outboxes.get(conn)
+        if outbox is None:
+            return  # Disconnected while handling an earlier event
+        link = self.shm.get(conn)
+        try:
+            if outbox.partial:
+                # The rest of a frame goes the way its start went, or the neighbor can't put it back together
+                done = outbox.flush(outbox.started_on)
+            elif link is not None and link.outbound is not None:
+                done = outbox.flush(link)
+            else:
+                done = outbox.flush(conn)
+            if link is not None:
+                done = link.ring() and done
+        except OSError as e:
+            log.event("node.send_failed", error=str(e))
+            self.disconnect_node(conn)
+            return
+
+        if done:
+            self.writing.discard(conn)
+            self.sel.modify(conn, selectors.EVENT_READ, self.read)
+        elif link is not None and link.full and not link.bell:
+            # The socket stays writable, check again once the neighbor had time to read its ring
+            self.writing.discard(conn)
+            self.sel.modify(conn, selectors.EVENT_READ, self.read)
+            self.call_later(0.001, self.wake_up)
+
+    def is_congested(self, addr: Address) -> bool:
+        """Whether the node's outbound queue is backed up, so it shouldn't get new work."""
+        if addr == self.address or addr not in self.neighbors:
+            return False
+        outbox = self.outboxes.get(self.neighbors[addr][0])
+        return outbox is not None and outbox.congested
+
     def disconnect_node(self, conn: socket.socket):
+        """Tear a connection down. Only the selector thread calls it, and only the first call does anything."""
+        if conn not in self.outboxes:
+            return
         addr = self.get_address_from_socket(conn)
-        logging.warning(f"Node {AddressUtils.address_to_str(addr)} has disconnected")
+        log.event("node.disconnected", node=AddressUtils.address_to_str(addr))
         self.sel.unregister(conn)
         conn.close()
+        self.outboxes.pop(conn, None)
+        self.writing.discard(conn)
+        inbox = self.inboxes.pop(conn, None)
+        if inbox is not None:
+            inbox.close()
+        link = self.shm.pop(conn, None)
+        if link is not None:
+            link.close()
+        self.router.forget(addr)
+        self.loads.pop(addr, None)
         self.cancel_disconnecting_node_jobs(addr)
+        for race in list(self.races.values()):
+            if addr in race.remote:
+                race.abandon(AddressUtils.address_to_str(addr))
         self.neighbors = {k: v for (k, v) in self.neighbors.items() if v[0] != conn}
+        self.membership_changed()
+        self.fail_over(addr)
+
+    def fail_over(self, dead: Address):
+        """
+        Hand the unfinished puzzles of a node that left to their successor on a hash ring of the remaining nodes.
+        Every node computes the same successor, and the successor resumes the puzzle from its replica,
+        kept up to date by StoreSudoku and WorkBatchComplete broadcasts, so completed squares aren't solved again.
+        """
+        ring = HashRing([self.address, *self.neighbors])
+        for state in list(self.sudokus.values()):
+            if state.coordinator != dead or state.completed_at is not None:
+                continue
+            state.coordinator = ring.owner(state.id)
+            log.event(
+                "sudoku.failover",
+                id=state.id,
+                dead=AddressUtils.address_to_str(dead),
+                coordinator=AddressUtils.address_to_str(state.coordinator),
+            )
+            if state.coordinator == self.address:
+                self.taken_over += 1
+                self.clock.spawn(self.resume, state.id)
+
+    def resume(self, sudoku_id: str):
+        """Finish splitting a puzzle taken over from a coordinator that died."""
+        state = self.sudokus.get(sudoku_id)
+        if state is None:
+            return
+        # The job table known here may be stale, jobs in progress are dispatched again unless they complete first
+        for job in range(state.sudoku.size):
+            state.release_job(job, state.assignees[job])
+        solution = asyncio.run(self.distribute_work(sudoku_id, self.engine))
+        log.event("sudoku.resumed", id=sudoku_id, solved=solution is not None)
+        if solution is None:
+            self.sudokus.pop(sudoku_id, None)
 
     def read(self, conn: socket.socket):
+        inbox = self.inboxes.get(conn)
+        if inbox is None:
+            return  # Disconnected while handling an earlier event
+        frames = [] if self.recorder is not None else None
         try:
-            data = P2PProtocol.recv_msg(conn)
+            messages = P2PProtocol.recv_msgs(conn, inbox, frames)
         except P2PProtocolBadFormat:
-            logging.error(f"Bad format from {self.get_address_from_socket(conn)}")
+            log.event(
+                "message.bad_format",
+                node=AddressUtils.address_to_str(self.get_address_from_socket(conn)),
+            )
             self.disconnect_node(conn)
             return
 
-        if data is None:
+        if messages is None:
             self.disconnect_node(conn)
             return
+        if frames:
+            self.record(conn, frames)
 
-        if not isinstance(data, KeepAlive):
-            logging.info(
-                "Received %s at %s: %s",
-                type(data).__name__,
-                datetime.now().time().replace(microsecond=0).isoformat(),
-                data,
-            )
+        for data in messages:
+            if conn not in self.inboxes:
+                return  # Disconnected by an earlier message
+            if isinstance(data, Doorbell):
+                frames = [] if self.recorder is not None else None
+                try:
+                    ring = self.shm[conn].receive(frames)
+                except (KeyError, P2PProtocolBadFormat):
+                    log.event(
+                        "message.bad_format",
+                        node=AddressUtils.address_to_str(
+                            self.get_address_from_socket(conn)
+                        ),
+                    )
+                    self.disconnect_node(conn)
+                    return
+                if frames:
+                    self.record(conn, frames)
+                for message in ring:
+                    self.handle_message(conn, message)
+            else:
+                self.handle_message(conn, data)
+
+    def record(self, conn: socket.socket, frames: list[bytes]):
+        node = next(
+            (addr for addr, (sock, _) in self.neighbors.items() if sock == conn), None
+        )
+        for frame in frames:
+            self.recorder.frame(node, frame)
+
+    def handle_message(self, conn: socket.socket, data: Message):
+        if not isinstance(data, (KeepAlive, Relay)):
+            log.event("message.received", type=type(data).__name__)
 
         if isinstance(data, JoinParent):
             neighbors = list(self.neighbors.keys())
-            message = JoinParentResponse(neighbors)
-            self.neighbors[data.address] = (conn, 0, time.time())
-            P2PProtocol.send_msg(conn, message)
-            logging.info("Sent %s to %s", message, data.address)
+            message = JoinParentResponse(
+                neighbors,
+                self.address,
+                self.solved_counter.state(),
+                self.validations_counter.state(),
+                self.accept_ring(conn, data),
+            )
+            self.neighbors[data.address] = (conn, time.time())
+            self.membership_changed()
+            self.send(conn, message)
+            log.event(
+                "message.sent",
+                type=type(message).__name__,
+                node=AddressUtils.address_to_str(data.address),
+            )
         elif isinstance(data, JoinParentResponse):
+            # Know the parent by the address it reports, like every other node does
+            parent = self.get_address_from_socket(conn)
+            if parent != data.address:
+                self.neighbors[data.address] = self.neighbors.pop(parent)
+
+            self.merge_stats(data.solved, data.validations)
+            self.neighbors[data.address] = (conn, time.time())
+            self.attach_ring(conn, data.ring)
             for node in data.nodes:
                 self.connect_to_node(node)
+
+            self.joined = True
+            self.membership_changed()
+            self.update_readiness()
         elif isinstance(data, StoreSudoku):
-            self.sudokus[data.id] = (
-                Sudoku(data.grid),
-                [(JobStatus.PENDING, None) for _ in range(0, 9)],
-                data.address,
-                data.grid,
+            if data.id in self.sudokus:
+                # A WorkRequest for this sudoku got here first, keep its state
+                self.sudokus[data.id].original = data.grid
+                return
+            # A replica, in case the coordinator dies (see `fail_over`)
+            self.sudokus[data.id] = PuzzleState(
+                data.id, Sudoku(copy.deepcopy(data.grid)), data.address, data.grid
             )
         elif isinstance(data, JoinOther):
-            message = JoinOtherResponse(self.solved, self.validations)
-            self.neighbors[data.address] = (conn, 0, time.time())
-            P2PProtocol.send_msg(conn, message)
-            logging.info("Sent %s to %s", message, data.address)
-        elif isinstance(data, JoinOtherResponse):
-            self.neighbors[self.get_address_from_socket(conn)] = (
-                conn,
-                data.validations,
-                time.time(),
+            message = JoinOtherResponse(
+                self.solved_counter.state(),
+                self.validations_counter.state(),
+                self.accept_ring(conn, data),
             )
-        elif isinstance(data, KeepAlive):
-            self.neighbors[self.get_address_from_socket(conn)] = (
-                conn,
-                self.neighbors[self.get_address_from_socket(conn)][1],
-                time.time(),
+            self.neighbors[data.address] = (conn, time.time())
+            self.membership_changed()
+            self.send(conn, message)
+            log.event(
+                "message.sent",
+                type=type(message).__name__,
+                node=AddressUtils.address_to_str(data.address),
             )
+        elif isinstance(data, JoinOtherResponse):
+            self.merge_stats(data.solved, data.validations)
+            self.attach_ring(conn, data.ring)
+            self.neighbors[self.get_address_from_socket(conn)] = (conn, time.time())
+        elif isinstance(data, KeepAlive):
+            self.merge_stats(data.solved, data.validations)
+            self.neighbors[self.get_address_from_socket(conn)] = (conn, time.time())
         elif isinstance(data, WorkRequest):
-            threading.Thread(
-                target=self.handle_work_request, args=(conn, data), daemon=True
-            ).start()
+            if data.lease is not None:
+                self.taken += 1
+                self.stealing_from = None
+            self.clock.spawn(self.handle_work_request, conn, data)
+        elif isinstance(data, WorkBatch):
+            if data.lease is not None:
+                self.taken += len(data.units)
+                self.stealing_from = None
+            self.clock.spawn(self.handle_work_batch, conn, data)
+        elif isinstance(data, WorkOffer):
+            self.loads[self.get_address_from_socket(conn)] = data.load
+            if data.load > 0:
+                self.steal()
+        elif isinstance(data, WorkSteal):
+            self.handle_work_steal(conn, data)
         elif isinstance(data, WorkAck):
-            # TODO: Implement this. A job data structure is yet to be created.
-            pass
+            self.router.acked(data.id, data.job, self.clock.monotonic())
+        elif isinstance(data, WorkBatchAck):
+            now = self.clock.monotonic()
+            for sudoku_id, job in data.units:
+                self.router.acked(sudoku_id, job, now)
         elif isinstance(data, WorkComplete):
             self.handle_work_complete(conn, data)
+        elif isinstance(data, WorkBatchComplete):
+            self.handle_work_batch_complete(conn, data)
+        elif isinstance(data, WorkReturn):
+            self.handle_work_return(conn, data)
+        elif isinstance(data, SolveRequest):
+            self.clock.spawn(self.handle_solve_request, conn, data)
+        elif isinstance(data, SolveResult):
+            if data.id in self.races:
+                self.races[data.id].submit(data.tag, data.grid, data.elapsed)
+        elif isinstance(data, SolveCancel):
+            if data.id in self.races:
+                self.races[data.id].cancel()
         elif isinstance(data, SudokuSolved):
-            self.solved += 1
-            logging.info(
-                f"Sudoku {data.id} solved by {self.get_address_from_socket(conn)}"
-            )
-            self.sudokus[data.id] = (
-                data.sudoku,
-                [(JobStatus.COMPLETED, None) for _ in range(0, 9)],
-                self.get_address_from_socket(conn),
-                self.sudokus[data.id][3],
+            self.merge_stats(data.solved)
+            log.event(
+                "sudoku.solved",
+                id=data.id,
+                coordinator=AddressUtils.address_to_str(data.address),
             )
+            state = self.sudokus.get(data.id)
+            if state is None:
+                # StoreSudoku was lost or is still being relayed
+                state = PuzzleState(
+                    data.id, data.sudoku, data.address, copy.deepcopy(data.sudoku.grid)
+                )
+                self.sudokus[data.id] = state
+            state.coordinator = data.address
+            state.finish(data.sudoku.grid, None)
+        elif isinstance(data, Relay):
+            if self.tree.first_time(data.id):
+                self.relay(data)
+                # Handle the payload as if it came straight from the origin
+                origin = self.neighbors.get(data.origin)
+                self.handle_message(origin[0] if origin else conn, data.payload)
         else:
-            print("Unsupported message", data)
+            log.event("message.unsupported", type=type(data).__name__)
 
     def handle_work_request(
         self, conn: socket.socket, data: WorkRequest, self_call: bool = False
     ):
-        grid_from_upstream = data.sudoku.grid
+        with self.jobs_lock:
+            self.jobs_running += 1
+        try:
+            self.work(conn, data, self_call)
+        finally:
+            with self.jobs_lock:
+                self.jobs_running -= 1
+
+    def handle_work_batch(
+        self, conn: socket.socket, data: WorkBatch, self_call: bool = False
+    ):
+        with self.jobs_lock:
+            self.jobs_running += len(data.units)
+        try:
+            self.work_batch(conn, data, self_call)
+        finally:
+            with self.jobs_lock:
+                self.jobs_running -= len(data.units)
+
+    def work(self, conn: socket.socket, data: WorkRequest, self_call: bool = False):
         addr = (
             self.get_address_from_socket(conn) if conn != self.socket else self.address
         )
+        state = self.take_puzzle(data.id, data.sudoku, data.jobs, addr, self_call)
+        if not self_call:
+            self.send(conn, WorkAck(data.id, data.job))
+
+        if not self.do_job(state, data.job, data.engine, addr):
+            self.give_back(conn, [(data.id, data.job)], self_call)
+            return
+
+        message = WorkComplete(
+            data.id,
+            state.sudoku,
+            data.job,
+            self.solved_counter.state(),
+            self.validations_counter.state(),
+        )
+        self.disseminate(message)
+        if self.sender_left(conn, self_call):
+            log.event("work.orphaned", id=data.id, job=data.job)
+            return
+        self.handle_work_complete(conn, message, self_call)
 
-        logging.info(
-            f"Handling work {data.job} from {addr} with grid\n{data.sudoku}\nand jobs {data.jobs}"
+    def work_batch(self, conn: socket.socket, data: WorkBatch, self_call: bool = False):
+        """Do the jobs of a batch in order, then report them all with a single WorkBatchComplete."""
+        addr = (
+            self.get_address_from_socket(conn) if conn != self.socket else self.address
         )
+        states = {
+            sudoku_id: self.take_puzzle(sudoku_id, sudoku, jobs, addr, self_call)
+            for sudoku_id, (sudoku, jobs, _) in data.puzzles.items()
+        }
+        if not self_call:
+            self.send(conn, WorkBatchAck(data.units))
+
+        solutions: dict[str, Optional[sudoku_type]] = {}
+        done: dict[str, list[int]] = {}
+        cancelled: list[tuple[str, int]] = []
+        for sudoku_id, job in data.units:
+            engine = data.puzzles[sudoku_id][2]
+            if engine == Engine.DLX and sudoku_id not in solutions:
+                # Every square of the puzzle comes from the same exact cover
+                solutions[sudoku_id] = dlx.solve(states[sudoku_id].sudoku.grid)
+            if self.do_job(
+                states[sudoku_id], job, engine, addr, solutions.get(sudoku_id)
+            ):
+                done.setdefault(sudoku_id, []).append(job)
+            else:
+                cancelled.append((sudoku_id, job))
+        if cancelled:
+            self.give_back(conn, cancelled, self_call)
+        if not done:
+            return
 
-        self.sudokus[data.id] = (
-            data.sudoku,
-            data.jobs,
-            self.get_address_from_socket(conn) if not self_call else self.address,
-            self.sudokus[data.id][3],
+        message = WorkBatchComplete(
+            {
+                sudoku_id: (states[sudoku_id].sudoku, jobs)
+                for sudoku_id, jobs in done.items()
+            },
+            self.solved_counter.state(),
+            self.validations_counter.state(),
         )
+        self.disseminate(message)
+        if self.sender_left(conn, self_call):
+            log.event("work.orphaned", units=len(data.units))
+            return
+        self.handle_work_batch_complete(conn, message, self_call)
 
+    def give_back(
+        self, conn: socket.socket, units: list[tuple[str, int]], self_call: bool
+    ):
+        """Hand cancelled jobs back to the coordinator, which still counts them as in progress here."""
+        message = WorkReturn(units)
+        if self_call:
+            self.handle_work_return(conn, message, self_call)
+        elif not self.sender_left(conn, self_call):
+            self.send(conn, message)
+
+    def handle_work_return(
+        self, conn: socket.socket, data: WorkReturn, self_call: bool = False
+    ):
+        addr = self.get_address_from_socket(conn) if not self_call else self.address
+        for sudoku_id, job in data.units:
+            self.leases.pop((sudoku_id, job), None)
+            state = self.sudokus.get(sudoku_id)
+            if state is not None and state.release_job(job, addr):
+                log.event(
+                    "work.returned",
+                    id=sudoku_id,
+                    job=job,
+                    node=AddressUtils.address_to_str(addr),
+                )
+
+    def take_puzzle(
+        self,
+        sudoku_id: str,
+        sudoku: Sudoku,
+        jobs: jobs_structure,
+        addr: Address,
+        self_call: bool,
+    ) -> PuzzleState:
+        """Take the grid and jobs sent with work, as the latest state of the puzzle."""
+        state = self.sudokus.get(sudoku_id)
+        if state is None:
+            # StoreSudoku is still being relayed
+            state = PuzzleState(sudoku_id, sudoku, addr, copy.deepcopy(sudoku.grid))
+            self.sudokus[sudoku_id] = state
+        state.sudoku = sudoku
         if not self_call:
-            P2PProtocol.send_msg(conn, WorkAck(data.id, data.job))
+            state.coordinator = addr
+            state.load_jobs(jobs)
+        return state
 
-        changing_grid = data.sudoku.grid
-        number_of_zeros = Sudoku.get_number_of_zeros_in_square(data.job, changing_grid)
+    def do_job(
+        self,
+        state: PuzzleState,
+        job: int,
+        engine: Engine,
+        addr: Address,
+        solution: Optional[sudoku_type] = None,
+    ) -> bool:
+        """
+        Fill a square of the puzzle's grid, from the exact cover solution if any,
+        returning False if newer work for the puzzle replaced the grid meanwhile.
+        """
+        grid_from_upstream = state.sudoku.grid
+        log.event(
+            "work.started",
+            id=state.id,
+            job=job,
+            node=AddressUtils.address_to_str(addr),
+            grid=lambda: copy.deepcopy(grid_from_upstream),
+        )
+
+        changing_grid = grid_from_upstream
+        number_of_zeros = Sudoku.get_number_of_zeros_in_square(job, changing_grid)
+        given = copy.deepcopy(Sudoku.return_square(job, changing_grid))
+        retries = 0
+
+        if engine == Engine.DLX and solution is None:
+            solution = dlx.solve(changing_grid)
+            if solution is None:
+                log.event("work.fallback", id=state.id, job=job, engine=Engine.RANDOM)
 
         while True:
-            if grid_from_upstream != self.sudokus[data.id][0].grid:
-                logging.warning(f"Work {data.job} canceled")
-                return
+            if grid_from_upstream != state.sudoku.grid:
+                log.event("work.cancelled", id=state.id, job=job)
+                return False
 
-            changing_grid, completed = Sudoku.update_square(data.job, changing_grid)
-            self.validations = self.validations + 1
+            if solution is not None:
+                Sudoku.replace_square(
+                    job, Sudoku.return_square(job, solution), changing_grid
+                )
+                completed = True
+                self.validations_counter.increment(self.address, number_of_zeros)
+                self.clock.sleep(self.handicap)
+            else:
+                zeros = Sudoku.get_number_of_zeros_in_square(job, changing_grid)
+                changing_grid, completed = Sudoku.update_square(job, changing_grid)
+                self.validations_counter.increment(self.address)
+                self.clock.sleep(self.handicap / (number_of_zeros + 1))
 
-            time.sleep(self.handicap / (number_of_zeros + 1))
+                if not completed and (
+                    Sudoku.get_number_of_zeros_in_square(job, changing_grid) == zeros
+                ):
+                    # A cell has no candidates left: start the square over, or give it up
+                    Sudoku.replace_square(job, copy.deepcopy(given), changing_grid)
+                    retries += 1
+                    if retries > STUCK_RETRIES:
+                        # Reported as done, unfilled, so the puzzle ends up unsolved instead of hanging
+                        log.event("work.stuck", id=state.id, job=job)
+                        completed = True
 
             if completed:
-                self.sudokus[data.id][1][data.job] = (
-                    JobStatus.COMPLETED,
-                    self.sudokus[data.id][1][data.job][1],
-                )
-                self.sudokus[data.id][0].grid = changing_grid
+                state.sudoku.grid = changing_grid
+                state.set_job(job, JobStatus.COMPLETED)
                 break
 
-        logging.info(
-            f"Finished work {data.job} from {addr} with grid\n{self.sudokus[data.id][0]}"
+        log.event(
+            "work.finished",
+            id=state.id,
+            job=job,
+            node=AddressUtils.address_to_str(addr),
+            grid=lambda: copy.deepcopy(state.sudoku.grid),
         )
+        return True
 
-        for sock in [n[0] for n in self.neighbors.values()]:
-            P2PProtocol.send_msg(
-                sock,
-                WorkComplete(
-                    data.id, self.sudokus[data.id][0], data.job, self.validations
-                ),
-            )
-
-        self.handle_work_complete(
-            conn,
-            WorkComplete(data.id, self.sudokus[data.id][0], data.job, self.validations),
-            self_call,
-        )
+    def sender_left(self, conn: socket.socket, self_call: bool) -> bool:
+        """Whether the node that sent work left while it was being done, e.g. after its lease expired."""
+        return not self_call and not any(v[0] == conn for v in self.neighbors.values())
 
     def handle_work_complete(
         self, conn: socket.socket, data: WorkComplete, self_call: bool = False
     ):
         addr = self.get_address_from_socket(conn) if not self_call else self.address
 
-        logging.info(
-            f"Received complete work {data.job} from {addr} with grid\n{data.sudoku}"
+        log.event(
+            "work.completed",
+            id=data.id,
+            job=data.job,
+            node=AddressUtils.address_to_str(addr),
         )
 
-        if not self_call:
-            self.neighbors[addr] = (
-                self.neighbors[addr][0],
-                data.validations,
-                time.time(),
-            )
+        self.merge_stats(data.solved, data.validations)
+        self.complete_job(data.id, data.sudoku.grid, data.job)
 
-        self.update_sudoku_with_new_values(data.id, data.sudoku.grid, data.job)
-        self.sudokus[data.id][1][data.job] = (
-            JobStatus.COMPLETED,
-            self.sudokus[data.id][1][data.job][1],
-        )
+    def handle_work_batch_complete(
+        self, conn: socket.socket, data: WorkBatchComplete, self_call: bool = False
+    ):
+        addr = self.get_address_from_socket(conn) if not self_call else self.address
+        self.merge_stats(data.solved, data.validations)
+        for sudoku_id, (sudoku, jobs) in data.results.items():
+            for job in jobs:
+                log.event(
+                    "work.completed",
+                    id=sudoku_id,
+                    job=job,
+                    node=AddressUtils.address_to_str(addr),
+                )
+                self.complete_job(sudoku_id, sudoku.grid, job)
+
+    def complete_job(self, sudoku_id: str, grid: sudoku_type, job: int):
+        """Take a completed square into the puzzle, if it is known here."""
+        self.router.completed(sudoku_id, job, self.clock.monotonic())
+        self.leases.pop((sudoku_id, job), None)
+
+        if sudoku_id not in self.sudokus:
+            # StoreSudoku and WorkComplete come from different nodes, along different paths
+            log.event("work.unknown_sudoku", id=sudoku_id, job=job)
+            return
+
+        self.update_sudoku_with_new_values(sudoku_id, grid, job)
+        self.sudokus[sudoku_id].set_job(job, JobStatus.COMPLETED)
 
-    async def distribute_work(self, sudoku_id: str):
-        (grid, jobs, _, _) = self.sudokus[sudoku_id]
+    async def distribute_work(
+        self,
+        sudoku_id: str,
+        engine: Engine = Engine.RANDOM,
+        nodes: Optional[list[Address]] = None,
+    ):
+        """
+        Give one job per square to free nodes, only the given ones if any are still around,
+        sending each node its jobs in a single WorkBatch.
+        Jobs waiting for a free node can be stolen meanwhile (see `handle_work_steal`).
+        """
+        self.dispatching[sudoku_id] = engine
+        try:
+            return await self.dispatch_squares(sudoku_id, engine, nodes)
+        finally:
+            self.dispatching.pop(sudoku_id, None)
 
-        copy_grid = copy.deepcopy(grid.grid)
+    async def dispatch_squares(
+        self,
+        sudoku_id: str,
+        engine: Engine,
+        nodes: Optional[list[Address]],
+    ):
+        state = self.sudokus[sudoku_id]
+        grid = state.sudoku
+
+        # Memo keys of the squares, as given and as dispatched, filled in once the Sudoku is solved
+        memo_keys = {
+            (square, SquareMemo.key(square, grid.grid)) for square in range(grid.size)
+        }
 
         while not self.is_sudoku_completed(sudoku_id):
-            logging.debug(f"Jobs: {jobs}")
+            version = state.version
             zeros_per_square = [
                 (i, Sudoku.get_number_of_zeros_in_square(i, grid.grid))
-                for i in range(9)
+                for i in range(grid.size)
             ]
             zeros_per_square.sort(key=lambda x: x[1])
 
+            # Squares claimed for each free node, filling its batch up to `batch_size` before the next one's
+            free = self.get_addresses_of_free_nodes(sudoku_id, nodes)
+            batches: dict[Address, list[int]] = {node: [] for node in free}
             for square, zeros in zeros_per_square:
-                job = self.sudokus[sudoku_id][1][square]
-
                 if zeros == 0:
-                    if job[0] != JobStatus.COMPLETED:
-                        self.sudokus[sudoku_id][1][square] = (
-                            JobStatus.COMPLETED,
-                            self.sudokus[sudoku_id][1][square][1],
-                        )
+                    if state.status(square) != JobStatus.COMPLETED:
+                        state.set_job(square, JobStatus.COMPLETED)
                     continue
 
-                squares = Sudoku.return_square(square, grid.grid)
-                logging.info(f"History: {self.squares_history}, and squares: {squares}")
-                if str(squares) in self.squares_history:
-                    logging.info(f"Square {square} already solved")
-                    logging.info(
-                        f"Replacing square {square} with {self.squares_history[str(squares)]}"
-                    )
-                    solved_square: list[list[int]] = json.loads(str(squares))
-                    Sudoku.replace_square(square, solved_square, grid.grid)
-                if (
-                    job[0] == JobStatus.PENDING
-                    and len(self.get_addresses_of_free_nodes(sudoku_id)) != 0
+                open_nodes = [n for n in free if len(batches[n]) < self.batch_size]
+                if state.status(square) != JobStatus.PENDING or not open_nodes:
+                    continue
+
+                # A crossing square still being filled would change this square's context
+                key = SquareMemo.key(square, grid.grid)
+                cached = None
+                if not self.has_crossing_work(sudoku_id, square) and (
+                    (cached := self.memo.get(key)) is not None
                 ):
-                    node = self.get_addresses_of_free_nodes(sudoku_id)[0]
+                    filled = copy.deepcopy(grid.grid)
+                    Sudoku.replace_square(square, cached, filled)
+                    # A cached fill fits its context, but exact solving also needs it to be part of a solution
+                    if engine == Engine.DLX and dlx.count_solutions(filled, 1) == 0:
+                        log.event("square.memo_rejected", id=sudoku_id, square=square)
+                        cached = None
+                if cached is not None:
+                    log.event("square.memo_hit", id=sudoku_id, square=square)
+                    Sudoku.replace_square(square, cached, grid.grid)
+                    state.set_job(square, JobStatus.COMPLETED, self.address)
+                    # Replicas only hear of completed squares through WorkComplete
+                    self.disseminate(
+                        WorkComplete(
+                            sudoku_id,
+                            grid,
+                            square,
+                            self.solved_counter.state(),
+                            self.validations_counter.state(),
+                        )
+                    )
+                    continue
 
-                    logging.info(f"Sending job {square} to {node} with grid\n{grid}")
+                memo_keys.add((square, key))
+                node = open_nodes[0]
+                if not state.claim_job(square, node):
+                    continue
+                batches[node].append(square)
+                self.router.dispatched(sudoku_id, square, node, self.clock.monotonic())
 
-                    self.sudokus[sudoku_id][1][square] = (
-                        JobStatus.IN_PROGRESS,
-                        node,
-                    )
+                log.event(
+                    "work.dispatched",
+                    id=sudoku_id,
+                    job=square,
+                    node=AddressUtils.address_to_str(node),
+                )
 
-                    if node == self.address:
-                        self.handle_work_request(
-                            self.socket,
-                            WorkRequest(
-                                sudoku_id,
-                                grid,
-                                self.sudokus[sudoku_id][1],
-                                square,
-                            ),
-                            self_call=True,
-                        )
-                    else:
-                        P2PProtocol.send_msg(
-                            self.neighbors[node][0],
-                            WorkRequest(
-                                sudoku_id,
-                                grid,
-                                self.sudokus[sudoku_id][1],
-                                square,
-                            ),
-                        )
-                    break
+            if not any(batches.values()):
+                # Nothing to dispatch until a job completes, or is given back by a leaving node
+                state.wait_for_change(version, 0.1, self.clock)
+                continue
 
-        logging.info(f"{sudoku_id} solved: {self.sudokus[sudoku_id][0]}")
-        for square in range(9):
-            squares = Sudoku.return_square(square, copy_grid)
-            self.squares_history[json.dumps(squares)] = Sudoku.return_square(
-                square, grid.grid
-            )
-        if not self.sudokus[sudoku_id][0].check():
+            # This node is last in `free`, so others get their batches before it works on its own
+            for node, squares in batches.items():
+                if not squares:
+                    continue
+                message = WorkBatch(
+                    {sudoku_id: (grid, state.jobs(), engine)},
+                    [(sudoku_id, square) for square in squares],
+                )
+                if node == self.address:
+                    self.handle_work_batch(self.socket, message, self_call=True)
+                else:
+                    self.send(self.neighbors[node][0], message)
+
+        log.event(
+            "sudoku.solved",
+            id=sudoku_id,
+            grid=lambda: copy.deepcopy(state.sudoku.grid),
+        )
+        if not state.sudoku.is_solved():
             return None
 
-        self.solved += 1
-        for sock in [n[0] for n in self.neighbors.values()]:
-            P2PProtocol.send_msg(
-                sock,
-                SudokuSolved(sudoku_id, self.sudokus[sudoku_id][0], self.address),
-            )
-        return self.sudokus[sudoku_id][0].grid
-
-    def get_addresses_of_free_nodes(self, sudoku_id: str) -> list[Address]:
-        all_nodes = set(self.neighbors.keys())
-        all_nodes.add(self.address)
-        return list(
-            all_nodes
-            - set(
-                [
-                    job[1]
-                    for job in self.sudokus[sudoku_id][1]
-                    if job[0] == JobStatus.IN_PROGRESS
-                ]
+        for square, key in memo_keys:
+            self.memo.put(key, Sudoku.return_square(square, grid.grid))
+
+        self.solved_counter.increment(self.address)
+        self.disseminate(
+            SudokuSolved(
+                sudoku_id, state.sudoku, self.address, self.solved_counter.state()
             )
         )
+        return state.sudoku.grid
+
+    def waiting_jobs(self, sudoku_id: str) -> list[int]:
+        """Squares of a puzzle this node splits that still need a node."""
+        state = self.sudokus.get(sudoku_id)
+        if state is None:
+            return []
+        grid = state.sudoku.grid
+        return [
+            square
+            for square in range(state.sudoku.size)
+            if state.status(square) == JobStatus.PENDING
+            and Sudoku.get_number_of_zeros_in_square(square, grid) > 0
+        ]
+
+    def balance(self):
+        """
+        Advertise this node's spare capacity and waiting jobs, and, if it has capacity to spare,
+        pull jobs from the neighbor with the most waiting ones. Also takes back jobs whose lease ran out.
+        Runs on the selector thread, every `BALANCE_INTERVAL` seconds.
+        """
+        now = self.clock.monotonic()
+        load = sum(len(self.waiting_jobs(id)) for id in list(self.dispatching))
+        with self.jobs_lock:
+            capacity = 0 if load else max(0, self.job_slots - self.jobs_running)
+
+        # 0, 1, 2-3, 4-7... so that each job dispatched doesn't go out
+        level = load.bit_length()
+        if level != self.offer_level or (load and now - self.offered_at >= 1):
+            self.offer(capacity, load)
+            self.offer_level, self.offered_at = level, now
+
+        if capacity:
+            self.steal(capacity)
+
+        for (sudoku_id, job), (node, deadline) in list(self.leases.items()):
+            if deadline > now:
+                continue
+            del self.leases[(sudoku_id, job)]
+            state = self.sudokus.get(sudoku_id)
+            if state is not None and state.release_job(job, node):
+                self.leases_expired += 1
+                log.event(
+                    "work.lease_expired",
+                    id=sudoku_id,
+                    job=job,
+                    node=AddressUtils.address_to_str(node),
+                )
+
+    def offer(self, capacity: int, load: int):
+        """
+        Tell a few random neighbors of this node's waiting jobs, plus those told before,
+        which must hear once none are left, or they would keep trying to steal them.
+        """
+        told = {addr for addr in self.offered_to if addr in self.neighbors}
+        if load:
+            others = sorted(addr for addr in self.neighbors if addr not in told)
+            told.update(random.sample(others, min(OFFER_FANOUT, len(others))))
+
+        frame = P2PProtocol.encode(WorkOffer(capacity, load))
+        for addr in sorted(told):
+            self.send_frame(self.neighbors[addr][0], frame, WorkOffer.__name__)
+        self.offered_to = told if load else set()
+
+    def steal(self, capacity: Optional[int] = None):
+        """Ask the neighbor with the most waiting jobs for some, unless a request is still unanswered."""
+        now = self.clock.monotonic()
+        if self.stealing_from is not None and self.stealing_from[1] > now:
+            return
+        if capacity is None:
+            with self.jobs_lock:
+                capacity = max(0, self.job_slots - self.jobs_running)
+            if not capacity or any(
+                self.waiting_jobs(id) for id in list(self.dispatching)
+            ):
+                return
+
+        loaded = [
+            (load, addr)
+            for addr, load in self.loads.items()
+            if load > 0 and addr in self.neighbors
+        ]
+        if loaded:
+            _, addr = max(loaded)
+            self.send(self.neighbors[addr][0], WorkSteal(capacity))
+            self.stealing_from = (addr, now + 0.1)
+
+    def handle_work_steal(self, conn: socket.socket, data: WorkSteal):
+        """Give waiting jobs to an idle node, the ones of the puzzles with the most of them first."""
+        thief = self.get_address_from_socket(conn)
+        puzzles = sorted(
+            ((self.waiting_jobs(id), id) for id in list(self.dispatching)),
+            key=lambda p: -len(p[0]),
+        )
+        units: list[tuple[str, int]] = []
+        for jobs, sudoku_id in puzzles:
+            state = self.sudokus[sudoku_id]
+            if thief in state.busy_nodes():
+                # Work sent with the puzzle's newer grid would cancel the job the thief is doing
+                continue
+            for job in jobs:
+                if len(units) >= data.capacity:
+                    break
+                if not state.claim_job(job, thief):
+                    continue
+                now = self.clock.monotonic()
+                self.leases[(sudoku_id, job)] = (thief, now + self.lease_time)
+                self.router.dispatched(sudoku_id, job, thief, now)
+                self.stolen += 1
+                units.append((sudoku_id, job))
+                log.event(
+                    "work.stolen",
+                    id=sudoku_id,
+                    job=job,
+                    node=AddressUtils.address_to_str(thief),
+                )
+        if not units:
+            return
+
+        # A single batch, even for jobs of several puzzles
+        self.send(
+            conn,
+            WorkBatch(
+                {
+                    sudoku_id: (
+                        self.sudokus[sudoku_id].sudoku,
+                        self.sudokus[sudoku_id].jobs(),
+                        self.dispatching.get(sudoku_id, Engine.RANDOM),
+                    )
+                    for sudoku_id in dict.fromkeys(id for id, _ in units)
+                },
+                units,
+                self.lease_time,
+            ),
+        )
+
+    def stealing_stats(self) -> dict[str, int]:
+        with self.jobs_lock:
+            running = self.jobs_running
+        return {
+            "jobs_running": running,
+            "stolen": self.stolen,
+            "taken": self.taken,
+            "leases": len(self.leases),
+            "leases_expired": self.leases_expired,
+        }
+
+    def get_addresses_of_free_nodes(
+        self, sudoku_id: str, among: Optional[list[Address]] = None
+    ) -> list[Address]:
+        if among is not None and any(addr in self.neighbors for addr in among):
+            free = self.get_addresses_of_free_nodes(sudoku_id)
+            return [addr for addr in free if addr in among]
+
+        busy = self.sudokus[sudoku_id].busy_nodes()
+        # Sorted, so the same state always gets the same choice (e.g. when simulated from a seed)
+        free = sorted(
+            addr
+            for addr in self.neighbors.keys()
+            if addr not in busy and not self.is_congested(addr)
+        )
+        if self.address not in busy:
+            # Last, since this node's own jobs run on the dispatching thread
+            free.append(self.address)
+        return free
+
+    def has_crossing_work(self, sudoku_id: str, square: int) -> bool:
+        """Whether a square sharing rows or columns with this one has a job in progress."""
+        state = self.sudokus[sudoku_id]
+        box = state.sudoku.box
+        return any(
+            status == JobStatus.IN_PROGRESS
+            and (other // box == square // box or other % box == square % box)
+            for other, status in enumerate(state.statuses)
+            if other != square
+        )
+
+    def get_idle_neighbors(self) -> list[Address]:
+        """Neighbors with no job in progress and no race entry, for any sudoku."""
+        busy = set()
+        for state in list(self.sudokus.values()):
+            busy |= state.busy_nodes()
+        for race in self.races.values():
+            busy |= race.remote
+        return [
+            addr
+            for addr in self.neighbors.keys()
+            if addr not in busy and not self.is_congested(addr)
+        ]
 
     def get_address_from_executed_nodes(self, sudoku_id: str):
+        state = self.sudokus[sudoku_id]
         return [
-            job[1] for job in self.sudokus[sudoku_id][1] if job[0] == JobStatus.PENDING
+            node
+            for status, node in zip(state.statuses, state.assignees)
+            if status == JobStatus.PENDING
         ]
 
     def get_address_from_socket(self, conn: socket.socket) -> Address:
         return [k for (k, v) in self.neighbors.items() if v[0] == conn][0]
 
     def cancel_disconnecting_node_jobs(self, addr: Address):
-        for id, sudoku in self.sudokus.items():
-            for i, job in enumerate(sudoku[1]):
-                if job[0] == JobStatus.IN_PROGRESS and job[1] == addr:
-                    self.sudokus[id][1][i] = (JobStatus.PENDING, addr)
+        for state in list(self.sudokus.values()):
+            state.release_jobs_of(addr)
 
     def is_sudoku_completed(self, id: str):
-        return all([job[0] == JobStatus.COMPLETED for job in self.sudokus[id][1]])
+        return self.sudokus[id].is_completed()
 
     def update_sudoku_with_new_values(
         self, sudoku_id: str, new_grid: sudoku_type, job: int
     ):
-        rows_idx = [i + ((job // 3) * 3) for i in range(3)]
-        cols_idx = [i + ((job % 3) * 3) for i in range(3)]
+        box = Sudoku.box_size(new_grid)
+        start_row, start_col = Sudoku.square_origin(job, new_grid)
+        rows_idx = [i + start_row for i in range(box)]
+        cols_idx = [i + start_col for i in range(box)]
 
-        for row in rows_idx:
-            for col in cols_idx:
-                self.sudokus[sudoku_id][0].grid[row][col] = new_grid[row][col]
+        state = self.sudokus[sudoku_id]
+        with state.lock:
+            for row in rows_idx:
+                for col in cols_idx:
+                    state.sudoku.grid[row][col] = new_grid[row][col]
 
     def send_keep_alive_to_neighbors(self):
-        while True:
-            time.sleep(1)
-            for sock in [n[0] for n in self.neighbors.values()]:
-                P2PProtocol.send_msg(sock, KeepAlive())
+        while not self.stopped.wait(1):
+            self.broadcast(
+                KeepAlive(
+                    self.solved_counter.state(), self.validations_counter.state()
+                ),
+                droppable=True,
+            )
 
     def check_keep_alive_from_neighbors(self):
-        while True:
+        while not self.stopped.wait(0.5):
             current = time.time()
-            for addr, (conn, _, last_beat) in self.neighbors.items():
+            for addr, (conn, last_beat) in list(self.neighbors.items()):
                 if current - last_beat > 3:
-                    logging.warning(
-                        f"Node {AddressUtils.address_to_str(addr)} is dead. Disconnecting..."
-                    )
-                    self.disconnect_node(conn)
+                    log.event("node.dead", node=AddressUtils.address_to_str(addr))
+                    self.call_later(0, self.disconnect_node, conn)
 
     def run(self):
         threading.Thread(target=self.send_keep_alive_to_neighbors, daemon=True).start()
@@ -458,9 +1677,49 @@ class P2PServer:
 
         if self.parent is not None:
             self.connect_to_node(AddressUtils.str_to_address(self.parent), parent=True)
+        self.update_readiness()
+        self.call_later(min(5.0, self.retention / 4), self.keep_expiring)
+        self.call_later(BALANCE_INTERVAL, self.keep_balancing)
 
-        while True:
-            events = self.sel.select()
-            for key, _ in events:
-                callback = key.data
-                callback(key.fileobj)
+        while not self.stopped.is_set():
+            events = self.sel.select(self.run_timers())
+            for key, mask in events:
+                if key.fileobj in self.connecting:
+                    self.finish_connect(key.fileobj)
+                    continue
+                if mask & selectors.EVENT_WRITE and key.fileobj in self.writing:
+                    self.write(key.fileobj)
+                if mask & selectors.EVENT_READ and key.fileobj.fileno() != -1:
+                    callback = key.data
+                    callback(key.fileobj)
+
+        self.close()
+
+    def keep_balancing(self):
+        self.balance()
+        self.call_later(BALANCE_INTERVAL, self.keep_balancing)
+
+    def stop(self):
+        """Make `run` return, closing every socket. Safe to call from any thread."""
+        self.stopped.set()
+        self.wake_up()
+
+    def close(self):
+        for conn in [*self.connecting, *(n[0] for n in self.neighbors.values())]:
+            conn.close()
+        for link in self.shm.values():
+            link.close()
+        self.shm.clear()
+        self.connecting.clear()
+        self.neighbors.clear()
+        self.outboxes.clear()
+        self.writing.clear()
+        for inbox in self.inboxes.values():
+            inbox.close()
+        self.inboxes.clear()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.sel.close()
+        self.socket.close()
+        self.waker.close()
+        self.waker_writer.close()
@@ -0,0 +1,220 @@
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Any, Optional
+
+import dlx
+import solver
+from consts import Strategy
+from custom_types import Address, sudoku_type
+from events import EventLogger
+from validate import validate_batch
+
+log = EventLogger("portfolio")
+
+_context = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def run_strategy(
+    strategy: Strategy, grid: sudoku_type, seed: int
+) -> Optional[sudoku_type]:
+    """Solve the whole grid with the given strategy."""
+    if strategy == Strategy.DLX:
+        return dlx.solve(grid)
+    if strategy == Strategy.RESTARTS:
+        return solver.solve_with_restarts(grid, seed)
+    return solver.solve(grid)
+
+
+def _strategy_process(
+    results: multiprocessing.Queue, tag: int, strategy: Strategy, grid, seed: int
+):
+    start = time.perf_counter()
+    solution = run_strategy(strategy, grid, seed)
+    results.put((tag, solution, time.perf_counter() - start))
+
+
+def is_solution_of(grid: sudoku_type, solution: Optional[sudoku_type]) -> bool:
+    """Check that the solution is valid and keeps every clue of the grid."""
+    if solution is None or len(solution) != len(grid):
+        return False
+    if any(
+        value != 0 and value != solution[i][j]
+        for i, row in enumerate(grid)
+        for j, value in enumerate(row)
+    ):
+        return False
+    return bool(validate_batch([solution])[0])
+
+
+def puzzle_features(grid: sudoku_type) -> dict[str, Any]:
+    """Features of a puzzle that race outcomes are logged against."""
+    size = len(grid)
+    clues = sum(1 for row in grid for value in row if value != 0)
+    return {"size": size, "clues": clues, "fill": round(clues / (size * size), 3)}
+
+
+class Race:
+    """
+    A race between several strategies on the same grid, run in local processes
+    and on remote nodes. The first verified solution wins.
+
+    :param id: Sudoku UUID.
+    :type id: str
+    :param grid: Sudoku grid to solve.
+    :type grid: sudoku_type
+    """
+
+    def __init__(self, id: str, grid: sudoku_type):
+        self.id = id
+        self.grid = grid
+        self.started = time.perf_counter()
+        self.winner: Optional[sudoku_type] = None
+        self.winner_entry: Optional[dict[str, Any]] = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+        # tag -> {"strategy", "where", "seed"}
+        self.entries: dict[int, dict[str, Any]] = {}
+        self.finishers: list[dict[str, Any]] = []
+        self.remote: set[Address] = set()
+        self.processes: dict[int, multiprocessing.Process] = {}  # By tag
+        self.reported: set[int] = set()  # Tags of the entries that finished
+        self.pending: list[tuple[int, Strategy, sudoku_type, int]] = []  # Local entries
+        self.results: Optional[multiprocessing.Queue] = None
+
+    def add_entry(self, strategy: Strategy, where: str, seed: int) -> int:
+        tag = len(self.entries)
+        self.entries[tag] = {"strategy": strategy, "where": where, "seed": seed}
+        return tag
+
+    def add_local(
+        self,
+        strategy: Strategy,
+        seed: int,
+        where: str = "local",
+        grid: Optional[sudoku_type] = None,
+    ) -> int:
+        """Enter a strategy to run in a local process once the race starts, on the race's grid or a part of its search (e.g. a subtree)."""
+        tag = self.add_entry(strategy, where, seed)
+        self.pending.append((tag, strategy, grid or self.grid, seed))
+        return tag
+
+    def start(self):
+        """
+        Run the local entries, each in a new process. Every entry, local or remote, must be added first:
+        the race is over once all of them finished, so one added later could be missed.
+        """
+        if self.pending and self.results is None:
+            self.results = _context.Queue()
+            threading.Thread(target=self._collect, daemon=True).start()
+
+        for tag, strategy, grid, seed in self.pending:
+            process = _context.Process(
+                target=_strategy_process,
+                args=(self.results, tag, strategy, grid, seed),
+                daemon=True,
+            )
+            process.start()
+            self.processes[tag] = process
+        self.pending = []
+
+    def _collect(self):
+        while not self.done.is_set():
+            try:
+                tag, solution, elapsed = self.results.get(timeout=0.05)
+            except queue.Empty:
+                # A process that puts its result exits with 0, one that crashed never will
+                for tag, process in list(self.processes.items()):
+                    if tag not in self.reported and process.exitcode not in (None, 0):
+                        log.event(
+                            "race.entry_died", id=self.id, exitcode=process.exitcode
+                        )
+                        self.submit(tag, None)
+                continue
+            self.submit(tag, solution, elapsed)
+
+    def submit(
+        self, tag: int, solution: Optional[sudoku_type], elapsed: Optional[float] = None
+    ) -> bool:
+        """Record a strategy's result, returning True if it won the race. Only an entry's first result counts."""
+        entry = self.entries[tag]
+        valid = is_solution_of(self.grid, solution)
+
+        with self.lock:
+            if tag in self.reported:
+                return False
+            self.reported.add(tag)
+            self.finishers.append(
+                {
+                    **entry,
+                    "solved": valid,
+                    "elapsed": elapsed,
+                    "finished_at": time.perf_counter() - self.started,
+                }
+            )
+            won = valid and self.winner is None and not self.cancelled
+            if won:
+                self.winner = solution
+                self.winner_entry = entry
+            if won or len(self.finishers) == len(self.entries):
+                self.done.set()
+
+        if solution is not None and not valid:
+            log.event(
+                "race.invalid_solution",
+                id=self.id,
+                strategy=str(entry["strategy"]),
+                where=str(entry["where"]),
+            )
+        return won
+
+    def abandon(self, where: str):
+        """Finish the entries run at a node that left, without a solution, so the race doesn't wait for them."""
+        for tag, entry in list(self.entries.items()):
+            if entry["where"] == where:
+                self.submit(tag, None)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[sudoku_type]:
+        """The winning solution, if any, once the race is over or the timeout ran out."""
+        if not self.done.wait(timeout):
+            log.event(
+                "race.timed_out",
+                id=self.id,
+                entries=len(self.entries),
+                finished=len(self.reported),
+            )
+        return self.winner
+
+    def cancel(self):
+        """Stop the race, killing local processes that are still running."""
+        with self.lock:
+            self.cancelled = self.winner is None
+        self.done.set()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(0.1)
+
+    def outcome(self) -> dict[str, Any]:
+        """Summary of the race, to tune which strategy to launch first."""
+        return {
+            "id": self.id,
+            "features": puzzle_features(self.grid),
+            "winner": (
+                {k: str(v) for k, v in self.winner_entry.items()}
+                if self.winner_entry
+                else None
+            ),
+            "elapsed": round(time.perf_counter() - self.started, 6),
+            "entries": len(self.entries),
+            "finishers": [
+                {k: (str(v) if k in ("strategy", "where") else v) for k, v in f.items()}
+                for f in self.finishers
+            ],
+        }
@@ -4,10 +4,13 @@ from enum import Enum
 from socket import socket
 from typing import Optional
 
-from consts import Command
-from custom_types import Address, jobs_structure, sudoku_type
+from consts import Command, Engine, Strategy
+from custom_types import Address, counter_type, jobs_structure, sudoku_type
 from sudoku import Sudoku
 
+# Frame length prefix, in bytes. 4 bytes fit 16x16 and 25x25 grids with their job lists.
+HEADER_SIZE = 4
+
 
 class Message(ABC):
     """
@@ -55,36 +58,78 @@ class JoinParent(Message):
     """
     When the node is created and a parent is specified,
     send a request to that parent, to get the list of all nodes in the network.
+
+    :param address: Address of the node requesting to join.
+    :type address: Address
+    :param host: Host the node runs on, to detect nodes on the same host.
+    :type host: Optional[str]
+    :param ring: Shared memory ring the node reads from, offered to nodes on the same host.
+    :type ring: Optional[str]
     """
 
-    def __init__(self, address: Address):
+    def __init__(
+        self, address: Address, host: Optional[str] = None, ring: Optional[str] = None
+    ):
         super().__init__(Command.JOIN_PARENT)
         self.address = address
+        self.host = host
+        self.ring = ring
 
 
 class JoinParentResponse(Message):
     """
     Response to the JoinParent message.
-    It contains the list of all nodes in the network.
+    It contains the list of all nodes in the network, with their stats,
+    so the new node is up to date without waiting for each JoinOtherResponse.
 
     :param nodes: List of all nodes in the network.
     :type nodes: list[Address]
+    :param address: Address of the parent, as known by the other nodes.
+    :type address: Address
+    :param solved: Solved puzzles counter, by node.
+    :type solved: counter_type
+    :param validations: Validations counter, by node.
+    :type validations: counter_type
+    :param ring: Shared memory ring the parent reads from, if it took the offered one.
+    :type ring: Optional[str]
     """
 
-    def __init__(self, nodes: list[Address]):
+    def __init__(
+        self,
+        nodes: list[Address],
+        address: Address,
+        solved: counter_type,
+        validations: counter_type,
+        ring: Optional[str] = None,
+    ):
         super().__init__(Command.JOIN_PARENT_RESPONSE)
         self.nodes: list[Address] = nodes
+        self.address = address
+        self.solved = solved
+        self.validations = validations
+        self.ring = ring
 
 
 class JoinOther(Message):
     """
     After getting the nodes list from the parent (JoinParentResponse message),
     send this message to each one of them, to get their stats.
+
+    :param address: Address of the node requesting to join.
+    :type address: Address
+    :param host: Host the node runs on, to detect nodes on the same host.
+    :type host: Optional[str]
+    :param ring: Shared memory ring the node reads from, offered to nodes on the same host.
+    :type ring: Optional[str]
     """
 
-    def __init__(self, address: Address):
+    def __init__(
+        self, address: Address, host: Optional[str] = None, ring: Optional[str] = None
+    ):
         super().__init__(Command.JOIN_OTHER)
         self.address = address
+        self.host = host
+        self.ring = ring
 
 
 class JoinOtherResponse(Message):
@@ -92,26 +137,43 @@ class JoinOtherResponse(Message):
     Response to the JoinOther message.
     It contains the node's stats: solved puzzles and number of validations.
 
-    :param solved: Number of solved puzzles.
-    :type solved: int
-    :param validations: Number of validations.
-    :type validations: int
+    :param solved: Solved puzzles counter, by node.
+    :type solved: counter_type
+    :param validations: Validations counter, by node.
+    :type validations: counter_type
+    :param ring: Shared memory ring the node reads from, if it took the offered one.
+    :type ring: Optional[str]
     """
 
-    def __init__(self, solved: int, validations: int):
+    def __init__(
+        self,
+        solved: counter_type,
+        validations: counter_type,
+        ring: Optional[str] = None,
+    ):
         super().__init__(Command.JOIN_OTHER_RESPONSE)
         self.solved = solved
         self.validations = validations
+        self.ring = ring
 
 
 class KeepAlive(Message):
     """
     Ping message.
     Probably to be used in a scheduled timing.
+
+    It carries the stats counters, so nodes that missed an update converge anyway.
+
+    :param solved: Solved puzzles counter, by node.
+    :type solved: counter_type
+    :param validations: Validations counter, by node.
+    :type validations: counter_type
     """
 
-    def __init__(self):
+    def __init__(self, solved: counter_type, validations: counter_type):
         super().__init__(Command.KEEP_ALIVE)
+        self.solved = solved
+        self.validations = validations
 
 
 class WorkRequest(Message):
@@ -127,14 +189,28 @@ class WorkRequest(Message):
     :type jobs: jobs_structure
     :param job: Job (aka square) number.
     :type job: int
+    :param engine: Solver engine to run the job with.
+    :type engine: Engine
+    :param lease: Seconds after which the coordinator gives the job to another node, for stolen jobs.
+    :type lease: Optional[float]
     """
 
-    def __init__(self, id: str, sudoku: Sudoku, jobs: jobs_structure, job: int):
+    def __init__(
+        self,
+        id: str,
+        sudoku: Sudoku,
+        jobs: jobs_structure,
+        job: int,
+        engine: Engine = Engine.RANDOM,
+        lease: Optional[float] = None,
+    ):
         super().__init__(Command.WORK_REQUEST)
         self.id = id
         self.sudoku = sudoku
         self.jobs = jobs
         self.job = job
+        self.engine = engine
+        self.lease = lease
 
 
 class WorkAck(Message):
@@ -158,8 +234,7 @@ class WorkComplete(Message):
     The job is complete.
     This message may be sent to all nodes (or just the one who requested? Let's see)
 
-    It includes the number of validations, for updating the stats.
-    Only validations are needed, the solved number is implicitly +1.
+    It includes the stats counters, for updating the stats.
 
     :param id: Sudoku UUID.
     :type id: str
@@ -167,15 +242,25 @@ class WorkComplete(Message):
     :type sudoku: Sudoku
     :param job: Job (aka square) number.
     :type job: int
-    :param validations: Number of validations.
-    :type validations: int
+    :param solved: Solved puzzles counter, by node.
+    :type solved: counter_type
+    :param validations: Validations counter, by node.
+    :type validations: counter_type
     """
 
-    def __init__(self, id: str, sudoku: Sudoku, job: int, validations: int):
+    def __init__(
+        self,
+        id: str,
+        sudoku: Sudoku,
+        job: int,
+        solved: counter_type,
+        validations: counter_type,
+    ):
         super().__init__(Command.WORK_COMPLETE)
         self.id = id
         self.sudoku = sudoku
         self.job = job
+        self.solved = solved
         self.validations = validations
 
 
@@ -190,6 +275,8 @@ class SudokuSolved(Message):
     :type sudoku: Sudoku
     :param address: Address of the node that got the HTTP request.
     :type address: Address
+    :param solved: Solved puzzles counter, by node, including this Sudoku.
+    :type solved: counter_type
     """
 
     def __init__(
@@ -197,11 +284,222 @@ class SudokuSolved(Message):
         id: str,
         sudoku: Sudoku,
         address: Address,
+        solved: counter_type,
     ):
         super().__init__(Command.SUDOKU_SOLVED)
         self.id = id
         self.sudoku = sudoku
         self.address = address
+        self.solved = solved
+
+
+class SolveRequest(Message):
+    """
+    Run a solver strategy on a whole Sudoku, as an entry of a portfolio race.
+
+    :param id: Sudoku UUID.
+    :type id: str
+    :param grid: Sudoku grid.
+    :type grid: sudoku_type
+    :param strategy: Strategy to run.
+    :type strategy: Strategy
+    :param seed: Random seed, for randomized strategies.
+    :type seed: int
+    :param tag: Race entry number, to be sent back in SolveResult.
+    :type tag: int
+    """
+
+    def __init__(
+        self, id: str, grid: sudoku_type, strategy: Strategy, seed: int, tag: int
+    ):
+        super().__init__(Command.SOLVE_REQUEST)
+        self.id = id
+        self.grid = grid
+        self.strategy = strategy
+        self.seed = seed
+        self.tag = tag
+
+
+class SolveResult(Message):
+    """
+    Result of a SolveRequest.
+
+    :param id: Sudoku UUID.
+    :type id: str
+    :param tag: Race entry number.
+    :type tag: int
+    :param grid: Solved grid, or None if the strategy found no solution.
+    :type grid: Optional[sudoku_type]
+    :param elapsed: Time spent by the strategy, in seconds.
+    :type elapsed: Optional[float]
+    """
+
+    def __init__(
+        self,
+        id: str,
+        tag: int,
+        grid: Optional[sudoku_type],
+        elapsed: Optional[float],
+    ):
+        super().__init__(Command.SOLVE_RESULT)
+        self.id = id
+        self.tag = tag
+        self.grid = grid
+        self.elapsed = elapsed
+
+
+class SolveCancel(Message):
+    """
+    The portfolio race is over, stop solving.
+
+    :param id: Sudoku UUID.
+    :type id: str
+    """
+
+    def __init__(self, id: str):
+        super().__init__(Command.SOLVE_CANCEL)
+        self.id = id
+
+
+class Relay(Message):
+    """
+    Envelope of a cluster-wide broadcast (e.g. StoreSudoku or SudokuSolved),
+    relayed by each node to its children in a spanning tree of the members.
+
+    :param id: Broadcast UUID, for duplicate suppression.
+    :type id: str
+    :param origin: Address of the node that started the broadcast.
+    :type origin: Address
+    :param members: Nodes the broadcast is for, in the origin's view, from which the tree is built.
+    :type members: list[Address]
+    :param payload: Message being broadcast.
+    :type payload: Message
+    """
+
+    def __init__(
+        self, id: str, origin: Address, members: list[Address], payload: Message
+    ):
+        super().__init__(Command.RELAY)
+        self.id = id
+        self.origin = origin
+        self.members = members
+        self.payload = payload
+
+
+class WorkOffer(Message):
+    """
+    Sent periodically to every neighbor, so idle nodes can find loaded coordinators to steal from.
+
+    :param capacity: Jobs the node can take on now.
+    :type capacity: int
+    :param load: Jobs of the puzzles it coordinates that no node took yet.
+    :type load: int
+    """
+
+    def __init__(self, capacity: int, load: int):
+        super().__init__(Command.WORK_OFFER)
+        self.capacity = capacity
+        self.load = load
+
+
+class WorkSteal(Message):
+    """
+    Sent by a node with spare capacity to a loaded coordinator,
+    which answers with a leased WorkBatch of some of its waiting jobs, if it still has any.
+
+    :param capacity: Jobs the node can take on now.
+    :type capacity: int
+    """
+
+    def __init__(self, capacity: int):
+        super().__init__(Command.WORK_STEAL)
+        self.capacity = capacity
+
+
+class WorkBatch(Message):
+    """
+    Send several jobs to a node at once, possibly of several puzzles,
+    with a single snapshot of each puzzle's grid and jobs, instead of one WorkRequest per job.
+
+    :param puzzles: Grid, jobs status and solver engine of each puzzle the jobs are part of, by Sudoku UUID.
+    :type puzzles: dict[str, tuple[Sudoku, jobs_structure, Engine]]
+    :param units: Jobs to do, in order, as (Sudoku UUID, job number).
+    :type units: list[tuple[str, int]]
+    :param lease: Seconds after which the coordinator gives the jobs to another node, for stolen jobs.
+    :type lease: Optional[float]
+    """
+
+    def __init__(
+        self,
+        puzzles: dict[str, tuple[Sudoku, jobs_structure, Engine]],
+        units: list[tuple[str, int]],
+        lease: Optional[float] = None,
+    ):
+        super().__init__(Command.WORK_BATCH)
+        self.puzzles = puzzles
+        self.units = units
+        self.lease = lease
+
+
+class WorkBatchAck(Message):
+    """
+    Acknowledge WorkBatch message.
+
+    :param units: Jobs of the batch, as (Sudoku UUID, job number).
+    :type units: list[tuple[str, int]]
+    """
+
+    def __init__(self, units: list[tuple[str, int]]):
+        super().__init__(Command.WORK_BATCH_ACK)
+        self.units = units
+
+
+class WorkBatchComplete(Message):
+    """
+    The jobs of a batch are complete. Sent to all nodes, as WorkComplete, once for the whole batch.
+
+    :param results: Grid of each puzzle, with the squares of the batch filled, and the jobs completed, by Sudoku UUID.
+    :type results: dict[str, tuple[Sudoku, list[int]]]
+    :param solved: Solved puzzles counter, by node.
+    :type solved: counter_type
+    :param validations: Validations counter, by node.
+    :type validations: counter_type
+    """
+
+    def __init__(
+        self,
+        results: dict[str, tuple[Sudoku, list[int]]],
+        solved: counter_type,
+        validations: counter_type,
+    ):
+        super().__init__(Command.WORK_BATCH_COMPLETE)
+        self.results = results
+        self.solved = solved
+        self.validations = validations
+
+
+class WorkReturn(Message):
+    """
+    Give jobs back to their coordinator, e.g. when newer work for the puzzle replaced its grid
+    while they were being done, so that they are dispatched again.
+
+    :param units: Jobs given back, as (Sudoku UUID, job number).
+    :type units: list[tuple[str, int]]
+    """
+
+    def __init__(self, units: list[tuple[str, int]]):
+        super().__init__(Command.WORK_RETURN)
+        self.units = units
+
+
+class Doorbell(Message):
+    """
+    Sent on the socket of a neighbor on the same host,
+    after frames were written to the shared memory ring it reads from.
+    """
+
+    def __init__(self):
+        super().__init__(Command.DOORBELL)
 
 
 class P2PProtocol:
@@ -213,26 +511,70 @@ class P2PProtocol:
     ) -> None:
         """Sends a message to the broker based on the command type."""
         try:
-            msg = pickle.dumps(message)
-            header = len(msg).to_bytes(2, byteorder="big")
-            connection.send(header + msg)
+            connection.sendall(cls.encode(message))
         except Exception as e:
             raise P2PProtocolBadFormat(f"Error sending message: {e}")
 
     @classmethod
-    def recv_msg(cls, connection: socket) -> Optional[Message]:
-        """Receives through a connection a Message object."""
+    def encode(cls, message: Message) -> bytes:
+        """Encodes a message into a length-prefixed frame."""
         try:
-            h = int.from_bytes(connection.recv(2), "big")
+            msg = pickle.dumps(message)
+            return len(msg).to_bytes(HEADER_SIZE, byteorder="big") + msg
+        except Exception as e:
+            raise P2PProtocolBadFormat(f"Error encoding message: {e}")
 
-            if h == 0:
-                return None
+    @classmethod
+    def decode(cls, frame: bytes | memoryview) -> Message:
+        """Decodes a length-prefixed frame, as made by ``encode``."""
+        try:
+            return pickle.loads(frame[HEADER_SIZE:])
+        except Exception as e:
+            raise P2PProtocolBadFormat(f"Error decoding message: {e}")
+
+    @classmethod
+    def decode_frames(
+        cls, view: memoryview, frames: Optional[list[bytes]] = None
+    ) -> tuple[list[Message], int]:
+        """
+        Decodes the complete frames at the start of a buffer, returning them and how many bytes they took.
+        If a list is given, a copy of each frame is appended to it (e.g. to record it).
+        """
+        messages = []
+        offset = 0
+        while len(view) - offset >= HEADER_SIZE:
+            size = HEADER_SIZE + int.from_bytes(
+                view[offset : offset + HEADER_SIZE], "big"
+            )
+            if len(view) - offset < size:
+                break
+            messages.append(cls.decode(view[offset : offset + size]))
+            if frames is not None:
+                frames.append(bytes(view[offset : offset + size]))
+            offset += size
+        return messages, offset
 
-            binary = connection.recv(h)
-            return pickle.loads(binary)
+    @classmethod
+    def recv_msgs(
+        cls, connection: socket, inbox, frames: Optional[list[bytes]] = None
+    ) -> Optional[list[Message]]:
+        """
+        Receives what a connection has into its ``connection.RecvBuffer``, returning the messages it completed,
+        or None once the connection is closed. Frames are copied to ``frames`` as in ``decode_frames``.
+        """
+        try:
+            if inbox.fill(connection) == 0:
+                return None
+        except (BlockingIOError, TimeoutError):
+            return []
         except Exception as e:
             raise P2PProtocolBadFormat(f"Error receiving message: {e}")
 
+        with inbox.pending() as view:
+            messages, consumed = cls.decode_frames(view, frames)
+        inbox.consume(consumed)
+        return messages
+
 
 class P2PProtocolBadFormat(Exception):
     """Exception when the source message is not CDProto."""
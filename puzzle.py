@@ -0,0 +1,156 @@
+import threading
+import time
+from typing import Optional
+
+from clock import Clock
+from consts import JobStatus
+from custom_types import Address, jobs_structure, sudoku_type
+from sudoku import Sudoku
+
+
+class PuzzleState:
+    """
+    State of a puzzle known by a node: its grid, the status and assignee of each job (square),
+    the coordinator's address, and the grid as it was first given.
+
+    Job transitions happen in place, under the puzzle's lock, and bump ``version``,
+    so threads waiting for progress (e.g. the coordinator's dispatch loop) can block on ``changed``
+    instead of polling.
+    Once every job is completed, only the grids are kept, and ``completed_at`` starts the retention period.
+
+    :param id: Sudoku UUID.
+    :type id: str
+    :param sudoku: Sudoku being solved.
+    :type sudoku: Sudoku
+    :param coordinator: Address of the node that got the HTTP request.
+    :type coordinator: Optional[Address]
+    :param original: Grid as first given, used to answer repeated requests.
+    :type original: sudoku_type
+    """
+
+    __slots__ = (
+        "id",
+        "sudoku",
+        "coordinator",
+        "original",
+        "statuses",
+        "assignees",
+        "version",
+        "lock",
+        "changed",
+        "updated_at",
+        "completed_at",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        sudoku: Sudoku,
+        coordinator: Optional[Address],
+        original: sudoku_type,
+    ):
+        self.id = id
+        self.sudoku = sudoku
+        self.coordinator = coordinator
+        self.original = original
+        self.statuses: list[JobStatus] = [JobStatus.PENDING] * sudoku.size
+        self.assignees: list[Optional[Address]] = [None] * sudoku.size
+        self.version = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.updated_at = time.monotonic()
+        self.completed_at: Optional[float] = None
+
+    def _bump(self):
+        self.version += 1
+        self.updated_at = time.monotonic()
+        if self.completed_at is None and self.is_completed():
+            self.completed_at = self.updated_at
+            # Nothing is in flight anymore, only the solution is worth keeping
+            self.sudoku.recent_requests.clear()
+        self.changed.notify_all()
+
+    def set_job(self, job: int, status: JobStatus, node: Optional[Address] = None):
+        """Change a job's status, and its assignee if one is given."""
+        with self.lock:
+            self.statuses[job] = status
+            if node is not None:
+                self.assignees[job] = node
+            self._bump()
+
+    def claim_job(self, job: int, node: Address) -> bool:
+        """Assign a pending job to a node, returning False if it's no longer pending."""
+        with self.lock:
+            if self.statuses[job] != JobStatus.PENDING:
+                return False
+            self.statuses[job] = JobStatus.IN_PROGRESS
+            self.assignees[job] = node
+            self._bump()
+            return True
+
+    def load_jobs(self, jobs: jobs_structure):
+        """Take the jobs as sent by the coordinator."""
+        with self.lock:
+            for job, (status, node) in enumerate(jobs):
+                self.statuses[job] = status
+                self.assignees[job] = node
+            self._bump()
+
+    def finish(self, grid: sudoku_type, node: Optional[Address]):
+        """Mark every job as completed, with the solved grid."""
+        with self.lock:
+            self.sudoku.grid = grid
+            for job in range(len(self.statuses)):
+                self.statuses[job] = JobStatus.COMPLETED
+                self.assignees[job] = node
+            self._bump()
+
+    def release_jobs_of(self, node: Address) -> bool:
+        """Put a node's jobs in progress back to pending, returning True if it had any."""
+        with self.lock:
+            released = False
+            for job, assignee in enumerate(self.assignees):
+                if assignee == node and self.statuses[job] == JobStatus.IN_PROGRESS:
+                    self.statuses[job] = JobStatus.PENDING
+                    released = True
+            if released:
+                self._bump()
+            return released
+
+    def release_job(self, job: int, node: Address) -> bool:
+        """Put a job back to pending if it's still in progress by the node, e.g. once its lease ran out."""
+        with self.lock:
+            if (
+                self.statuses[job] != JobStatus.IN_PROGRESS
+                or self.assignees[job] != node
+            ):
+                return False
+            self.statuses[job] = JobStatus.PENDING
+            self._bump()
+            return True
+
+    def wait_for_change(
+        self, version: int, timeout: Optional[float] = None, clock: Clock = Clock()
+    ) -> int:
+        """Block until the state is newer than ``version``, returning the current version."""
+        clock.wait_for(self.changed, lambda: self.version != version, timeout)
+        return self.version
+
+    def jobs(self) -> jobs_structure:
+        """Copy of the jobs, to be sent to other nodes."""
+        with self.lock:
+            return list(zip(self.statuses, self.assignees))
+
+    def status(self, job: int) -> JobStatus:
+        return self.statuses[job]
+
+    def busy_nodes(self) -> set[Address]:
+        with self.lock:
+            return {
+                node
+                for status, node in zip(self.statuses, self.assignees)
+                if status == JobStatus.IN_PROGRESS
+            }
+
+    def is_completed(self) -> bool:
+        return all(status == JobStatus.COMPLETED for status in self.statuses)
@@ -0,0 +1,143 @@
+import itertools
+import json
+import struct
+import threading
+import time
+from collections import Counter
+from typing import Any, Iterator, Optional
+
+from custom_types import Address
+from protocol import P2PProtocol, Relay
+from utils import AddressUtils
+
+# Seconds since the recording started, kind, and payload length of each record
+RECORD = struct.Struct(">dBI")
+
+# Record kinds
+START = 0  # JSON: wall clock time the recording started at, and the node's address
+REQUEST = 1  # JSON: HTTP request id, method, path and body
+RESPONSE = 2  # JSON: HTTP request id, status and seconds taken
+FRAME = 3  # Sender's address, length-prefixed, then the frame
+
+
+class Recorder:
+    """
+    Appends the HTTP requests a node gets and the frames it handles to a compact binary log,
+    which `replay.py` feeds back into a local cluster.
+
+    Each record is a fixed header (seconds since the recording started, kind, payload length)
+    followed by the payload: HTTP requests and responses are JSON, frames are kept as received.
+    Any thread may record, and records are written in the order they're made.
+
+    :param path: File to write the recording to. It is overwritten.
+    :type path: str
+    :param node: Address of the recording node.
+    :type node: Address
+    """
+
+    def __init__(self, path: str, node: Address):
+        self.path = path
+        self.file = open(path, "wb")
+        self.started = time.monotonic()
+        self.requests = itertools.count()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.record(
+            START,
+            json.dumps(
+                {"time": time.time(), "node": AddressUtils.address_to_str(node)}
+            ).encode(),
+        )
+
+    def record(self, kind: int, payload: bytes):
+        with self.lock:
+            if self.closed:
+                return
+            self.file.write(
+                RECORD.pack(time.monotonic() - self.started, kind, len(payload))
+            )
+            self.file.write(payload)
+
+    def frame(self, node: Optional[Address], frame: bytes):
+        """Record a frame from a neighbor, or from a node not known by its address yet (e.g. joining)."""
+        sender = AddressUtils.address_to_str(node).encode() if node else b""
+        self.record(FRAME, len(sender).to_bytes(2, "big") + sender + frame)
+
+    def request(self, method: str, path: str, body: Any = None) -> int:
+        """Record an HTTP request, returning its id for the response."""
+        request = next(self.requests)
+        self.record(
+            REQUEST,
+            json.dumps(
+                {"id": request, "method": method, "path": path, "body": body}
+            ).encode(),
+        )
+        return request
+
+    def response(self, request: int, status: Optional[int], seconds: float):
+        self.record(
+            RESPONSE,
+            json.dumps({"id": request, "status": status, "seconds": seconds}).encode(),
+        )
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.file.close()
+
+
+def read_recording(path: str) -> Iterator[tuple[float, int, bytes]]:
+    """Records of a recording, as (seconds since it started, kind, payload). A truncated last record is skipped."""
+    with open(path, "rb") as f:
+        while header := f.read(RECORD.size):
+            if len(header) < RECORD.size:
+                return
+            at, kind, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield at, kind, payload
+
+
+class Recording:
+    """
+    A node's recording, loaded: its HTTP requests, with their responses, and the frames it handled, by message type.
+
+    :param path: File written by a Recorder.
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = 0.0  # Wall clock time
+        self.node: Optional[str] = None
+        self.requests: list[dict[str, Any]] = []
+        self.frames: Counter[str] = Counter()
+        self.bytes: Counter[str] = Counter()
+
+        by_id = {}
+        for at, kind, payload in read_recording(path):
+            if kind == START:
+                start = json.loads(payload)
+                self.started, self.node = start["time"], start["node"]
+            elif kind == REQUEST:
+                request = json.loads(payload)
+                request.update(at=at, status=None, seconds=None)
+                by_id[request["id"]] = request
+                self.requests.append(request)
+            elif kind == RESPONSE:
+                response = json.loads(payload)
+                if response["id"] in by_id:
+                    by_id[response["id"]].update(
+                        status=response["status"], seconds=response["seconds"]
+                    )
+            elif kind == FRAME:
+                length = int.from_bytes(payload[:2], "big")
+                frame = payload[2 + length :]
+                message = P2PProtocol.decode(frame)
+                name = type(
+                    message.payload if isinstance(message, Relay) else message
+                ).__name__
+                self.frames[name] += 1
+                self.bytes[name] += len(frame)
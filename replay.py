@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Optional
+
+from cluster import Cluster
+from consts import Engine
+from custom_types import Address
+from events import setup_logging
+from loadgen import http_request, percentile
+from recorder import Recorder, Recording
+
+
+def latency_summary(seconds: list[float]) -> dict[str, Optional[float]]:
+    latencies = sorted(seconds)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "count": len(latencies),
+        "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+        "p50": ms(percentile(latencies, 0.5)),
+        "p99": ms(percentile(latencies, 0.99)),
+        "max": ms(latencies[-1] if latencies else None),
+    }
+
+
+class Replay:
+    """
+    Feeds a recorded session, one recording per node, into a local cluster, and compares the two runs.
+
+    Every HTTP request is sent to the node that got it, as long after the session started as it was
+    (divided by ``speed``), so requests to different nodes keep their interleaving.
+    Frames aren't injected: the nodes exchange their own while handling the requests, and record them,
+    so the report compares latencies by path, statuses, and frames handled by message type.
+
+    :param recordings: Recording of each node, in the order of the cluster's nodes.
+    :type recordings: list[Recording]
+    :param speed: How much faster than recorded to send the requests, e.g. 2 for twice as fast.
+    :type speed: float
+    :param timeout: Seconds before a request is counted as timed out.
+    :type timeout: float
+    """
+
+    def __init__(
+        self, recordings: list[Recording], speed: float = 1.0, timeout: float = 60.0
+    ):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.recordings = recordings
+        self.speed = speed
+        self.timeout = timeout
+
+    async def send(self, target: Address, request: dict, delay: float) -> dict:
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            status, _ = await http_request(
+                target,
+                request["method"],
+                request["path"],
+                request["body"],
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            return {"path": request["path"], "status": "timeout", "seconds": None}
+        except (OSError, ValueError, IndexError):
+            return {"path": request["path"], "status": "connection", "seconds": None}
+        return {
+            "path": request["path"],
+            "status": status,
+            "seconds": time.perf_counter() - start,
+        }
+
+    async def feed(self, targets: list[Address]) -> list[dict]:
+        first = min(recording.started for recording in self.recordings)
+        return await asyncio.gather(
+            *(
+                self.send(
+                    target,
+                    request,
+                    (recording.started - first + request["at"]) / self.speed,
+                )
+                for recording, target in zip(self.recordings, targets)
+                for request in recording.requests
+            )
+        )
+
+    def run(self, **options: Any) -> dict[str, Any]:
+        """Replay the session on a new cluster, with the given Cluster options (e.g. handicaps, engine)."""
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory() as directory, Cluster(
+            len(self.recordings), **options
+        ) as cluster:
+            paths = [os.path.join(directory, f"{i}.rec") for i in range(len(cluster))]
+            for node, path in zip(cluster, paths):
+                node.p2p.recorder = Recorder(path, node.p2p.address)
+            responses = asyncio.run(
+                self.feed([("127.0.0.1", node.http_port) for node in cluster])
+            )
+            for node in cluster:
+                node.p2p.recorder.close()
+            replayed = [Recording(path) for path in paths]
+
+        recorded = [request for r in self.recordings for request in r.requests]
+        return {
+            "name": "replay",
+            "config": {
+                "recordings": [recording.path for recording in self.recordings],
+                "nodes": [recording.node for recording in self.recordings],
+                "speed": self.speed,
+                **options,
+            },
+            "results": {
+                "requests": {"recorded": len(recorded), "replayed": len(responses)},
+                "statuses": {
+                    "recorded": self.statuses(recorded),
+                    "replayed": self.statuses(responses),
+                },
+                "latency_ms": self.latencies(recorded, responses),
+                "frames": self.frames(self.recordings, replayed),
+            },
+            "wall_seconds": round(time.perf_counter() - started, 3),
+        }
+
+    @staticmethod
+    def statuses(requests: list[dict]) -> dict[str, int]:
+        return dict(Counter(str(request["status"]) for request in requests))
+
+    @staticmethod
+    def latencies(recorded: list[dict], replayed: list[dict]) -> dict[str, dict]:
+        """Latencies of answered requests, by path (without the query), and replayed over recorded mean."""
+        result = {}
+        for path in sorted({r["path"].split("?")[0] for r in recorded}):
+            runs = {
+                name: latency_summary(
+                    [
+                        r["seconds"]
+                        for r in requests
+                        if r["path"].split("?")[0] == path and r["seconds"] is not None
+                    ]
+                )
+                for name, requests in (("recorded", recorded), ("replayed", replayed))
+            }
+            means = runs["recorded"]["mean"], runs["replayed"]["mean"]
+            runs["ratio"] = round(means[1] / means[0], 3) if all(means) else None
+            result[path] = runs
+        return result
+
+    @staticmethod
+    def frames(
+        recorded: list[Recording], replayed: list[Recording]
+    ) -> dict[str, dict[str, int]]:
+        """Frames handled across the cluster, by message type."""
+        counts = {
+            name: sum((r.frames for r in recordings), Counter())
+            for name, recordings in (("recorded", recorded), ("replayed", replayed))
+        }
+        return {
+            kind: {name: count[kind] for name, count in counts.items()}
+            for kind in sorted(set(counts["recorded"]) | set(counts["replayed"]))
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "recordings",
+        help="Recording of each node, written with node.py --record",
+        nargs="+",
+    )
+    parser.add_argument(
+        "-s",
+        "--speed",
+        help="How much faster than recorded to send requests",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--handicaps", help="Handicap of each node, in ms", type=int, nargs="+"
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="Default solver engine of the nodes",
+        type=Engine,
+        choices=list(Engine),
+        default=Engine.RANDOM,
+    )
+    parser.add_argument(
+        "--timeout", help="Request timeout, in seconds", type=float, default=60
+    )
+    parser.add_argument(
+        "-l", "--log-level", help="Log level", type=str, default="WARNING"
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output JSON file (default: stdout)", type=str
+    )
+    args = parser.parse_args()
+
+    if args.handicaps and len(args.handicaps) != len(args.recordings):
+        parser.error("--handicaps needs one value per recording")
+
+    setup_logging(args.log_level.upper())
+    replay = Replay(
+        [Recording(path) for path in args.recordings], args.speed, args.timeout
+    )
+    result = replay.run(handicaps=args.handicaps, engine=args.engine)
+
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import math
+import threading
+from typing import Any, Optional
+
+from consts import Route
+from custom_types import Address, sudoku_type
+from solver import BitmaskSolver, SearchBudgetExceeded
+from sudoku import Sudoku
+from utils import AddressUtils
+
+# Search nodes the probe may visit before the puzzle is deemed hard
+PROBE_BUDGET = 1000
+
+# Search nodes a hard puzzle takes, as a multiple of the probe's budget
+EXHAUSTED_FACTOR = 10
+
+# Time of a search node, per empty cell scanned to pick the next one (about 5us for a 9x9 puzzle)
+SECONDS_PER_CELL = 1e-7
+
+# Starting a local process for a subtree, before any search
+SPAWN_SECONDS = 0.05
+
+# Round trip assumed for neighbors until one is measured
+DEFAULT_RTT = 0.001
+
+# Weight of a new sample in the moving averages
+ALPHA = 0.3
+
+
+def propagate(grid: sudoku_type) -> tuple[sudoku_type, int]:
+    """
+    Fill cells with a single candidate until none is left (naked singles),
+    returning the new grid and how many rounds it took.
+    """
+    size = len(grid)
+    box = math.isqrt(size)
+    full = (1 << size) - 1
+    grid = [row[:] for row in grid]
+    rounds = 0
+    while True:
+        rows, cols, boxes = [0] * size, [0] * size, [0] * size
+        for i in range(size):
+            for j in range(size):
+                if grid[i][j]:
+                    bit = 1 << (grid[i][j] - 1)
+                    rows[i] |= bit
+                    cols[j] |= bit
+                    boxes[(i // box) * box + j // box] |= bit
+        filled = False
+        for i in range(size):
+            for j in range(size):
+                if grid[i][j]:
+                    continue
+                b = (i // box) * box + j // box
+                mask = full & ~(rows[i] | cols[j] | boxes[b])
+                if mask.bit_count() == 1:
+                    grid[i][j] = mask.bit_length()
+                    rows[i] |= mask
+                    cols[j] |= mask
+                    boxes[b] |= mask
+                    filled = True
+        if not filled:
+            return grid, rounds
+        rounds += 1
+
+
+def branches(grid: sudoku_type) -> list[sudoku_type]:
+    """One grid per candidate of the most constrained empty cell, which together cover every solution."""
+    solver = BitmaskSolver(grid)
+    if not solver.valid or not solver.empties:
+        return [grid]
+    best = min(solver.empties, key=lambda cell: solver._candidates(*cell).bit_count())
+    i, j, b = best
+    mask = solver._candidates(i, j, b)
+    result = []
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        branch = [row[:] for row in grid]
+        branch[i][j] = bit.bit_length()
+        result.append(branch)
+    return result
+
+
+class Probe:
+    """
+    Cheap look at a puzzle before deciding how to solve it: its clues, how far constraint propagation
+    gets (and in how many rounds), and a search bounded to ``budget`` nodes.
+    Most puzzles are solved by the probe itself.
+
+    :param grid: Sudoku grid to probe. It is not modified.
+    :type grid: sudoku_type
+    :param budget: Search nodes the probe may visit.
+    :type budget: int
+    """
+
+    def __init__(self, grid: sudoku_type, budget: int = PROBE_BUDGET):
+        self.size = len(grid)
+        self.blanks = sum(1 for row in grid for value in row if value == 0)
+        self.jobs = sum(
+            1
+            for square in range(self.size)
+            if Sudoku.get_number_of_zeros_in_square(square, grid) > 0
+        )
+        self.propagated, self.depth = propagate(grid)
+        self.stuck = sum(1 for row in self.propagated for value in row if value == 0)
+
+        solver = BitmaskSolver(self.propagated, budget=budget)
+        try:
+            self.solution = solver.solve()
+            self.finished = True
+        except SearchBudgetExceeded:
+            self.solution = None
+            self.finished = False
+        self.nodes = solver.nodes if self.finished else budget * EXHAUSTED_FACTOR
+
+    @property
+    def search_seconds(self) -> float:
+        """Estimated time of a full search, on this node."""
+        return self.nodes * self.stuck * SECONDS_PER_CELL
+
+    def features(self) -> dict[str, Any]:
+        return {
+            "size": self.size,
+            "clues": self.size * self.size - self.blanks,
+            "depth": self.depth,
+            "stuck": self.stuck,
+            "search_nodes": self.nodes,
+            "finished": self.finished,
+        }
+
+
+class Decision:
+    """
+    How a puzzle is to be solved, and what each way was predicted to cost.
+
+    :param route: Chosen way of solving.
+    :type route: Route
+    :param nodes: Nodes to involve, fastest first. Only this node when solving locally.
+    :type nodes: list[Address]
+    :param costs: Predicted seconds of each route.
+    :type costs: dict[Route, float]
+    """
+
+    def __init__(self, route: Route, nodes: list[Address], costs: dict[Route, float]):
+        self.route = route
+        self.nodes = nodes
+        self.costs = costs
+
+    @property
+    def predicted(self) -> float:
+        return self.costs[self.route]
+
+
+class Router:
+    """
+    Cost model that decides, for each puzzle, whether to solve it locally in-process,
+    split it into one job per square, or split its search tree into subtrees, and across how many nodes.
+
+    Costs come from a probe of the puzzle, the handicap of this node,
+    and the round trip and job times measured for each neighbor (from WorkAck and WorkComplete).
+    Puzzles whose predicted local cost is lowest, like most small ones, never touch the network.
+
+    :param address: Address of this node.
+    :type address: Address
+    :param handicap: Handicap of this node, in seconds per job.
+    :type handicap: float
+    """
+
+    def __init__(self, address: Address, handicap: float):
+        self.address = address
+        self.handicap = handicap
+        self.rtt: dict[Address, float] = {}  # Moving averages, in seconds
+        self.job_time: dict[Address, float] = {}
+        self.sent: dict[tuple[str, int], tuple[Address, float]] = {}
+        self.decisions = {route: 0 for route in Route}
+        self.predicted = 0.0  # Totals of predicted and actual seconds, across puzzles
+        self.actual = 0.0
+        # Subtree races run in real processes, which simulations can't
+        self.subtrees = True
+        self.lock = threading.Lock()
+
+    def decide(self, probe: Probe, neighbors: list[Address]) -> Decision:
+        local = probe.search_seconds + probe.jobs * self.handicap
+        plans = {Route.LOCAL: ([self.address], local)}
+        if not probe.finished or probe.solution is not None:
+            # A puzzle the probe proved unsolvable has no use for the network
+            plans[Route.SQUARES] = self.plan_squares(probe, neighbors)
+            plans[Route.SUBTREES] = self.plan_subtrees(probe, neighbors)
+
+        route = min(plans, key=lambda r: plans[r][1])
+        with self.lock:
+            self.decisions[route] += 1
+        return Decision(
+            route, plans[route][0], {r: cost for r, (_, cost) in plans.items()}
+        )
+
+    def estimate_job(self, node: Address, probe: Probe) -> float:
+        """Time from sending a job to a node until its WorkComplete, measured if possible."""
+        with self.lock:
+            if node in self.job_time:
+                return self.job_time[node]
+            rtt = 0.0 if node == self.address else self.rtt.get(node, DEFAULT_RTT)
+        return rtt + probe.search_seconds + self.handicap
+
+    def plan_squares(
+        self, probe: Probe, neighbors: list[Address]
+    ) -> tuple[list[Address], float]:
+        """
+        Fastest nodes to give one job per square to, and the predicted time:
+        jobs go out in rounds, each as long as the slowest node involved.
+        """
+        times = sorted(
+            (self.estimate_job(node, probe), node)
+            for node in [*neighbors, self.address]
+        )
+        best, best_cost = 1, math.inf
+        for k in range(1, len(times) + 1):
+            cost = math.ceil(probe.jobs / k) * times[k - 1][0]
+            if cost < best_cost:
+                best, best_cost = k, cost
+        return [node for _, node in times[:best]], best_cost
+
+    def plan_subtrees(
+        self, probe: Probe, neighbors: list[Address]
+    ) -> tuple[list[Address], float]:
+        """
+        Nodes to search one subtree each, and the predicted time.
+        Subtrees split the search evenly, and the first solution ends the race.
+        """
+        if not self.subtrees:
+            return [], math.inf
+        count = min(len(branches(probe.propagated)), len(neighbors) + 1)
+        if count < 2:
+            return [], math.inf
+        with self.lock:
+            rtts = sorted((self.rtt.get(node, DEFAULT_RTT), node) for node in neighbors)
+        cost = (
+            SPAWN_SECONDS
+            + rtts[count - 2][0]
+            + probe.search_seconds / count
+            + self.handicap
+        )
+        return [node for _, node in rtts[: count - 1]] + [self.address], cost
+
+    def dispatched(self, sudoku_id: str, job: int, node: Address, now: float):
+        with self.lock:
+            self.sent[(sudoku_id, job)] = (node, now)
+
+    def acked(self, sudoku_id: str, job: int, now: float):
+        with self.lock:
+            if (sudoku_id, job) in self.sent:
+                node, sent_at = self.sent[(sudoku_id, job)]
+                self.rtt[node] = self._average(self.rtt.get(node), now - sent_at)
+
+    def completed(self, sudoku_id: str, job: int, now: float):
+        with self.lock:
+            if (sudoku_id, job) in self.sent:
+                node, sent_at = self.sent.pop((sudoku_id, job))
+                self.job_time[node] = self._average(
+                    self.job_time.get(node), now - sent_at
+                )
+
+    def finished(self, sudoku_id: str, predicted: float, actual: float):
+        """Record how long a puzzle took against its prediction, and forget its jobs."""
+        with self.lock:
+            self.predicted += predicted
+            self.actual += actual
+            for key in [key for key in self.sent if key[0] == sudoku_id]:
+                del self.sent[key]
+
+    def forget(self, node: Address):
+        """Drop a node's measurements, once it left the network."""
+        with self.lock:
+            self.rtt.pop(node, None)
+            self.job_time.pop(node, None)
+
+    @staticmethod
+    def _average(current: Optional[float], sample: float) -> float:
+        return sample if current is None else current + ALPHA * (sample - current)
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "decisions": {
+                    str(route): count for route, count in self.decisions.items()
+                },
+                "predicted": round(self.predicted, 6),
+                "actual": round(self.actual, 6),
+                "rtt": {
+                    AddressUtils.address_to_str(node): round(rtt, 6)
+                    for node, rtt in self.rtt.items()
+                },
+                "job_time": {
+                    AddressUtils.address_to_str(node): round(seconds, 6)
+                    for node, seconds in self.job_time.items()
+                },
+            }
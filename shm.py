@@ -0,0 +1,156 @@
+import socket
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+from protocol import Doorbell, Message, P2PProtocol
+
+# Bytes of each ring, a multiple of the page size. Frames larger than it go through in pieces.
+RING_SIZE = 1024 * 1024
+
+# Write and read positions, as 8-byte counters of the bytes that went through the ring
+POSITIONS_SIZE = 16
+
+# Rings created by this process, which the resource tracker must keep tracking when attached to
+_created: set[str] = set()
+
+
+def host_id() -> str:
+    """
+    Identifies the host (and its boot), so nodes can tell whether they share memory.
+    Nodes in different containers may share it too, but then attaching a ring fails.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot = f.read().strip()
+    except OSError:
+        boot = ""
+    return f"{socket.gethostname()}/{boot}"
+
+
+class Ring:
+    """
+    Single-producer, single-consumer byte ring in shared memory, through which a node sends frames
+    to a neighbor on the same host, skipping the kernel's socket buffers.
+
+    The reader creates (and owns) the ring and the writer attaches to it by name.
+    Both positions only grow: the writer publishes the write position after copying,
+    and the reader publishes the read position after copying out, with aligned 8-byte stores.
+
+    :param name: Name of the ring to attach to, or None to create one.
+    :type name: Optional[str]
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=POSITIONS_SIZE + RING_SIZE
+            )
+            _created.add(self.memory.name)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            if self.memory.name not in _created:
+                # Only the owner unlinks the ring, the tracker would do it once this process exits
+                resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.name = self.memory.name
+        self.positions = self.memory.buf[:POSITIONS_SIZE].cast("Q")
+        self.data = self.memory.buf[POSITIONS_SIZE : POSITIONS_SIZE + RING_SIZE]
+        self.buffer = bytearray()  # Bytes read of frames not complete yet
+
+    def write(self, buffers: list[memoryview]) -> int:
+        """Copy as many bytes as fit, returning how many."""
+        start = position = self.positions[0]
+        free = RING_SIZE - (position - self.positions[1])
+        for buffer in buffers:
+            chunk = buffer[: free - (position - start)]
+            offset = position % RING_SIZE
+            first = min(len(chunk), RING_SIZE - offset)
+            self.data[offset : offset + first] = chunk[:first]
+            self.data[: len(chunk) - first] = chunk[first:]
+            position += len(chunk)
+            if len(chunk) < len(buffer):
+                break
+        self.positions[0] = position
+        return position - start
+
+    def read(self, frames: Optional[list[bytes]] = None) -> list[Message]:
+        """Take every byte written, returning the frames now complete (copied to ``frames``, if given)."""
+        start, end = self.positions[1], self.positions[0]
+        offset = start % RING_SIZE
+        first = min(end - start, RING_SIZE - offset)
+        self.buffer += self.data[offset : offset + first]
+        self.buffer += self.data[: end - start - first]
+        self.positions[1] = end
+
+        with memoryview(self.buffer) as view:
+            messages, offset = P2PProtocol.decode_frames(view, frames)
+        del self.buffer[:offset]
+        return messages
+
+    def close(self):
+        self.positions.release()
+        self.data.release()
+        self.memory.close()
+        if self.owner:
+            _created.discard(self.name)
+            self.memory.unlink()
+
+
+class ShmLink:
+    """
+    Shared-memory transport to a neighbor on the same host.
+
+    Frames go through a ring in each direction, and the socket is only used
+    for a doorbell frame telling the neighbor to read its ring,
+    so messages keep their order and the socket still tells when the neighbor is gone.
+    It takes the place of the socket in ``SendQueue.flush``.
+
+    :param sock: Socket to the neighbor.
+    :type sock: socket.socket
+    :param inbound: Ring the neighbor writes to.
+    :type inbound: Ring
+    """
+
+    DOORBELL = P2PProtocol.encode(Doorbell())
+
+    def __init__(self, sock: socket.socket, inbound: Ring):
+        self.sock = sock
+        self.inbound = inbound
+        self.outbound: Optional[Ring] = None  # Ring the neighbor reads from, once known
+        self.bell = memoryview(b"")  # Doorbell bytes not sent yet
+        self.full = False
+
+    def attach(self, name: str) -> bool:
+        """Attach to the neighbor's ring, returning False if it isn't reachable from here."""
+        try:
+            self.outbound = Ring(name)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def sendmsg(self, buffers: list[memoryview]) -> int:
+        """Write frames to the neighbor's ring, as ``socket.sendmsg`` would send them."""
+        sent = self.outbound.write(buffers)
+        self.full = sent == 0
+        if self.full:
+            raise BlockingIOError("ring is full")
+        if not self.bell:
+            self.bell = memoryview(self.DOORBELL)
+        return sent
+
+    def ring(self) -> bool:
+        """Send the doorbell, if due, returning False if it couldn't be sent yet."""
+        if self.bell:
+            try:
+                self.bell = self.bell[self.sock.send(self.bell) :]
+            except (BlockingIOError, socket.timeout):
+                pass
+        return not self.bell
+
+    def receive(self, frames: Optional[list[bytes]] = None) -> list[Message]:
+        return self.inbound.read(frames)
+
+    def close(self):
+        self.inbound.close()
+        if self.outbound is not None:
+            self.outbound.close()
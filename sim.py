@@ -0,0 +1,574 @@
+import argparse
+import asyncio
+import copy
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from clock import Clock
+from connection import BufferPool
+from consts import Engine
+from custom_types import sudoku_type
+from events import setup_logging
+from gen import read_corpus
+from loadgen import LoadGenerator
+from p2p import BALANCE_INTERVAL, P2PServer
+from protocol import P2PProtocol, Relay
+from sudoku import Sudoku
+
+SIM_EPOCH = 1_700_000_000.0  # Wall-clock time simulations start at
+
+
+class SimulationStopped(BaseException):
+    """Raised in simulated threads still sleeping or waiting when the simulation ends."""
+
+
+class _Waiter:
+    __slots__ = ("predicate", "resume")
+
+    def __init__(self, predicate: Callable[[], bool], resume: threading.Semaphore):
+        self.predicate = predicate
+        self.resume = resume
+
+
+class VirtualClock(Clock):
+    """
+    Simulated time, moved forward from one scheduled event to the next.
+
+    Simulated threads are real threads, but only one of them runs at a time:
+    it runs until it sleeps, waits or returns, then hands control back to the scheduler,
+    which runs the next event. Runs are therefore deterministic, and sleeps take no real time.
+    Events (e.g. message deliveries) run on the scheduler's thread, and must not sleep or wait.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.events: list[tuple[float, int, Callable, tuple]] = []
+        self.sequence = itertools.count()
+        self.waiters: list[_Waiter] = []
+        # Simulated threads not started yet, sleeping or waiting
+        self.parked: set[threading.Semaphore] = set()
+        self.turn = threading.Semaphore(0)  # Released when a thread hands control back
+        self.local = threading.local()
+        self.stopped = False
+        self.errors: list[BaseException] = []
+
+    def time(self) -> float:
+        return SIM_EPOCH + self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def call_later(self, delay: float, callback: Callable, *args):
+        heapq.heappush(
+            self.events,
+            (self.now + max(0.0, delay), next(self.sequence), callback, args),
+        )
+
+    def spawn(self, target: Callable, *args):
+        resume = threading.Semaphore(0)
+
+        def main():
+            resume.acquire()
+            self.parked.discard(resume)
+            self.local.resume = resume
+            try:
+                if not self.stopped:
+                    target(*args)
+            except SimulationStopped:
+                pass
+            except BaseException as e:
+                self.errors.append(e)
+            finally:
+                self.turn.release()
+
+        self.parked.add(resume)
+        threading.Thread(target=main, daemon=True).start()
+        self.call_later(0, self._switch_to, resume)
+
+    def sleep(self, seconds: float):
+        resume = self._current()
+        self.call_later(seconds, self._switch_to, resume)
+        self._park(resume)
+
+    def wait_for(
+        self,
+        condition: threading.Condition,
+        predicate: Callable[[], bool],
+        timeout: Optional[float] = None,
+    ) -> bool:
+        # Only one thread runs at a time, so the predicate is checked after each event instead
+        if predicate():
+            return True
+        resume = self._current()
+        waiter = _Waiter(predicate, resume)
+        self.waiters.append(waiter)
+        if timeout is not None:
+            self.call_later(timeout, self._expire, waiter)
+        self._park(resume)
+        return predicate()
+
+    def _current(self) -> threading.Semaphore:
+        resume = getattr(self.local, "resume", None)
+        if resume is None:
+            raise RuntimeError("Only simulated threads can sleep or wait")
+        return resume
+
+    def _park(self, resume: threading.Semaphore):
+        if self.stopped:
+            raise SimulationStopped()
+        self.parked.add(resume)
+        self.turn.release()
+        resume.acquire()
+        self.parked.discard(resume)
+        if self.stopped:
+            raise SimulationStopped()
+
+    def _switch_to(self, resume: threading.Semaphore):
+        """Let a simulated thread run until it hands control back."""
+        resume.release()
+        self.turn.acquire()
+
+    def _expire(self, waiter: _Waiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+            self._switch_to(waiter.resume)
+
+    def run(self, until: Optional[float] = None):
+        """Run events until there are none left, or time reaches ``until``."""
+        while self.events:
+            if until is not None and self.events[0][0] > until:
+                self.now = until
+                return
+            when, _, callback, args = heapq.heappop(self.events)
+            self.now = when
+            callback(*args)
+            for waiter in [w for w in self.waiters if w.predicate()]:
+                self.waiters.remove(waiter)
+                self._switch_to(waiter.resume)
+
+    def close(self):
+        """End the simulated threads still sleeping or waiting."""
+        self.stopped = True
+        self.events.clear()
+        self.waiters.clear()
+        for resume in list(self.parked):
+            self._switch_to(resume)
+
+
+class SimLink:
+    """One direction of a connection between two simulated nodes, standing in for its socket."""
+
+    __slots__ = ("source", "target", "reverse", "busy_until", "last_arrival")
+
+    def __init__(self, source: "SimNode", target: "SimNode"):
+        self.source = source
+        self.target = target
+        self.reverse: Optional[SimLink] = None
+        self.busy_until = 0.0
+        self.last_arrival = 0.0
+
+
+class SimNetwork:
+    """
+    In-memory network between simulated nodes.
+
+    Frames on a link are sent one after the other at the link's bandwidth,
+    then arrive after the latency (plus up to ``jitter``), in order, as on a TCP connection.
+    Lost frames are retransmitted after ``rto``, so loss shows up as delay, as it would with TCP.
+
+    :param clock: Simulation clock.
+    :type clock: VirtualClock
+    :param rng: Random generator for jitter and loss.
+    :type rng: random.Random
+    :param latency: One-way latency, in seconds.
+    :type latency: float
+    :param jitter: Maximum extra latency, in seconds.
+    :type jitter: float
+    :param bandwidth: Bytes per second of each link, or None for no limit.
+    :type bandwidth: Optional[float]
+    :param loss: Probability of each transmission being lost.
+    :type loss: float
+    :param rto: Seconds before a lost frame is retransmitted.
+    :type rto: float
+    """
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        rng: random.Random,
+        latency: float = 0.0005,
+        jitter: float = 0.0,
+        bandwidth: Optional[float] = None,
+        loss: float = 0.0,
+        rto: float = 0.2,
+    ):
+        if not 0 <= loss < 1:
+            raise ValueError("loss must be in [0, 1)")
+        self.clock = clock
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.rto = rto
+
+        self.frames: Counter[str] = Counter()
+        self.bytes: Counter[str] = Counter()
+
+    def connect(self, a: "SimNode", b: "SimNode"):
+        there, back = SimLink(a, b), SimLink(b, a)
+        there.reverse, back.reverse = back, there
+        a.neighbors[b.address] = (there, self.clock.time())
+        b.neighbors[a.address] = (back, self.clock.time())
+
+    def transmit(self, link: SimLink, frame: bytes):
+        now = self.clock.now
+        start = max(now, link.busy_until)
+        link.busy_until = start + (len(frame) / self.bandwidth if self.bandwidth else 0)
+        arrival = link.busy_until + self.latency + self.rng.uniform(0, self.jitter)
+        while self.loss and self.rng.random() < self.loss:
+            arrival += self.rto
+        link.last_arrival = arrival = max(arrival, link.last_arrival)
+        self.clock.call_later(arrival - now, self.deliver, link, frame)
+
+    def deliver(self, link: SimLink, frame: bytes):
+        message = P2PProtocol.decode(frame)
+        kind = type(message.payload if isinstance(message, Relay) else message).__name__
+        self.frames[kind] += 1
+        self.bytes[kind] += len(frame)
+        link.target.handle_message(link.reverse, message)
+
+
+class SimNode(P2PServer):
+    """
+    A P2PServer with a link of the simulated network instead of a socket for each neighbor,
+    and the simulation's clock instead of real time and threads.
+    """
+
+    def __init__(
+        self,
+        network: SimNetwork,
+        index: int,
+        handicap: float,
+        engine: Engine = Engine.RANDOM,
+        fanout: Optional[int] = 3,
+        memo_size: int = 4096,
+    ):
+        self.network = network
+        self.index = index
+        super().__init__(
+            index,
+            None,
+            handicap,
+            engine,
+            fanout,
+            memo_size,
+            shared_memory=False,
+            clock=network.clock,
+        )
+        self.router.subtrees = False  # Races run in real processes
+
+    def bind(self):
+        self.address = ("sim", self.index)
+        self.socket = None  # Work a node gives itself doesn't go through the network
+        self.outboxes = {}
+        self.writing = set()
+        self.inboxes = {}
+        self.buffers = BufferPool()
+
+    def send_frame(self, conn: SimLink, frame: bytes, kind: Optional[str] = None):
+        self.network.transmit(conn, frame)
+
+    def call_later(self, delay: float, callback, *args):
+        self.clock.call_later(delay, callback, *args)
+
+    def wake_up(self):
+        pass
+
+
+class Simulation:
+    """
+    Fully connected cluster of simulated nodes, driven by /solve requests as the load generator sends them.
+
+    The nodes run the P2PServer's message handling, dispatching and job logic, against simulated time,
+    so hundreds of nodes fit in one process, and a run is reproducible from its seed.
+    Results have the load generator's format, plus the cluster's stats and the network's traffic.
+    Joining and keep-alives aren't simulated: nodes start connected to each other.
+
+    :param size: Number of nodes.
+    :type size: int
+    :param handicaps: Handicap of each node, or of all of them, in milliseconds.
+    :type handicaps: float | list[float]
+    :param seed: Seed of every random choice, the solver's included.
+    :type seed: int
+    :param engine: Solver engine, random or DLX.
+    :type engine: Engine
+    :param fanout: Spanning tree fan-out.
+    :type fanout: Optional[int]
+    :param memo_size: Square memo capacity of each node.
+    :type memo_size: int
+    :param network: SimNetwork options (latency, jitter, bandwidth, loss, rto).
+    :type network: Any
+    """
+
+    def __init__(
+        self,
+        size: int,
+        handicaps: float | list[float] = 1,
+        seed: int = 0,
+        engine: Engine = Engine.RANDOM,
+        fanout: Optional[int] = 3,
+        memo_size: int = 4096,
+        **network: Any,
+    ):
+        if engine == Engine.PORTFOLIO:
+            raise ValueError("The portfolio engine races real processes")
+        if not isinstance(handicaps, list):
+            handicaps = [handicaps] * size
+
+        self.seed = seed
+        self.engine = engine
+        self.clock = VirtualClock()
+        self.rng = random.Random(seed)
+        self.network = SimNetwork(self.clock, self.rng, **network)
+        self.nodes = [
+            SimNode(self.network, i, handicaps[i] / 1000, engine, fanout, memo_size)
+            for i in range(size)
+        ]
+        for a, b in itertools.combinations(self.nodes, 2):
+            self.network.connect(a, b)
+        self.by_address = {node.address: node for node in self.nodes}
+        self.in_flight = 0
+        self.finished_at = 0.0
+
+    def solve(self, generator: LoadGenerator):
+        node = self.by_address[next(generator.targets)]
+        grid = copy.deepcopy(generator.next_body()["sudoku"])
+        start = self.clock.now
+        self.in_flight += 1
+        asyncio.run(node.solve_sudoku(grid, self.engine))
+        self.in_flight -= 1
+        # The HTTP API answers 200 even when the sudoku couldn't be solved
+        generator.statuses["200"] += 1
+        generator.latencies.append(self.clock.now - start)
+        self.finished_at = self.clock.now
+
+    def balance(self):
+        """Let nodes advertise capacity and steal work, as the selector's timer does, while anything else is scheduled."""
+        for node in self.nodes:
+            node.balance()
+        if self.clock.events:
+            self.clock.call_later(BALANCE_INTERVAL, self.balance)
+
+    def closed_loop(
+        self, generator: LoadGenerator, concurrency: int, requests: int, duration: float
+    ):
+        sent = itertools.count()
+
+        def client():
+            while next(sent) < requests or (requests == 0 and duration):
+                if duration and self.clock.now >= duration:
+                    return
+                self.solve(generator)
+
+        for _ in range(concurrency):
+            self.clock.spawn(client)
+
+    def open_loop(
+        self,
+        generator: LoadGenerator,
+        rate: float,
+        requests: int,
+        duration: float,
+        poisson: bool,
+    ):
+        at = 0.0
+        for _ in range(requests or int(rate * duration)):
+            self.clock.call_later(at, self.clock.spawn, self.solve, generator)
+            at += self.rng.expovariate(rate) if poisson else 1 / rate
+
+    def run(
+        self,
+        puzzles: list[sudoku_type],
+        mode: str = "closed",
+        concurrency: int = 1,
+        rate: float = 1.0,
+        requests: int = 0,
+        duration: float = 0.0,
+        poisson: bool = False,
+        max_time: Optional[float] = None,
+    ) -> dict[str, Any]:
+        generator = LoadGenerator(
+            [node.address for node in self.nodes],
+            puzzles,
+            extra={"engine": str(self.engine)},
+        )
+        if mode == "open":
+            self.open_loop(generator, rate, requests, duration, poisson)
+        else:
+            self.closed_loop(generator, concurrency, requests, duration)
+
+        self.clock.call_later(BALANCE_INTERVAL, self.balance)
+
+        started = time.perf_counter()
+        random.seed(self.seed)  # Sudoku.update_square uses the module's generator
+        previous, Sudoku.clock = Sudoku.clock, self.clock
+        try:
+            self.clock.run(max_time)
+        finally:
+            Sudoku.clock = previous
+            self.clock.close()
+        if self.clock.errors:
+            raise self.clock.errors[0]
+        if self.in_flight:
+            # Stopped at max_time, as requests still running would have timed out
+            generator.statuses["timeout"] += self.in_flight
+            self.finished_at = self.clock.now
+
+        memo = Counter()
+        for node in self.nodes:
+            memo.update(
+                {k: v for k, v in node.memo.stats().items() if k in ("hits", "misses")}
+            )
+
+        result = generator.report(mode, self.finished_at, memo, concurrency, rate)
+        result["name"] = "sim"
+        result["config"].update(
+            {
+                "nodes": len(self.nodes),
+                "seed": self.seed,
+                "handicaps": [node.handicap * 1000 for node in self.nodes],
+                "latency": self.network.latency,
+                "jitter": self.network.jitter,
+                "bandwidth": self.network.bandwidth,
+                "loss": self.network.loss,
+            }
+        )
+        result["results"]["stats"] = self.nodes[0].get_stats()["all"]
+        result["results"]["network"] = {
+            "frames": dict(sorted(self.network.frames.items())),
+            "bytes": dict(sorted(self.network.bytes.items())),
+        }
+        result["wall_seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "corpus", help="Puzzle corpus written by gen.py (NDJSON or .bin)"
+    )
+    parser.add_argument("-n", "--nodes", help="Simulated nodes", type=int, default=16)
+    parser.add_argument(
+        "--handicap", help="Handicap of every node, in ms", type=float, default=1
+    )
+    parser.add_argument("-s", "--seed", help="Random seed", type=int, default=0)
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="Solver engine",
+        type=Engine,
+        choices=[Engine.RANDOM, Engine.DLX],
+        default=Engine.DLX,
+    )
+    parser.add_argument(
+        "-f", "--fanout", help="Spanning tree fan-out", type=int, default=3
+    )
+    parser.add_argument(
+        "-m", "--memo-size", help="Square memo capacity", type=int, default=4096
+    )
+    parser.add_argument(
+        "--latency", help="One-way latency, in ms", type=float, default=0.5
+    )
+    parser.add_argument(
+        "--jitter", help="Maximum extra latency, in ms", type=float, default=0
+    )
+    parser.add_argument(
+        "--bandwidth", help="Bandwidth of each link, in Mbit/s", type=float
+    )
+    parser.add_argument(
+        "--loss", help="Probability of a frame being lost", type=float, default=0
+    )
+    parser.add_argument(
+        "--mode", help="Load model", choices=["closed", "open"], default="closed"
+    )
+    parser.add_argument(
+        "-c", "--concurrency", help="Clients (closed loop)", type=int, default=8
+    )
+    parser.add_argument(
+        "-r", "--rate", help="Requests per second (open loop)", type=float, default=10
+    )
+    parser.add_argument(
+        "--poisson",
+        help="Exponential inter-arrival times (open loop)",
+        action="store_true",
+    )
+    parser.add_argument("--requests", help="Total requests", type=int, default=0)
+    parser.add_argument(
+        "-d",
+        "--duration",
+        help="Simulated seconds to send requests for",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--max-time",
+        help="Simulated seconds to stop at, counting unfinished requests as timed out",
+        type=float,
+        default=600,
+    )
+    parser.add_argument(
+        "-l", "--log-level", help="Log level", type=str, default="WARNING"
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output JSON file (default: stdout)", type=str
+    )
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        parser.error("either --requests or --duration is needed")
+
+    puzzles = list(read_corpus(args.corpus))
+    if not puzzles:
+        parser.error(f"{args.corpus} has no puzzles")
+
+    setup_logging(args.log_level.upper())
+    simulation = Simulation(
+        args.nodes,
+        args.handicap,
+        args.seed,
+        args.engine,
+        args.fanout,
+        args.memo_size,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        bandwidth=args.bandwidth * 125_000 if args.bandwidth else None,
+        loss=args.loss,
+    )
+    result = simulation.run(
+        puzzles,
+        args.mode,
+        args.concurrency,
+        args.rate,
+        args.requests,
+        args.duration,
+        args.poisson,
+        args.max_time,
+    )
+
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
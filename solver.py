@@ -0,0 +1,156 @@
+import random
+from math import isqrt
+from typing import Optional
+
+from custom_types import sudoku_type
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised when a search visits more nodes than its budget allows."""
+
+
+class BitmaskSolver:
+    """
+    Backtracking solver over bitmasks of used digits per row, column and box.
+
+    Cells are filled in MRV order (fewest candidates first), so no ``Sudoku``
+    object is allocated while searching, and the same search also counts
+    solutions, which is what uniqueness checks need.
+
+    :param grid: Sudoku grid, with 0 for empty cells. It is not modified.
+    :type grid: sudoku_type
+    :param rng: If given, candidates are tried in random order.
+    :type rng: random.Random
+    :param budget: Maximum number of search nodes, or None for no limit.
+    :type budget: int
+    """
+
+    def __init__(
+        self,
+        grid: sudoku_type,
+        rng: Optional[random.Random] = None,
+        budget: Optional[int] = None,
+    ):
+        self.size = len(grid)
+        self.box = isqrt(self.size)
+        self.full = (1 << self.size) - 1
+        self.rng = rng
+        self.budget = budget
+        self.nodes = 0
+        self.grid = [row[:] for row in grid]
+        self.rows = [0] * self.size
+        self.cols = [0] * self.size
+        self.boxes = [0] * self.size
+        self.empties: list[tuple[int, int, int]] = []
+        self.valid = True
+
+        for i in range(self.size):
+            for j in range(self.size):
+                b = (i // self.box) * self.box + j // self.box
+                value = self.grid[i][j]
+                if value == 0:
+                    self.empties.append((i, j, b))
+                    continue
+                bit = 1 << (value - 1)
+                if (self.rows[i] | self.cols[j] | self.boxes[b]) & bit:
+                    self.valid = False
+                self.rows[i] |= bit
+                self.cols[j] |= bit
+                self.boxes[b] |= bit
+
+    def _candidates(self, i: int, j: int, b: int) -> int:
+        return self.full & ~(self.rows[i] | self.cols[j] | self.boxes[b])
+
+    def _pick(self, depth: int) -> int:
+        """Move the most constrained empty cell to position ``depth``, returning its mask."""
+        best, best_mask, best_count = depth, 0, self.size + 1
+        for k in range(depth, len(self.empties)):
+            mask = self._candidates(*self.empties[k])
+            count = mask.bit_count()
+            if count < best_count:
+                best, best_mask, best_count = k, mask, count
+                if count <= 1:
+                    break
+        self.empties[depth], self.empties[best] = (
+            self.empties[best],
+            self.empties[depth],
+        )
+        return best_mask
+
+    def _search(self, depth: int, limit: int) -> int:
+        if depth == len(self.empties):
+            return 1
+
+        self.nodes += 1
+        if self.budget is not None and self.nodes > self.budget:
+            raise SearchBudgetExceeded()
+
+        mask = self._pick(depth)
+        i, j, b = self.empties[depth]
+        bits = []
+        while mask:
+            bit = mask & -mask
+            bits.append(bit)
+            mask ^= bit
+        if self.rng is not None:
+            self.rng.shuffle(bits)
+
+        found = 0
+        for bit in bits:
+            self.rows[i] |= bit
+            self.cols[j] |= bit
+            self.boxes[b] |= bit
+            found += self._search(depth + 1, limit - found)
+            if found >= limit:
+                # Write the path of the last solution found back into the grid
+                self.grid[i][j] = bit.bit_length()
+                return found
+            self.rows[i] ^= bit
+            self.cols[j] ^= bit
+            self.boxes[b] ^= bit
+
+        return found
+
+    def solve(self) -> Optional[sudoku_type]:
+        """Return a solved copy of the grid, or None if it has no solution."""
+        if not self.valid or self._search(0, 1) == 0:
+            return None
+        return self.grid
+
+    def count_solutions(self, limit: int = 2) -> int:
+        """Count solutions, stopping as soon as ``limit`` of them are found."""
+        if not self.valid:
+            return 0
+        return self._search(0, limit)
+
+
+def solve(
+    grid: sudoku_type, rng: Optional[random.Random] = None
+) -> Optional[sudoku_type]:
+    """Solve the grid without modifying it."""
+    return BitmaskSolver(grid, rng).solve()
+
+
+def solve_with_restarts(
+    grid: sudoku_type, seed: int, budget: int = 200, growth: float = 2.0
+) -> Optional[sudoku_type]:
+    """
+    Solve with randomized candidate order, restarting with a new order whenever
+    the search exceeds its node budget, which grows after each restart.
+    This avoids getting stuck under an unlucky early choice on hard puzzles.
+    """
+    rng = random.Random(seed)
+    while True:
+        try:
+            return BitmaskSolver(grid, rng, int(budget)).solve()
+        except SearchBudgetExceeded:
+            budget *= growth
+
+
+def count_solutions(grid: sudoku_type, limit: int = 2) -> int:
+    """Count the grid's solutions, up to ``limit``."""
+    return BitmaskSolver(grid).count_solutions(limit)
+
+
+def has_unique_solution(grid: sudoku_type) -> bool:
+    return count_solutions(grid, 2) == 1
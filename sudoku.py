@@ -1,14 +1,21 @@
-import logging
 import random
-import time
 from collections import deque
+from math import isqrt
 
+from clock import Clock
 from custom_types import sudoku_type, row_type
+from events import EventLogger
+
+log = EventLogger("sudoku")
 
 
 class Sudoku:
+    clock = Clock()  # For the rate limiter, swapped by the simulator
+
     def __init__(self, sudoku: sudoku_type, base_delay=0.01, interval=10, threshold=5):
         self.grid = sudoku
+        self.size = len(sudoku)  # Side of the grid, e.g. 9, 16 or 25
+        self.box = isqrt(self.size)  # Side of each square, e.g. 3, 4 or 5
         self.recent_requests = deque()
         self.base_delay = base_delay
         self.interval = interval
@@ -23,34 +30,58 @@ class Sudoku:
         if threshold is None:
             threshold = self.threshold
 
-        current_time = time.time()
+        current_time = self.clock.time()
+        # Requests out of the interval no longer count, so they don't need to be kept
+        while (
+            self.recent_requests and current_time - self.recent_requests[0] >= interval
+        ):
+            self.recent_requests.popleft()
         self.recent_requests.append(current_time)
-        num_requests = len(
-            [t for t in self.recent_requests if current_time - t < interval]
-        )
+        num_requests = len(self.recent_requests)
 
         if num_requests > threshold:
             delay = base_delay * (num_requests - threshold + 1)
-            time.sleep(delay)
+            self.clock.sleep(delay)
 
     def __str__(self):
-        string_representation = "| - - - - - - - - - - - |\n"
-
-        for i in range(9):
-            string_representation += "| "
-            for j in range(9):
-                string_representation += (
-                    str(self.grid[i][j])
-                    if self.grid[i][j] != 0
-                    else f"\033[93m{self.grid[i][j]}\033[0m"
+        width = len(str(self.size))
+        row_length = 2 + self.size * (width + 1) + 2 * self.box - 1
+        separator = "| " + "- " * ((row_length - 3) // 2) + "|"
+        lines = [separator]
+
+        for i in range(self.size):
+            cells = []
+            for j in range(self.size):
+                value = str(self.grid[i][j]).rjust(width)
+                cells.append(
+                    value if self.grid[i][j] != 0 else f"\033[93m{value}\033[0m"
                 )
-                string_representation += " | " if j % 3 == 2 else " "
+                cells.append("|" if j % self.box == self.box - 1 else "")
+            lines.append("| " + " ".join(c for c in cells if c))
+            if i % self.box == self.box - 1:
+                lines.append(separator)
 
-            if i % 3 == 2:
-                string_representation += "\n| - - - - - - - - - - - |"
-            string_representation += "\n"
+        return "\n".join(lines) + "\n"
 
-        return string_representation
+    @classmethod
+    def box_size(cls, grid: sudoku_type) -> int:
+        """Side of each square of the grid, e.g. 3 for a 9x9 grid."""
+        return isqrt(len(grid))
+
+    @classmethod
+    def is_valid_shape(cls, grid: sudoku_type) -> bool:
+        """Check that the grid is an n^2 x n^2 list of lists with values from 0 to n^2."""
+        if not isinstance(grid, list) or len(grid) < 1:
+            return False
+        size = len(grid)
+        if cls.box_size(grid) ** 2 != size:
+            return False
+        return all(
+            isinstance(row, list)
+            and len(row) == size
+            and all(isinstance(v, int) and 0 <= v <= size for v in row)
+            for row in grid
+        )
 
     def update_row(self, row: int, values: row_type):
         """Update the values of the given row."""
@@ -58,24 +89,26 @@ class Sudoku:
 
     def update_column(self, col: int, values: list[int]):
         """Update the values of the given column."""
-        for row in range(9):
+        for row in range(self.size):
             self.grid[row][col] = values[row]
 
     def check_is_valid(
         self, row, col, num, base_delay=None, interval=None, threshold=None
     ):
-        """Check if 'num' is not in the current row, column and 3x3 sub-box."""
+        """Check if 'num' is not in the current row, column and sub-box."""
         self._limit_calls(base_delay, interval, threshold)
 
         # Check if the number is in the given row or column
-        for i in range(9):
+        for i in range(self.size):
             if self.grid[row][i] == num or self.grid[i][col] == num:
                 return False
 
-        # Check if the number is in the 3x3 sub-box
-        start_row, start_col = 3 * (row // 3), 3 * (col // 3)
-        for i in range(3):
-            for j in range(3):
+        # Check if the number is in the sub-box
+        start_row, start_col = self.box * (row // self.box), self.box * (
+            col // self.box
+        )
+        for i in range(self.box):
+            for j in range(self.box):
                 if self.grid[start_row + i][start_col + j] == num:
                     return False
 
@@ -86,7 +119,10 @@ class Sudoku:
         self._limit_calls(base_delay, interval, threshold)
 
         # Check row
-        if sum(self.grid[row]) != 45 or len(set(self.grid[row])) != 9:
+        if (
+            sum(self.grid[row]) != self.size * (self.size + 1) // 2
+            or len(set(self.grid[row])) != self.size
+        ):
             return False
 
         return True
@@ -97,24 +133,27 @@ class Sudoku:
 
         # Check col
         if (
-            sum([self.grid[row][col] for row in range(9)]) != 45
-            or len(set([self.grid[row][col] for row in range(9)])) != 9
+            sum([self.grid[row][col] for row in range(self.size)])
+            != self.size * (self.size + 1) // 2
+            or len(set([self.grid[row][col] for row in range(self.size)])) != self.size
         ):
             return False
 
         return True
 
     def check_square(self, row, col, base_delay=None, interval=None, threshold=None):
-        """Check if the given 3x3 square is correct."""
+        """Check if the given square is correct."""
         self._limit_calls(base_delay, interval, threshold)
 
         # Check square
+        values = [
+            self.grid[row + i][col + j]
+            for i in range(self.box)
+            for j in range(self.box)
+        ]
         if (
-            sum([self.grid[row + i][col + j] for i in range(3) for j in range(3)]) != 45
-            or len(
-                set([self.grid[row + i][col + j] for i in range(3) for j in range(3)])
-            )
-            != 9
+            sum(values) != self.size * (self.size + 1) // 2
+            or len(set(values)) != self.size
         ):
             return False
 
@@ -143,65 +182,98 @@ class Sudoku:
 
         return True
 
+    def is_solved(self, base_delay=None, interval=None, threshold=None):
+        """Check if the Sudoku solution is correct, for any grid size.
+
+        9x9 grids go through ``check`` itself, other sizes through the same row, column and square checks.
+        """
+        if self.size == 9:
+            return self.check(base_delay, interval, threshold)
+
+        for i in range(self.size):
+            if not self.check_row(i, base_delay, interval, threshold):
+                return False
+            if not self.check_column(i, base_delay, interval, threshold):
+                return False
+            if not self.check_square(
+                (i // self.box) * self.box,
+                (i % self.box) * self.box,
+                base_delay,
+                interval,
+                threshold,
+            ):
+                return False
+
+        return True
+
+    @classmethod
+    def square_origin(cls, square: int, grid: sudoku_type) -> tuple[int, int]:
+        """Row and column of the top-left cell of the given square."""
+        box = cls.box_size(grid)
+        return (square // box) * box, (square % box) * box
+
     @classmethod
     def return_square(cls, square: int, grid: sudoku_type) -> list[list[int]]:
-        start_row, start_col = (square // 3) * 3, (square % 3) * 3
+        box = cls.box_size(grid)
+        start_row, start_col = cls.square_origin(square, grid)
         extracted_square = [
-            [grid[i + start_row][j + start_col] for j in range(3)] for i in range(3)
+            [grid[i + start_row][j + start_col] for j in range(box)] for i in range(box)
         ]
         return extracted_square
 
     @classmethod
     def get_number_of_zeros_in_square(cls, square: int, grid: sudoku_type) -> int:
-        start_row, start_col = (square // 3) * 3, (square % 3) * 3
+        box = cls.box_size(grid)
+        start_row, start_col = cls.square_origin(square, grid)
         return sum(
             [
                 1
-                for i in range(3)
-                for j in range(3)
+                for i in range(box)
+                for j in range(box)
                 if grid[i + start_row][j + start_col] == 0
             ]
         )
 
     @classmethod
     def replace_square(cls, square: int, values: list[list[int]], grid: sudoku_type):
-        start_row, start_col = (square // 3) * 3, (square % 3) * 3
-        for i in range(3):
-            for j in range(3):
+        box = cls.box_size(grid)
+        start_row, start_col = cls.square_origin(square, grid)
+        for i in range(box):
+            for j in range(box):
                 grid[i + start_row][j + start_col] = values[i][j]
 
     @classmethod
     def update_square(cls, square: int, grid: sudoku_type) -> tuple[sudoku_type, bool]:
-        rows_idx = [i + ((square // 3) * 3) for i in range(3)]
-        cols_idx = [i + ((square % 3) * 3) for i in range(3)]
+        box = cls.box_size(grid)
+        start_row, start_col = cls.square_origin(square, grid)
+        rows_idx = [i + start_row for i in range(box)]
+        cols_idx = [i + start_col for i in range(box)]
 
         zeros_number = cls.get_number_of_zeros_in_square(square, grid)
 
         if zeros_number == 0:
             return grid, True
 
-        logging.info(f"Updating square {square} with {zeros_number} zeros")
+        log.event("square.updated", square=square, zeros=zeros_number)
 
         for i in rows_idx:
             row = grid[i]
             for j in cols_idx:
-                col = [grid[k][j] for k in range(9)]
+                col = [grid[k][j] for k in range(len(grid))]
                 if grid[i][j] == 0:
-                    while True:
-                        new_value = random.randint(1, 9)
-                        if (
-                            new_value not in row
-                            and new_value not in col
-                            and new_value
-                            not in [
-                                num
-                                for lst in cls.return_square(square, grid)
-                                for num in lst
-                            ]
-                        ):
-                            grid[i][j] = new_value
-                            logging.info(f"Updated ({i}, {j}) with {new_value}")
-                            return grid, zeros_number == 1
+                    used = set(row) | set(col)
+                    used.update(
+                        num for lst in cls.return_square(square, grid) for num in lst
+                    )
+                    candidates = [n for n in range(1, len(grid) + 1) if n not in used]
+                    if not candidates:
+                        # Earlier fills left nothing for this cell, don't spin on it
+                        log.event("cell.stuck", row=i, column=j)
+                        return grid, False
+                    new_value = random.choice(candidates)
+                    grid[i][j] = new_value
+                    log.event("cell.updated", row=i, column=j, value=new_value)
+                    return grid, zeros_number == 1
 
 
 if __name__ == "__main__":
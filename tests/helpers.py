@@ -0,0 +1,9 @@
+import time
+
+
+def wait_until(predicate, timeout: float = 10) -> bool:
+    """Poll a condition reached by other threads, returning whether it held before the timeout."""
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
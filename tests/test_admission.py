@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from admission import AdmissionController, AdmissionRejected
+from cluster import Cluster
+
+
+def test_waiting_requests_run_by_priority_then_difficulty():
+    admission = AdmissionController(max_in_flight=1, max_queue=3)
+    admission.acquire()
+    order = []
+
+    def request(name, priority, difficulty):
+        with admission.admit(priority, difficulty):
+            order.append(name)
+
+    threads = [
+        threading.Thread(target=request, args=args)
+        for args in [("hard", 0, 60), ("easy", 0, 20), ("urgent", 5, 70)]
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire()
+    assert rejected.value.retry_after >= 1
+
+    admission.release(0.1)
+    for thread in threads:
+        thread.join(2)
+
+    assert order == ["urgent", "easy", "hard"]
+    assert admission.stats()["in_flight"] == 0
+    assert admission.stats()["rejected"] == 1
+
+
+def test_priority_must_be_an_integer():
+    grid = [[0] * 4 for _ in range(4)]
+    with Cluster(1) as cluster:
+        for priority in (True, "1", 1.5):
+            response = requests.post(
+                cluster.url(0, "/solve"), json={"sudoku": grid, "priority": priority}
+            )
+            assert response.status_code == 400, priority
@@ -0,0 +1,32 @@
+import threading
+
+from p2p import P2PServer
+
+
+def start(port, parent=None):
+    server = P2PServer(port, parent, 0)
+    threading.Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def test_nodes_join_in_parallel_and_become_ready():
+    root = start(6100)
+    children = [start(6101 + i, "127.0.0.1:6100") for i in range(4)]
+
+    for server in [root, *children]:
+        assert server.ready.wait(5)
+
+    for child in children:
+        health = child.get_health()
+        assert health["ready"] and health["connecting"] == []
+        assert root.address in child.neighbors
+
+
+def test_unreachable_parent_is_given_up_on():
+    server = P2PServer(6110, "127.0.0.1:6111", 0)
+    server.connect_attempts = 2
+    server.connect_base_delay = 0.01
+    threading.Thread(target=server.run, daemon=True).start()
+
+    assert not server.ready.wait(0.5)
+    assert server.get_health()["connecting"] == []
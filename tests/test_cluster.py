@@ -0,0 +1,15 @@
+import requests
+
+from cluster import Cluster
+
+
+def test_killed_node_leaves_the_network():
+    with Cluster(3, parents="chain") as cluster:
+        assert all(len(node.p2p.neighbors) == 2 for node in cluster)
+
+        cluster.kill(2)
+        assert cluster[0].p2p.wait_for_neighbors(1, 5)
+        assert cluster[1].p2p.wait_for_neighbors(1, 5)
+
+        assert requests.get(cluster.url(0, "/health")).json()["neighbors"] == 1
+        assert cluster.stop()
@@ -0,0 +1,84 @@
+import socket
+import threading
+
+import pytest
+
+from cluster import Cluster
+from connection import BufferPool, RecvBuffer, SendQueue, SendQueueFull
+from protocol import KeepAlive, P2PProtocol, StoreSudoku
+from tests.helpers import wait_until
+
+
+def test_send_queue_coalesces_frames():
+    a, b = socket.socketpair()
+    queue = SendQueue()
+
+    assert queue.put(b"first")
+    assert queue.put(b"keep-alive", "KeepAlive")
+    assert not queue.put(b"keep-alive", "KeepAlive")
+    assert queue.put(b"second")
+
+    assert queue.flush(a)
+    assert not queue.pending
+    assert b.recv(1024) == b"firstkeep-alivesecond"
+    assert queue.put(b"keep-alive", "KeepAlive")
+
+
+def test_send_queue_backpressure():
+    queue = SendQueue(max_bytes=10, high_water=4)
+
+    queue.put(b"12345")
+    assert queue.congested
+    with pytest.raises(SendQueueFull):
+        queue.put(b"123456")
+
+
+def test_recv_buffer_decodes_every_frame_received_at_once():
+    a, b = socket.socketpair()
+    pool = BufferPool(size=1024)
+    inbox = RecvBuffer(pool)
+    small = P2PProtocol.encode(KeepAlive({}, {}))
+    large = P2PProtocol.encode(
+        StoreSudoku("id", [list(range(i, i + 100)) for i in range(10)], None)
+    )
+    assert len(large) > pool.size
+
+    a.sendall(small * 3 + large[:100])
+    assert len(P2PProtocol.recv_msgs(b, inbox)) == 3
+    a.sendall(large[100:])
+    messages = []
+    while not messages:
+        messages = P2PProtocol.recv_msgs(b, inbox)
+    assert [m.id for m in messages] == ["id"]
+    assert len(inbox.buffer) == pool.size  # Back to a pooled buffer
+
+    buffer = inbox.buffer
+    inbox.close()
+    assert RecvBuffer(pool).buffer is buffer and pool.created == 1
+
+    a.close()
+    assert P2PProtocol.recv_msgs(b, RecvBuffer(pool)) is None
+
+
+def test_full_send_queue_disconnects_on_the_selector_thread():
+    with Cluster(2) as cluster:
+        p2p, other = cluster[0].p2p, cluster[1].p2p
+        selector, disconnects = [], []
+        p2p.call_later(0, lambda: selector.append(threading.current_thread()))
+        assert wait_until(lambda: selector)
+
+        disconnect_node = p2p.disconnect_node
+
+        def recorded(conn):
+            disconnects.append(threading.current_thread())
+            disconnect_node(conn)
+
+        p2p.disconnect_node = recorded
+        conn = p2p.neighbors[other.address][0]
+        p2p.outboxes[conn].max_bytes = 0
+        p2p.send(conn, KeepAlive({}, {}))
+        p2p.send(conn, KeepAlive({}, {}))
+
+        assert wait_until(lambda: other.address not in p2p.neighbors)
+        assert disconnects and set(disconnects) == set(selector)
+        assert conn not in p2p.outboxes and conn not in p2p.inboxes
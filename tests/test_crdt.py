@@ -0,0 +1,38 @@
+import random
+
+from crdt import GCounter
+
+A, B, C = ("10.0.0.1", 7000), ("10.0.0.2", 7000), ("10.0.0.3", 7000)
+
+
+def test_merge_is_idempotent_and_keeps_total():
+    counter = GCounter()
+    counter.increment(A, 5)
+    counter.increment(B)
+
+    assert not counter.merge({A: 3, B: 1})
+    assert counter.merge({B: 4, C: 2})
+    assert counter.merge({B: 4, C: 2}) is False
+    assert counter.value == 5 + 4 + 2
+    assert counter.value == sum(counter.state().values())
+
+
+def test_replicas_converge_whatever_the_delivery_order():
+    owners = [A, B, C]
+    replicas = {node: GCounter() for node in owners}
+    rng = random.Random(1)
+    snapshots = []
+    for _ in range(100):
+        node = rng.choice(owners)
+        replicas[node].increment(node, rng.randint(1, 3))
+        snapshots.append(replicas[node].state())
+
+    # A late joiner sees the states shuffled and duplicated
+    late = GCounter()
+    for state in rng.sample(snapshots * 2, len(snapshots) * 2):
+        late.merge(state)
+    for node in owners:
+        replicas[node].merge(late.state())
+
+    assert late.value == sum(replicas[node].get(node) for node in owners)
+    assert all(replicas[node].state() == late.state() for node in owners)
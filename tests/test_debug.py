@@ -0,0 +1,33 @@
+import tracemalloc
+
+import requests
+
+from cluster import Cluster
+
+
+def test_debug_endpoints_are_off_by_default():
+    with Cluster(1) as cluster:
+        assert requests.get(cluster.url(0, "/debug/threads")).status_code == 404
+
+
+def test_debug_endpoints():
+    with Cluster(2, debug=True) as cluster:
+        profile = requests.get(cluster.url(0, "/debug/profile?seconds=0.2"))
+        assert profile.status_code == 200
+        stack, count = profile.text.splitlines()[0].rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+        threads = requests.get(cluster.url(0, "/debug/threads")).json()
+        assert any(stack for stack in threads.values())
+
+        memory = requests.get(cluster.url(0, "/debug/memory?top=5")).json()
+        assert memory["tracing"] and len(memory["top"]) <= 5
+        assert set(memory["structures"]) == {
+            "sudokus",
+            "memo",
+            "rate_limiter",
+            "seen_broadcasts",
+            "receive_buffers",
+        }
+
+    tracemalloc.stop()  # It slows down the other tests
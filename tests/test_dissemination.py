@@ -0,0 +1,47 @@
+from dissemination import SpanningTree
+
+
+def spread(tree: SpanningTree, members, origin, dead=()):
+    """Deliver a broadcast through the tree, returning how many copies each node got and sent."""
+    received = {m: 0 for m in members}
+    sent = {m: 0 for m in members}
+    pending = [origin]
+    while pending:
+        node = pending.pop()
+        targets = tree.targets(members, origin, node, lambda m: m not in dead)
+        sent[node] += len(targets)
+        for target in targets:
+            received[target] += 1
+            pending.append(target)
+    return received, sent
+
+
+def test_tree_reaches_every_node_once():
+    members = sorted(("127.0.0.1", 7000 + i) for i in range(50))
+    for fanout in (1, 2, 3, 8):
+        tree = SpanningTree(fanout)
+        origin = members[17]
+
+        received, sent = spread(tree, members, origin)
+
+        assert all(received[m] == 1 for m in members if m != origin)
+        assert received[origin] == 0
+        assert max(sent.values()) <= fanout
+
+
+def test_tree_skips_dead_nodes():
+    members = sorted(("127.0.0.1", 7000 + i) for i in range(20))
+    dead = {members[1], members[2]}
+
+    received, _ = spread(SpanningTree(2), members, members[0], dead)
+
+    assert all(received[m] == 1 for m in members[3:])
+
+
+def test_duplicates_are_suppressed():
+    tree = SpanningTree(max_seen=2)
+
+    assert tree.first_time("a")
+    assert not tree.first_time("a")
+    assert tree.first_time("b") and tree.first_time("c")
+    assert tree.first_time("a")
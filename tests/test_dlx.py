@@ -0,0 +1,30 @@
+import random
+
+import dlx
+import solver
+from gen import generate_unique_sudoku
+from sudoku import Sudoku
+
+
+def test_solve():
+    rng = random.Random(3)
+    for _ in range(5):
+        puzzle = generate_unique_sudoku(26, rng)
+
+        assert dlx.solve(puzzle) == solver.solve(puzzle)
+        assert dlx.count_solutions(puzzle) == 1
+
+
+def test_count_solutions():
+    assert dlx.count_solutions([[0] * 9 for _ in range(9)], limit=5) == 5
+    assert dlx.count_solutions([[1, 1] + [0] * 7] + [[0] * 9 for _ in range(8)]) == 0
+    assert dlx.solve([[1, 1] + [0] * 7] + [[0] * 9 for _ in range(8)]) is None
+
+
+def test_solve_16x16():
+    puzzle = generate_unique_sudoku(120, random.Random(5), box=4)
+
+    solved = dlx.solve(puzzle)
+
+    assert solved == solver.solve(puzzle)
+    assert Sudoku(solved).is_solved(base_delay=0)
@@ -0,0 +1,45 @@
+import json
+import logging
+
+import events
+from cluster import Cluster
+from events import EventFormatter, EventLogger
+
+
+def test_disabled_and_sampled_events_cost_nothing(caplog, monkeypatch):
+    monkeypatch.setitem(events.EVENT_LEVELS, "test.debug", logging.DEBUG)
+    monkeypatch.setitem(events.EVENT_SAMPLING, "test.sampled", 0.25)
+    log = EventLogger("test")
+    calls = []
+
+    with caplog.at_level(logging.INFO):
+        log.event("test.debug", grid=lambda: calls.append(1))
+        for i in range(8):
+            log.event("test.sampled", i=i)
+
+    assert calls == []
+    assert [r.fields["i"] for r in caplog.records] == [0, 4]
+
+
+def test_formatter_writes_json_lines(caplog):
+    log = EventLogger("test")
+    with caplog.at_level(logging.INFO):
+        log.event("test.event", job=3, grid=lambda: [[1, 2], [3, 4]])
+        logging.getLogger("test").info("plain %s", "message")
+
+    formatter = EventFormatter()
+    event, plain = [json.loads(formatter.format(r)) for r in caplog.records]
+    assert event["event"] == "test.event" and event["job"] == 3
+    assert event["grid"] == [[1, 2], [3, 4]]
+    assert plain["msg"] == "plain message"
+
+
+def test_nodes_keep_the_logging_config_of_their_process():
+    root = logging.getLogger()
+    handler = logging.NullHandler()
+    root.addHandler(handler)
+    try:
+        with Cluster(1):
+            assert handler in root.handlers
+    finally:
+        root.removeHandler(handler)
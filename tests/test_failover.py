@@ -0,0 +1,70 @@
+import random
+
+import requests
+
+from cluster import Cluster
+from consts import Engine, JobStatus
+from gen import generate_unique_sudoku
+from hashring import HashRing
+from protocol import StoreSudoku, WorkComplete
+from solver import solve
+from sudoku import Sudoku
+from tests.helpers import wait_until
+
+NODES = [("127.0.0.1", 7000 + i) for i in range(5)]
+
+
+def test_hash_ring_only_moves_the_keys_of_a_leaving_node():
+    keys = [f"sudoku-{i}" for i in range(200)]
+    ring = HashRing(NODES)
+    owners = {key: ring.owner(key) for key in keys}
+    assert owners == {key: HashRing(NODES[::-1]).owner(key) for key in keys}
+    assert len(set(owners.values())) == len(NODES)
+
+    smaller = HashRing(NODES[1:])
+    for key in keys:
+        if owners[key] != NODES[0]:
+            assert smaller.owner(key) == owners[key]
+
+
+def test_successor_resumes_the_puzzles_of_a_dead_coordinator():
+    with Cluster(3, engine=Engine.DLX) as cluster:
+        coordinator = cluster[0].p2p
+        grid = generate_unique_sudoku(40, random.Random(0))
+        solution = solve(grid)
+
+        # Replicas of a puzzle with its first squares done, as the coordinator's broadcasts leave them
+        coordinator.disseminate(StoreSudoku("orphan", grid, coordinator.address))
+        partial = [row[:] for row in grid]
+        for square in range(4):
+            Sudoku.replace_square(
+                square, Sudoku.return_square(square, solution), partial
+            )
+            coordinator.disseminate(
+                WorkComplete("orphan", Sudoku(partial), square, {}, {})
+            )
+        replicas = [cluster[1].p2p, cluster[2].p2p]
+        assert wait_until(
+            lambda: all(
+                "orphan" in p2p.sudokus
+                and p2p.sudokus["orphan"].status(3) == JobStatus.COMPLETED
+                for p2p in replicas
+            )
+        )
+
+        cluster.kill(0)
+        owner = HashRing([p2p.address for p2p in replicas]).owner("orphan")
+        successor = next(p2p for p2p in replicas if p2p.address == owner)
+        other = next(p2p for p2p in replicas if p2p is not successor)
+
+        state = successor.sudokus["orphan"]
+        assert wait_until(lambda: state.is_completed())
+        assert state.sudoku.grid == solution
+        assert state.assignees[:4] == [None] * 4  # Never dispatched again
+        assert successor.taken_over == 1 and other.taken_over == 0
+
+        # The other replica learns of the solution, and answers the client's retry with it
+        assert wait_until(lambda: other.sudokus["orphan"].is_completed())
+        index = cluster.nodes.index(next(node for node in cluster if node.p2p is other))
+        response = requests.post(cluster.url(index, "/solve"), json={"sudoku": grid})
+        assert response.json()["sudoku"] == solution
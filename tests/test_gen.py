@@ -0,0 +1,40 @@
+import random
+
+from gen import generate_unique_sudoku, read_corpus, write_puzzle
+from solver import count_solutions, solve
+from sudoku import Sudoku
+
+
+def test_solve():
+    puzzle = generate_unique_sudoku(30, random.Random(1))
+
+    solved = solve(puzzle)
+
+    assert Sudoku(solved).check(base_delay=0)
+    assert all(puzzle[i][j] in (0, solved[i][j]) for i in range(9) for j in range(9))
+
+
+def test_count_solutions():
+    assert count_solutions([[0] * 9 for _ in range(9)], limit=5) == 5
+    assert count_solutions([[1, 1] + [0] * 7] + [[0] * 9 for _ in range(8)]) == 0
+
+
+def test_generate_unique():
+    rng = random.Random(42)
+    for clues in (25, 40):
+        puzzle = generate_unique_sudoku(clues, rng)
+
+        assert sum(1 for row in puzzle for value in row if value != 0) == clues
+        assert count_solutions(puzzle) == 1
+
+
+def test_corpus_formats(tmp_path):
+    puzzles = [generate_unique_sudoku(35, random.Random(seed)) for seed in range(3)]
+
+    for name in ("corpus.ndjson", "corpus.bin"):
+        path = tmp_path / name
+        with open(path, "wb" if name.endswith(".bin") else "w") as f:
+            for puzzle in puzzles:
+                write_puzzle(f, puzzle, name.endswith(".bin"))
+
+        assert list(read_corpus(str(path))) == puzzles
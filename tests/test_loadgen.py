@@ -0,0 +1,48 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loadgen import LoadGenerator, percentile
+
+
+class FakeNode(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        FakeNode.requests += 1
+        self.send_response(429 if FakeNode.requests % 5 == 0 else 200)
+        self.end_headers()
+        self.wfile.write(json.dumps({"sudoku": None}).encode())
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps({"memo": {"hits": 3, "misses": 1}}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) is None
+
+
+def test_closed_loop_reports_statuses_and_latencies():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeNode)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    generator = LoadGenerator([server.server_address], [[[0]]], extra={"priority": 1})
+    report = asyncio.run(generator.run("closed", concurrency=4, requests=20))
+    server.shutdown()
+
+    results = report["results"]
+    assert results["requests"] == 20
+    assert results["statuses"] == {"200": 16, "429": 4}
+    assert results["error_rate"] == 0.2
+    assert results["latency_ms"]["p50"] <= results["latency_ms"]["max"]
+    assert report["config"]["priority"] == 1
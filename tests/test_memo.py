@@ -0,0 +1,45 @@
+from memo import SquareMemo
+from solver import solve
+
+PUZZLE = [
+    [5, 3, 0, 0, 7, 0, 0, 0, 0],
+    [6, 0, 0, 1, 9, 5, 0, 0, 0],
+    [0, 9, 8, 0, 0, 0, 0, 6, 0],
+    [8, 0, 0, 0, 6, 0, 0, 0, 3],
+    [4, 0, 0, 8, 0, 3, 0, 0, 1],
+    [7, 0, 0, 0, 2, 0, 0, 0, 6],
+    [0, 6, 0, 0, 0, 0, 2, 8, 0],
+    [0, 0, 0, 4, 1, 9, 0, 0, 5],
+    [0, 0, 0, 0, 8, 0, 0, 7, 9],
+]
+
+
+def test_key_depends_on_crossing_rows_and_columns():
+    other = [row[:] for row in PUZZLE]
+    other[0][8] = 4  # Same square 0, but row 0 now also has a 4
+    assert SquareMemo.key(0, PUZZLE) != SquareMemo.key(0, other)
+
+    # Cells that don't cross square 0 aren't part of its key
+    other = [row[:] for row in PUZZLE]
+    other[8][8] = 0
+    assert SquareMemo.key(0, PUZZLE) == SquareMemo.key(0, other)
+
+
+def test_lru_eviction_and_hit_rate():
+    solution = solve(PUZZLE)
+    memo = SquareMemo(capacity=2)
+    keys = [SquareMemo.key(square, PUZZLE) for square in range(3)]
+    for square, key in enumerate(keys):
+        memo.put(key, [row[square * 3 : square * 3 + 3] for row in solution[:3]])
+
+    assert memo.get(keys[0]) is None
+    assert memo.get(keys[2]) == [row[6:9] for row in solution[:3]]
+    assert memo.stats() | {"hit_rate": None} == {
+        "size": 2,
+        "capacity": 2,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+        "hit_rate": None,
+    }
+    assert memo.stats()["hit_rate"] == 0.5
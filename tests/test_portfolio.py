@@ -0,0 +1,92 @@
+import random
+
+from cluster import Cluster
+from consts import Strategy
+from gen import generate_unique_sudoku
+from portfolio import Race, is_solution_of
+from solver import solve
+from tests.helpers import wait_until
+from utils import AddressUtils
+
+
+def test_race():
+    puzzle = generate_unique_sudoku(30, random.Random(2))
+    race = Race("race", puzzle)
+
+    for strategy in Strategy:
+        race.add_local(strategy, 1)
+    race.start()
+    solution = race.wait(10)
+    race.cancel()
+
+    assert solution == solve(puzzle)
+    assert race.outcome()["winner"]["strategy"] in list(Strategy)
+    assert race.outcome()["features"] == {"size": 9, "clues": 30, "fill": 0.37}
+
+
+def test_invalid_results_do_not_win():
+    puzzle = generate_unique_sudoku(30, random.Random(2))
+    wrong = [row[:] for row in solve(puzzle)]
+    wrong[0][0], wrong[0][1] = wrong[0][1], wrong[0][0]
+    race = Race("race", puzzle)
+    tags = [race.add_entry(Strategy.RESTARTS, "remote", seed) for seed in (1, 2)]
+
+    assert not race.submit(tags[0], wrong)
+    assert not is_solution_of(puzzle, wrong)
+    assert race.submit(tags[1], solve(puzzle))
+    assert race.wait(0) == solve(puzzle)
+
+
+def test_race_waits_for_entries_added_before_it_started():
+    puzzle = generate_unique_sudoku(30, random.Random(2))
+    # Two 1s in the first row: the local entry soon finds there is no solution
+    impossible = [row[:] for row in puzzle]
+    impossible[0] = [1, 1] + [0] * 7
+    race = Race("race", puzzle)
+    race.add_local(Strategy.DLX, 1, grid=impossible)
+    remote = race.add_entry(Strategy.RESTARTS, "remote", 2)
+    race.start()
+
+    assert wait_until(lambda: len(race.finishers) == 1)
+    assert not race.done.is_set()
+    assert race.submit(remote, solve(puzzle))
+    assert race.wait(0) == solve(puzzle)
+    race.cancel()
+
+
+def test_crashed_processes_finish_their_entry():
+    puzzle = generate_unique_sudoku(30, random.Random(2))
+    race = Race("race", puzzle)
+    race.add_local(Strategy.DLX, 1, grid=[[0, 0], [0]])  # Makes the solver raise
+    race.start()
+
+    assert race.wait(10) is None
+    assert race.done.is_set()
+    assert [f["solved"] for f in race.finishers] == [False]
+    race.cancel()
+
+
+def test_races_give_up_after_the_timeout():
+    puzzle = generate_unique_sudoku(30, random.Random(2))
+    race = Race("race", puzzle)
+    race.add_entry(Strategy.RESTARTS, "remote", 1)  # Never reports back
+
+    assert race.wait(0.1) is None
+    race.cancel()
+    assert race.cancelled
+
+
+def test_entries_of_a_neighbor_that_left_are_finished():
+    puzzle = generate_unique_sudoku(30, random.Random(2))
+    with Cluster(2) as cluster:
+        p2p, other = cluster[0].p2p, cluster[1].p2p
+        race = Race("race", puzzle)
+        # As a subtree race whose only other branch is searched by the neighbor
+        race.add_entry(Strategy.MRV, AddressUtils.address_to_str(other.address), 1)
+        race.remote.add(other.address)
+        p2p.races[race.id] = race
+
+        cluster.kill(1)
+        assert wait_until(race.done.is_set)
+        assert race.wait(0) is None
+        assert [f["solved"] for f in race.finishers] == [False]
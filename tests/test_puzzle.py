@@ -0,0 +1,65 @@
+import threading
+
+from consts import JobStatus
+from puzzle import PuzzleState
+from sudoku import Sudoku
+
+GRID = [[0] * 9 for _ in range(9)]
+NODE = ("127.0.0.1", 7000)
+OTHER = ("127.0.0.1", 7001)
+
+
+def make_state() -> PuzzleState:
+    return PuzzleState("id", Sudoku([row[:] for row in GRID]), NODE, GRID)
+
+
+def test_transitions_are_in_place():
+    state = make_state()
+    statuses, assignees = state.statuses, state.assignees
+
+    assert state.claim_job(0, OTHER)
+    assert not state.claim_job(0, NODE)
+    state.set_job(1, JobStatus.COMPLETED, NODE)
+
+    assert state.statuses is statuses and state.assignees is assignees
+    assert state.jobs()[:2] == [
+        (JobStatus.IN_PROGRESS, OTHER),
+        (JobStatus.COMPLETED, NODE),
+    ]
+    assert state.busy_nodes() == {OTHER}
+    assert state.version == 2
+
+
+def test_release_jobs_of_leaving_node():
+    state = make_state()
+    state.claim_job(3, OTHER)
+    state.claim_job(4, NODE)
+
+    assert state.release_jobs_of(OTHER)
+    assert not state.release_jobs_of(OTHER)
+    assert state.status(3) == JobStatus.PENDING
+    assert state.busy_nodes() == {NODE}
+
+
+def test_wait_for_change_wakes_up_on_completion():
+    state = make_state()
+    state.claim_job(0, OTHER)
+    version = state.version
+
+    timer = threading.Timer(0.05, state.set_job, (0, JobStatus.COMPLETED))
+    timer.start()
+    assert state.wait_for_change(version, 5) == version + 1
+    assert state.wait_for_change(version + 1, 0.01) == version + 1
+
+    state.finish(GRID, None)
+    assert state.is_completed()
+
+
+def test_release_job_only_if_still_held():
+    state = make_state()
+    state.claim_job(2, OTHER)
+
+    assert not state.release_job(2, NODE)
+    assert state.release_job(2, OTHER)
+    assert state.status(2) == JobStatus.PENDING
+    assert not state.release_job(2, OTHER)
@@ -0,0 +1,48 @@
+import requests
+
+from cluster import Cluster
+from consts import Engine
+from gen import generate_sudoku
+from recorder import (
+    FRAME,
+    REQUEST,
+    RESPONSE,
+    START,
+    Recorder,
+    Recording,
+    read_recording,
+)
+from replay import Replay
+
+
+def test_record_and_replay(tmp_path):
+    paths = [str(tmp_path / f"{i}.rec") for i in range(2)]
+    # Slow enough nodes that puzzles are split between them, so they exchange work
+    options = {"handicaps": [50, 50], "engine": Engine.DLX}
+    with Cluster(2, **options) as cluster:
+        for node, path in zip(cluster, paths):
+            node.p2p.recorder = Recorder(path, node.p2p.address)
+        for i in range(2):
+            sudoku = generate_sudoku(3)
+            response = requests.post(
+                cluster.url(i, "/solve"), json={"sudoku": sudoku.grid}
+            )
+            assert response.status_code == 200
+        assert requests.get(cluster.url(0, "/stats")).status_code == 200
+    # Closing the nodes closed the recorders
+
+    kinds = [kind for _, kind, _ in read_recording(paths[0])]
+    assert kinds[0] == START and {REQUEST, RESPONSE, FRAME} <= set(kinds)
+
+    recordings = [Recording(path) for path in paths]
+    assert [len(r.requests) for r in recordings] == [2, 1]
+    assert all(r["status"] == 200 and r["seconds"] > 0 for r in recordings[0].requests)
+    assert (
+        recordings[0].frames["WorkBatchComplete"] and recordings[1].frames["WorkBatch"]
+    )
+
+    result = Replay(recordings, speed=4).run(**options)["results"]
+    assert result["requests"] == {"recorded": 3, "replayed": 3}
+    assert result["statuses"]["replayed"] == {"200": 3}
+    assert result["latency_ms"]["/solve"]["replayed"]["count"] == 2
+    assert result["frames"]["WorkBatch"]["replayed"] > 0
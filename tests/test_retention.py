@@ -0,0 +1,63 @@
+import time
+
+import requests
+
+from cluster import Cluster
+from puzzle import PuzzleState
+from sudoku import Sudoku
+
+GRID = [[0] * 4 for _ in range(4)]
+OTHER = ("127.0.0.1", 7001)
+
+
+def add_puzzle(p2p, id: str, coordinator=OTHER, completed: bool = False):
+    state = PuzzleState(id, Sudoku([row[:] for row in GRID]), coordinator, GRID)
+    if completed:
+        state.finish([row[:] for row in GRID], None)
+    p2p.sudokus[id] = state
+    return state
+
+
+def test_completed_puzzles_are_capped_then_expired():
+    with Cluster(1, retention=60, max_puzzles=2) as cluster:
+        p2p = cluster[0].p2p
+        for i in range(3):
+            add_puzzle(p2p, f"done-{i}", completed=True)
+        add_puzzle(p2p, "mine", coordinator=p2p.address)
+        p2p.touch("done-0")
+
+        p2p.expire_puzzles()
+        # A sweep doesn't start another timer chain
+        assert [t[2] for t in p2p.timers].count(p2p.keep_expiring) == 1
+        # The least recently used completed puzzle goes first, in-flight ones stay
+        assert set(p2p.sudokus) == {"done-0", "done-2", "mine"}
+
+        p2p.retention = 0
+        p2p.expire_puzzles()
+        assert set(p2p.sudokus) == {"mine"}
+
+        memory = requests.get(cluster.url(0, "/stats")).json()["memory"]
+        assert memory["sudokus"] == {"count": 1, "expired": 3}
+        assert p2p.memory_usage()["sudokus"]["bytes"] > 0
+
+
+def test_abandoned_puzzles_expire():
+    with Cluster(1, retention=0.1) as cluster:
+        p2p = cluster[0].p2p
+        add_puzzle(p2p, "abandoned")
+        state = add_puzzle(p2p, "done", completed=True)
+        assert state.completed_at is not None
+
+        deadline = time.monotonic() + 5
+        while p2p.sudokus and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not p2p.sudokus
+
+
+def test_rate_limiter_forgets_old_requests():
+    sudoku = Sudoku([row[:] for row in GRID], base_delay=0, interval=0.05)
+    for _ in range(10):
+        sudoku.check_row(0)
+    time.sleep(0.06)
+    sudoku.check_row(0)
+    assert len(sudoku.recent_requests) == 1
@@ -0,0 +1,77 @@
+import requests
+
+from cluster import Cluster
+from consts import Engine, Route
+from gen import generate_sudoku
+from router import Probe, Router, branches, propagate
+from solver import solve
+
+NODE = ("127.0.0.1", 7000)
+NEIGHBORS = [("127.0.0.1", 7001), ("127.0.0.1", 7002)]
+
+PUZZLE = [
+    [5, 3, 0, 0, 7, 0, 0, 0, 0],
+    [6, 0, 0, 1, 9, 5, 0, 0, 0],
+    [0, 9, 8, 0, 0, 0, 0, 6, 0],
+    [8, 0, 0, 0, 6, 0, 0, 0, 3],
+    [4, 0, 0, 8, 0, 3, 0, 0, 1],
+    [7, 0, 0, 0, 2, 0, 0, 0, 6],
+    [0, 6, 0, 0, 0, 0, 2, 8, 0],
+    [0, 0, 0, 4, 1, 9, 0, 0, 5],
+    [0, 0, 0, 0, 8, 0, 0, 7, 9],
+]
+
+# Needs thousands of search nodes
+HARD_DIGITS = (
+    "800000000003600000070090200050007000000045700000100030001000068008500010090000400"
+)
+HARD = [[int(c) for c in HARD_DIGITS[i : i + 9]] for i in range(0, 81, 9)]
+
+
+def test_probe_and_branches():
+    propagated, depth = propagate(PUZZLE)
+    assert depth > 0 and propagated == solve(PUZZLE)  # Singles are enough for this one
+
+    probe = Probe(HARD)
+    assert not probe.finished and probe.solution is None
+    grids = branches(HARD)
+    assert len(grids) > 1
+    assert sum(grid == solve(HARD) for grid in map(solve, grids)) == 1
+
+
+def test_small_puzzles_stay_local_and_slow_nodes_distribute():
+    router = Router(NODE, handicap=0)
+    decision = router.decide(Probe(PUZZLE), NEIGHBORS)
+    assert decision.route == Route.LOCAL and decision.nodes == [NODE]
+
+    # Each job costs 50ms on any node, so 9 jobs are done sooner in rounds of 3
+    router = Router(NODE, handicap=0.05)
+    decision = router.decide(Probe(PUZZLE), NEIGHBORS)
+    assert decision.route == Route.SQUARES and len(decision.nodes) == 3
+
+    # Measured slow neighbors are left out
+    router.job_time[NEIGHBORS[0]] = 10
+    decision = router.decide(Probe(PUZZLE), NEIGHBORS)
+    assert NEIGHBORS[0] not in decision.nodes
+
+    # Hard puzzles have their search split
+    assert router.decide(Probe(HARD), NEIGHBORS).route == Route.SUBTREES
+    assert router.decide(Probe(HARD), []).route == Route.LOCAL
+
+
+def test_routes_in_a_cluster():
+    with Cluster(2, engine=Engine.DLX) as cluster:
+        sudoku = generate_sudoku(3)
+        grid = [row[:] for row in sudoku.grid]
+        response = requests.post(cluster.url(0, "/solve"), json={"sudoku": grid})
+        assert response.json()["sudoku"] == solve(sudoku.grid)
+        assert cluster[1].p2p.sudokus == {}  # Solved without telling node 1
+
+    with Cluster(2, handicaps=[50, 50], engine=Engine.DLX) as cluster:
+        response = requests.post(cluster.url(0, "/solve"), json={"sudoku": PUZZLE})
+        assert response.json()["sudoku"] == solve(PUZZLE)
+
+        stats = requests.get(cluster.url(0, "/stats")).json()["router"]
+        assert stats["decisions"]["squares"] == 1
+        assert stats["actual"] > 0
+        assert list(stats["job_time"]) and list(stats["rtt"])
@@ -0,0 +1,67 @@
+import requests
+
+from cluster import Cluster
+from gen import generate_sudoku, solve_sudoku
+from protocol import KeepAlive, P2PProtocol, StoreSudoku
+from shm import RING_SIZE, Ring
+from tests.helpers import wait_until
+
+
+def test_ring_wraps_around_and_reassembles_large_frames():
+    inbound = Ring()
+    outbound = Ring(inbound.name)
+    try:
+        small = P2PProtocol.encode(KeepAlive({}, {}))
+        count = RING_SIZE // len(small) - 1
+        assert outbound.write([memoryview(small)] * count) == count * len(small)
+        assert len(inbound.read()) == count
+
+        # Larger than the ring, so it only goes through in pieces, across the end of the ring
+        large = P2PProtocol.encode(
+            StoreSudoku("id", [list(range(i, i + 1000)) for i in range(400)], None)
+        )
+        assert len(large) > RING_SIZE
+        view, messages = memoryview(large), []
+        while view:
+            view = view[outbound.write([view]) :]
+            messages += inbound.read()
+        assert [m.id for m in messages] == ["id"]
+        assert outbound.write([memoryview(small)]) == len(small)
+        assert isinstance(inbound.read()[0], KeepAlive)
+    finally:
+        outbound.close()
+        inbound.close()
+
+
+def test_nodes_on_the_same_host_use_shared_memory():
+    with Cluster(2) as cluster:
+        stats = requests.get(cluster.url(1, "/stats")).json()
+        assert [n["transport"] for n in stats["nodes"]] == [None, "shm"]
+
+        sudoku = generate_sudoku(3)
+        response = requests.post(cluster.url(1, "/solve"), json={"sudoku": sudoku.grid})
+        solve_sudoku(sudoku.grid)
+        assert response.json()["sudoku"] == sudoku.grid
+        # Node 0 answered the join through the ring
+        link = next(iter(cluster[1].p2p.shm.values()))
+        assert link.inbound.positions[1] > 0
+
+    with Cluster(2, shared_memory=False) as cluster:
+        stats = requests.get(cluster.url(0, "/stats")).json()
+        assert stats["nodes"][1]["transport"] == "tcp"
+
+
+def test_frames_larger_than_the_ring_reach_a_neighbor():
+    with Cluster(2) as cluster:
+        sender, receiver = cluster[0].p2p, cluster[1].p2p
+        grid = [list(range(i, i + 1000)) for i in range(400)]
+        message = StoreSudoku("large", grid, sender.address)
+        assert len(P2PProtocol.encode(message)) > RING_SIZE
+
+        conn = sender.neighbors[receiver.address][0]
+        assert sender.shm[conn].outbound is not None
+        sender.send(conn, message)
+        sender.send(conn, KeepAlive({}, {}))
+        assert wait_until(lambda: "large" in receiver.sudokus)
+        assert receiver.sudokus["large"].original == grid
+        assert sender.address in receiver.neighbors
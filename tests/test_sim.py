@@ -0,0 +1,60 @@
+import pytest
+
+from consts import Engine
+from sim import Simulation, VirtualClock
+
+PUZZLE = [
+    [5, 3, 0, 0, 7, 0, 0, 0, 0],
+    [6, 0, 0, 1, 9, 5, 0, 0, 0],
+    [0, 9, 8, 0, 0, 0, 0, 6, 0],
+    [8, 0, 0, 0, 6, 0, 0, 0, 3],
+    [4, 0, 0, 8, 0, 3, 0, 0, 1],
+    [7, 0, 0, 0, 2, 0, 0, 0, 6],
+    [0, 6, 0, 0, 0, 0, 2, 8, 0],
+    [0, 0, 0, 4, 1, 9, 0, 0, 5],
+    [0, 0, 0, 0, 8, 0, 0, 7, 9],
+]
+
+
+def test_virtual_clock_runs_threads_in_simulated_time():
+    clock = VirtualClock()
+    order = []
+
+    def worker(name: str, delay: float):
+        clock.sleep(delay)
+        order.append((name, clock.monotonic()))
+
+    clock.spawn(worker, "slow", 100)
+    clock.spawn(worker, "fast", 1)
+    clock.run()
+
+    assert order == [("fast", 1), ("slow", 100)]
+
+
+def run(seed: int) -> dict:
+    simulation = Simulation(
+        12, handicaps=5, seed=seed, engine=Engine.DLX, latency=0.01, jitter=0.005
+    )
+    return simulation.run([PUZZLE], concurrency=2, requests=2)
+
+
+def test_simulation_is_deterministic():
+    result = run(seed=1)
+    assert result["name"] == "sim"
+    assert result["results"]["statuses"] == {"200": 2}
+    assert result["results"]["stats"]["solved"] == 2
+    assert result["results"]["network"]["frames"]["WorkBatch"] > 0
+
+    assert run(seed=1)["results"] == result["results"]
+
+
+@pytest.mark.parametrize("nodes", [4, 16])
+def test_nodes_get_their_jobs_of_a_puzzle_in_one_batch(nodes: int):
+    simulation = Simulation(nodes, handicaps=50, seed=0, engine=Engine.DLX)
+    frames = simulation.run([PUZZLE], concurrency=1, requests=1)["results"]["network"][
+        "frames"
+    ]
+    assert "WorkRequest" not in frames and "WorkAck" not in frames
+    # Batches are filled before the next node gets one: the 9 squares take 3 of them, at most
+    assert 0 < frames["WorkBatch"] <= min(nodes, 3)
+    assert frames["WorkBatchAck"] == frames["WorkBatch"]
@@ -1,57 +1,29 @@
-import threading
+import copy
 import time
 
 import pytest
 import requests
 
+from cluster import Cluster
+from consts import Engine, JobStatus
 from gen import generate_sudoku, solve_sudoku
-from node import Node
+from puzzle import PuzzleState
+from sudoku import Sudoku
 
 
 @pytest.fixture
-def node_0():
-    node = Node(8000, 6000, None, 0)
+def cluster():
+    # Node 3 joins through node 2, the others through node 0
+    with Cluster(4, parents=[None, 0, 0, 2]) as cluster:
+        yield cluster
 
-    thread = threading.Thread(target=node.run, daemon=True)
-    thread.start()
-    return node
 
-
-@pytest.fixture
-def node_1():
-    node = Node(8001, 7001, "127.0.0.1:6000", 0)
-    time.sleep(0.2)
-
-    thread = threading.Thread(target=node.run, daemon=True)
-    thread.start()
-    return node
-
-
-@pytest.fixture
-def node_2():
-    node = Node(8002, 7002, "127.0.0.1:6000", 0)
-    time.sleep(0.2)
-
-    thread = threading.Thread(target=node.run, daemon=True)
-    thread.start()
-    return node
-
-
-@pytest.fixture
-def node_3():
-    node = Node(8003, 7003, "127.0.0.1:7002", 0)
-    time.sleep(0.2)
-
-    thread = threading.Thread(target=node.run, daemon=True)
-    thread.start()
-    return node
-
-
-def test(node_0, node_1, node_2, node_3):
+def test(cluster):
+    node_0, node_1, node_2, node_3 = cluster
     gen_sudoku = generate_sudoku(3)
 
     response = requests.post(
-        "http://localhost:8000/solve",
+        cluster.url(0, "/solve"),
         json={"sudoku": gen_sudoku.grid},
     )
 
@@ -65,6 +37,14 @@ def test(node_0, node_1, node_2, node_3):
     print(node_2.p2p.neighbors)
     print(node_3.p2p.neighbors)
 
+    # Stats reach the other nodes with SudokuSolved, possibly after the response
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and any(
+        node.p2p.solved != 1 or node.p2p.validations_counter.value != 3
+        for node in cluster
+    ):
+        time.sleep(0.05)
+
     # Assert solved count
     assert node_0.p2p.solved == 1
     assert node_1.p2p.solved == 1
@@ -76,3 +56,16 @@ def test(node_0, node_1, node_2, node_3):
         stats = requests.get(f"http://localhost:{node.http_port}/stats")
         assert stats.status_code == 200
         assert stats.json()["all"] == {"solved": 1, "validations": 3}
+
+
+def test_stuck_square_ends_its_job():
+    # The top-left cell has no candidates: 2 and 3 are in its row, 4 and 1 in its column
+    grid = [[0, 0, 2, 3], [0, 0, 0, 0], [4, 0, 0, 0], [1, 0, 0, 0]]
+    with Cluster(1) as cluster:
+        p2p = cluster[0].p2p
+        state = PuzzleState("stuck", Sudoku(copy.deepcopy(grid)), p2p.address, grid)
+        p2p.sudokus[state.id] = state
+
+        assert p2p.do_job(state, 0, Engine.RANDOM, p2p.address)
+        assert state.status(0) == JobStatus.COMPLETED
+        assert state.sudoku.grid == grid  # Given up, as it was
@@ -0,0 +1,90 @@
+import random
+
+from cluster import Cluster
+from consts import Engine, JobStatus
+from gen import generate_unique_sudoku
+from p2p import OFFER_FANOUT
+from protocol import WorkBatch
+from puzzle import PuzzleState
+from sim import Simulation
+from sudoku import Sudoku
+from tests.helpers import wait_until
+
+
+def waiting_puzzle(p2p) -> tuple[PuzzleState, list[int]]:
+    """A puzzle node 0 splits in squares, but doesn't push to anyone, so its jobs can only be stolen."""
+    grid = generate_unique_sudoku(76, random.Random(0))
+    state = PuzzleState("stolen", Sudoku([row[:] for row in grid]), p2p.address, grid)
+    p2p.sudokus[state.id] = state
+    jobs = p2p.waiting_jobs(state.id)
+    p2p.dispatching[state.id] = Engine.DLX
+    return state, jobs
+
+
+def test_idle_node_steals_waiting_jobs():
+    with Cluster(2) as cluster:
+        coordinator, thief = cluster[0].p2p, cluster[1].p2p
+        state, jobs = waiting_puzzle(coordinator)
+        assert jobs
+
+        assert wait_until(
+            lambda: all(state.status(job) == JobStatus.COMPLETED for job in jobs)
+        )
+        assert state.sudoku.is_solved()
+        assert coordinator.stealing_stats()["stolen"] == len(jobs)
+        assert thief.stealing_stats()["taken"] == len(jobs)
+        assert not coordinator.leases
+
+
+def test_expired_leases_give_jobs_back():
+    with Cluster(2, handicaps=[0, 2000], engine=Engine.DLX) as cluster:
+        coordinator = cluster[0].p2p
+        coordinator.lease_time = 0.1
+        state, _ = waiting_puzzle(coordinator)
+
+        assert wait_until(lambda: coordinator.leases_expired > 0)
+        assert any(state.status(job) != JobStatus.COMPLETED for job in range(9))
+
+
+def test_waiting_jobs_are_offered_to_a_few_neighbors():
+    with Cluster(OFFER_FANOUT + 3) as cluster:
+        coordinator = cluster[0].p2p
+        others = [node.p2p for node in cluster][1:]
+        state, jobs = waiting_puzzle(coordinator)
+
+        assert wait_until(
+            lambda: all(state.status(job) == JobStatus.COMPLETED for job in jobs)
+        )
+        told = [p2p for p2p in others if coordinator.address in p2p.loads]
+        assert 0 < len(told) <= OFFER_FANOUT
+        # Those told of the jobs hear that none are left
+        assert wait_until(
+            lambda: all(p2p.loads[coordinator.address] == 0 for p2p in told)
+        )
+
+
+def test_busy_nodes_do_not_steal_jobs_of_their_puzzle():
+    # A steal used to send node 1 the puzzle's newer grid, cancelling the job it was pushed,
+    # which stayed in progress on the coordinator and held the request until it timed out
+    for seed in range(3):
+        simulation = Simulation(2, handicaps=[5, 20], seed=seed, engine=Engine.RANDOM)
+        for node in simulation.nodes:
+            node.batch_size = 1
+        puzzle = generate_unique_sudoku(30, random.Random(seed))
+        result = simulation.run([puzzle], concurrency=1, requests=1, max_time=60)
+        assert result["results"]["statuses"] == {"200": 1}
+
+
+def test_cancelled_jobs_go_back_to_the_coordinator():
+    with Cluster(1) as cluster:
+        p2p = cluster[0].p2p
+        state, jobs = waiting_puzzle(p2p)
+        p2p.dispatching.pop(state.id)  # Not stolen meanwhile
+        assert state.claim_job(jobs[0], p2p.address)
+        p2p.do_job = lambda *args: False  # As if newer work replaced the grid
+
+        batch = WorkBatch(
+            {state.id: (state.sudoku, state.jobs(), Engine.DLX)}, [(state.id, jobs[0])]
+        )
+        p2p.handle_work_batch(p2p.socket, batch, self_call=True)
+        assert state.status(jobs[0]) == JobStatus.PENDING
@@ -0,0 +1,57 @@
+import random
+
+import numpy as np
+import requests
+
+from cluster import Cluster
+from gen import generate_unique_sudoku
+from solver import solve
+from sudoku import Sudoku
+from validate import validate_batch
+
+
+def test_validate_batch():
+    rng = random.Random(7)
+    grids = [solve(generate_unique_sudoku(40, rng)) for _ in range(20)]
+    broken = [[row[:] for row in grid] for grid in grids[:10]]
+    for grid in broken:
+        grid[0][0], grid[0][1] = grid[0][1], grid[0][1]
+    broken[1][4][4] = 0
+    broken[2] = [row[1:] + row[:1] for row in grids[2]]  # Rows still valid
+
+    valid = validate_batch(grids + broken)
+
+    assert valid.tolist() == [Sudoku(g).check(base_delay=0) for g in grids + broken]
+    assert valid[:20].all() and not valid[20:].any()
+
+
+def test_validate_empty_batch():
+    assert validate_batch(np.zeros((0, 9, 9), dtype=np.int64)).shape == (0,)
+
+
+def test_validate_batch_sizes():
+    for box in (2, 4, 5):
+        grid = solve([[0] * box**2 for _ in range(box**2)])
+        broken = [row[:] for row in grid]
+        broken[0][0], broken[1][0] = broken[1][0], broken[0][0]
+
+        assert validate_batch([grid, broken]).tolist() == [True, False]
+
+
+def test_malformed_batches_are_rejected():
+    grid = solve(generate_unique_sudoku(40, random.Random(0)))
+    with Cluster(1) as cluster:
+        url = cluster.url(0, "/validate/batch")
+        for body in (
+            {},
+            {"sudokus": 5},
+            {"sudokus": [5]},
+            {"sudokus": [[[1.5]]]},
+            {"sudokus": [[["1"]]]},
+            {"sudokus": [grid, [row[:4] for row in grid[:4]]]},
+            [grid],
+        ):
+            assert requests.post(url, json=body).status_code == 400, body
+
+        response = requests.post(url, json={"sudokus": [grid]})
+        assert response.json() == {"valid": [True], "invalid": 0}
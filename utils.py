@@ -1,12 +1,17 @@
+import socket
+from math import isqrt
+from typing import Optional
+
 from custom_types import Address
 
 
 def subdivide_board(board):
-    """Divide the board into 3x3 squares."""
+    """Divide the board into its squares (3x3 for a 9x9 board)."""
+    box = isqrt(len(board))
     squares = []
-    for i in range(0, 9, 3):
-        for j in range(0, 9, 3):
-            square = [row[j : j + 3] for row in board[i : i + 3]]
+    for i in range(0, len(board), box):
+        for j in range(0, len(board), box):
+            square = [row[j : j + box] for row in board[i : i + box]]
             squares.append(square)
     return squares
 
@@ -18,5 +23,20 @@ class AddressUtils:
 
     @classmethod
     def str_to_address(cls, address: str) -> Address:
-        (addr, port) = address.split(":")
+        addr, port = address.split(":")
         return addr, int(port)
+
+    @classmethod
+    def local_ip(cls, peer: Optional[str] = None) -> str:
+        """
+        IP address of the interface used to reach the peer (or the default route),
+        found by connecting a UDP socket, which sends nothing and doesn't block on DNS.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect((peer or "10.255.255.255", 1))
+            return sock.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+        finally:
+            sock.close()
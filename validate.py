@@ -0,0 +1,54 @@
+from math import isqrt
+from typing import Iterable
+
+import numpy as np
+
+from custom_types import sudoku_type
+
+
+def to_array(grids: Iterable[sudoku_type]) -> np.ndarray:
+    """
+    Load grids into an (N, 9, 9) array, raising ValueError if they are not all square grids of ints
+    of the same size, with a square side (e.g. 4, 9 or 16).
+    """
+    try:
+        array = np.asarray(list(grids))
+    except TypeError:
+        raise ValueError(f"Expected a batch of grids, got {type(grids).__name__}")
+    if array.ndim != 3 or array.shape[1] != array.shape[2]:
+        raise ValueError(f"Expected a batch of square grids, got shape {array.shape}")
+    if array.dtype.kind != "i":
+        # Floats, booleans, strings, or ints too large for int64 (kept as objects)
+        raise ValueError(f"Expected grids of ints, got {array.dtype}")
+    if isqrt(array.shape[1]) ** 2 != array.shape[1]:
+        raise ValueError(f"Expected grids with a square side, got {array.shape[1]}")
+    return array.astype(np.int64, copy=False)
+
+
+def validate_batch(grids: Iterable[sudoku_type] | np.ndarray) -> np.ndarray:
+    """
+    Check many solved grids at once, with the same rules as ``Sudoku.check``.
+
+    Each cell becomes a one-hot bitmask, and a row, column or square is valid
+    when OR-ing its cells sets all bits: with as many cells as digits,
+    that can only happen if every digit appears exactly once.
+
+    :param grids: Grids to validate, or an (N, 9, 9) array of them.
+    :return: Boolean array with one entry per grid.
+    """
+    array = grids if isinstance(grids, np.ndarray) else to_array(grids)
+    count, size = array.shape[0], array.shape[1]
+    box = isqrt(size)
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+
+    in_range = ((array >= 1) & (array <= size)).all(axis=(1, 2))
+    bits = np.left_shift(1, np.clip(array, 1, size) - 1)
+    full = (1 << size) - 1
+
+    rows = (np.bitwise_or.reduce(bits, axis=2) == full).all(axis=1)
+    cols = (np.bitwise_or.reduce(bits, axis=1) == full).all(axis=1)
+    squares = bits.reshape(count, box, box, box, box)
+    squares = (np.bitwise_or.reduce(squares, axis=(2, 4)) == full).all(axis=(1, 2))
+
+    return in_range & rows & cols & squares